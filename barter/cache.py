@@ -0,0 +1,406 @@
+"""
+Keš backend-i sa brojanjem pogodaka i promašaja (barter_cache_requests_total).
+
+TwoTierCache je podrazumevani keš: ograničen LRU u procesu (L1) ispred keša
+deljenog među worker-ima (L2, fajl keš ili Redis), sa objavom invalidacija
+i single-flight izračunavanjem promašaja.
+"""
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager, suppress
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+from .metrics import registry
+
+_MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    """Broji pogotke/promašaje za get i get_many; labela je METRICS_NAME iz CACHES"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        params = args[-1] if args else kwargs.get('params', {})
+        self.metrics_name = params.get('METRICS_NAME', 'default')
+
+    def _count(self, hits, misses):
+        if hits:
+            registry.inc('barter_cache_requests_total', hits, cache=self.metrics_name, result='hit')
+        if misses:
+            registry.inc('barter_cache_requests_total', misses, cache=self.metrics_name, result='miss')
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count(0, 1)
+            return default
+        self._count(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version=version)
+        self._count(len(found), len(keys) - len(found))
+        return found
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+
+class InstrumentedFileBasedCache(InstrumentedCacheMixin, FileBasedCache):
+    """
+    Fajl keš sa atomskim add i incr među procesima (zakup single-flight-a,
+    dedup ključevi, dnevnik invalidacije L1 i brojevi kataloga).
+
+    Obe operacije drže zaključavanje ključa - fajl .lock napravljen sa O_EXCL,
+    sa tokenom vlasnika; uklanja se samo zaključavanje čiji se token poklapa.
+    """
+
+    LOCK_TIMEOUT = 30
+    LOCK_POLL = 0.005
+
+    @contextmanager
+    def _key_lock(self, key, version=None):
+        lock = self._key_to_file(key, version) + '.lock'
+        token = uuid.uuid4().hex.encode()
+        self._createdir()
+        while True:
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                # Zaključavanje procesa koji je pao ne blokira ključ zauvek
+                try:
+                    if time.time() - os.path.getmtime(lock) > self.LOCK_TIMEOUT:
+                        self._release_lock(lock, self._lock_owner(lock))
+                except OSError:
+                    pass
+                time.sleep(self.LOCK_POLL)
+        try:
+            os.write(fd, token)
+            os.close(fd)
+            yield
+        finally:
+            self._release_lock(lock, token)
+
+    @staticmethod
+    def _lock_owner(lock):
+        with open(lock, 'rb') as f:
+            return f.read()
+
+    def _release_lock(self, lock, token):
+        """Ukloni zaključavanje samo ako ga i dalje drži vlasnik sa datim tokenom"""
+        with suppress(FileNotFoundError):
+            if self._lock_owner(lock) == token:
+                os.remove(lock)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._key_lock(key, version):
+            if self.has_key(key, version=version):
+                return False
+            self.set(key, value, timeout, version=version)
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        with self._key_lock(key, version):
+            value = FileBasedCache.get(self, key, _MISSING, version=version)
+            if value is _MISSING:
+                raise ValueError("Key '%s' not found" % key)
+            value += delta
+            self.set(key, value, self._remaining(key, version), version=version)
+            return value
+
+    def _remaining(self, key, version):
+        """Preostalo vreme ključa, da incr ne produži ni skrati rok"""
+        try:
+            with open(self._key_to_file(key, version), 'rb') as f:
+                expires_at = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return DEFAULT_TIMEOUT
+        return None if expires_at is None else expires_at - time.time()
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    pass
+
+
+class TwoTierBackend(BaseCache):
+    """
+    L1 LRU keš u procesu ispred deljenog L2 keša (alias OPTIONS['SHARED']).
+
+    L1 čuva najviše L1_MAX_ENTRIES vrednosti (pickle, kao LocMemCache) do
+    L1_TIMEOUT sekundi. Svaki upis, brisanje i incr idu u L2 i objavljuju se
+    u dnevniku invalidacije u L2 (brojač __l1:seq i ključevi __l1:log:N);
+    ostali procesi najviše jednom u SYNC_INTERVAL sekundi čitaju brojač i
+    izbacuju iz L1 objavljene ključeve, a ako je dnevnik nepotpun - ceo L1.
+
+    single_flight(key) i get_or_set() obezbeđuju da promašaj računa samo
+    jedan pozivalac po ključu: unutar procesa preko zaključavanja, između
+    procesa preko zakupa (add) u L2 koji ostali čekaju do FLIGHT_TIMEOUT.
+    """
+
+    SEQ_KEY = '__l1:seq'
+    LOG_TIMEOUT = 300
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.l1_max_entries = options.get('L1_MAX_ENTRIES', 1000)
+        self.l1_timeout = options.get('L1_TIMEOUT', 60)
+        self.sync_interval = options.get('SYNC_INTERVAL', 1.0)
+        self.log_limit = options.get('LOG_LIMIT', 1000)
+        self.flight_timeout = options.get('FLIGHT_TIMEOUT', 10)
+        self.flight_poll = options.get('FLIGHT_POLL', 0.05)
+        self.tier_metrics_name = params.get('METRICS_NAME', 'default')
+
+        self._l1 = OrderedDict()
+        self._lock = threading.RLock()
+        self._flights = {}
+        self._seq = None
+        self._synced_at = 0
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    # ---------- L1 ----------
+
+    def _l1_get(self, full_key):
+        with self._lock:
+            item = self._l1.get(full_key)
+            if item is None:
+                return _MISSING
+            expires_at, data = item
+            if expires_at <= time.monotonic():
+                del self._l1[full_key]
+                return _MISSING
+            self._l1.move_to_end(full_key)
+        return pickle.loads(data)
+
+    def _l1_set(self, full_key, value, timeout=DEFAULT_TIMEOUT):
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        ttl = self.l1_timeout if timeout is None else min(timeout, self.l1_timeout)
+        if ttl <= 0:
+            self._l1_drop([full_key])
+            return
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._l1[full_key] = (time.monotonic() + ttl, data)
+            self._l1.move_to_end(full_key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_drop(self, full_keys):
+        with self._lock:
+            for full_key in full_keys:
+                self._l1.pop(full_key, None)
+
+    def _l1_count(self, hits, misses):
+        if hits:
+            registry.inc('barter_cache_l1_requests_total', hits, cache=self.tier_metrics_name, result='hit')
+        if misses:
+            registry.inc('barter_cache_l1_requests_total', misses, cache=self.tier_metrics_name, result='miss')
+
+    # ---------- invalidacija ----------
+
+    def _publish(self, full_keys):
+        """Objavi ostalim procesima ključeve koje treba izbaciti iz L1"""
+        if not full_keys:
+            return
+        try:
+            seq = self.shared.incr(self.SEQ_KEY, len(full_keys))
+        except ValueError:
+            self.shared.add(self.SEQ_KEY, 0, None)
+            seq = self.shared.incr(self.SEQ_KEY, len(full_keys))
+        first = seq - len(full_keys) + 1
+        self.shared.set_many(
+            {f'__l1:log:{first + i}': full_key for i, full_key in enumerate(full_keys)},
+            self.LOG_TIMEOUT,
+        )
+        with self._lock:
+            if self._seq is not None and self._seq == first - 1:
+                self._seq = seq
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = now
+        seq = self.shared.get(self.SEQ_KEY)
+        with self._lock:
+            previous, self._seq = self._seq, seq
+        if seq == previous:
+            return
+        if previous is None or seq is None or seq < previous or seq - previous > self.log_limit:
+            with self._lock:
+                self._l1.clear()
+            return
+        log = self.shared.get_many([f'__l1:log:{n}' for n in range(previous + 1, seq + 1)])
+        if len(log) < seq - previous:
+            with self._lock:
+                self._l1.clear()
+        else:
+            self._l1_drop(log.values())
+
+    # ---------- Django cache API ----------
+
+    def _lookup(self, key, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        self._sync()
+        value = self._l1_get(full_key)
+        if value is not _MISSING:
+            self._l1_count(1, 0)
+            return value
+        self._l1_count(0, 1)
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            self._l1_set(full_key, value)
+        return value
+
+    def get(self, key, default=None, version=None):
+        value = self._lookup(key, version)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        full_keys = {key: self.make_and_validate_key(key, version=version) for key in keys}
+        found, missing = {}, []
+        for key, full_key in full_keys.items():
+            value = self._l1_get(full_key)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        self._l1_count(len(found), len(missing))
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            for key, value in shared.items():
+                self._l1_set(full_keys[key], value)
+            found.update(shared)
+        return found
+
+    def has_key(self, key, version=None):
+        return self._lookup(key, version) is not _MISSING
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        self.shared.set(key, value, self._shared_timeout(timeout), version=version)
+        self._publish([full_key])
+        self._l1_set(full_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        if not self.shared.add(key, value, self._shared_timeout(timeout), version=version):
+            return False
+        self._publish([full_key])
+        self._l1_set(full_key, value, timeout)
+        return True
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        full_keys = {key: self.make_and_validate_key(key, version=version) for key in data}
+        failed = self.shared.set_many(data, self._shared_timeout(timeout), version=version)
+        self._publish(list(full_keys.values()))
+        for key, value in data.items():
+            if key not in failed:
+                self._l1_set(full_keys[key], value, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, self._shared_timeout(timeout), version=version)
+
+    def incr(self, key, delta=1, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        self._l1_drop([full_key])
+        value = self.shared.incr(key, delta, version=version)
+        self._publish([full_key])
+        return value
+
+    def delete(self, key, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        self._l1_drop([full_key])
+        deleted = self.shared.delete(key, version=version)
+        self._publish([full_key])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        full_keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        self._l1_drop(full_keys)
+        deleted = self.shared.delete_many(keys, version=version)
+        self._publish(full_keys)
+        return deleted
+
+    def clear(self):
+        with self._lock:
+            self._l1.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def _shared_timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    # ---------- single-flight ----------
+
+    @contextmanager
+    def single_flight(self, key, version=None):
+        """Samo jedan pozivalac po ključu (u procesu i među procesima) ulazi u blok"""
+        full_key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            lock, waiters = self._flights.get(full_key, (threading.Lock(), 0))
+            self._flights[full_key] = (lock, waiters + 1)
+        try:
+            with lock:
+                lease = f'__flight:{full_key}'
+                deadline = time.monotonic() + self.flight_timeout
+                leader = self.shared.add(lease, 1, self.flight_timeout)
+                if not leader:
+                    registry.inc('barter_cache_single_flight_total', cache=self.tier_metrics_name, result='wait')
+                    # Drugi proces računa vrednost - čekaj da je upiše ili da zakup istekne
+                    while time.monotonic() < deadline and self.shared.has_key(lease):
+                        if self.shared.has_key(key, version=version):
+                            break
+                        time.sleep(self.flight_poll)
+                try:
+                    yield
+                finally:
+                    if leader:
+                        self.shared.delete(lease)
+        finally:
+            with self._lock:
+                lock, waiters = self._flights[full_key]
+                if waiters == 1:
+                    del self._flights[full_key]
+                else:
+                    self._flights[full_key] = (lock, waiters - 1)
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        value = self.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            return value
+        with self.single_flight(key, version=version):
+            value = self._lookup(key, version)
+            if value is _MISSING:
+                registry.inc('barter_cache_single_flight_total', cache=self.tier_metrics_name, result='compute')
+                value = default() if callable(default) else default
+                self.set(key, value, timeout, version=version)
+        return value
+
+
+class TwoTierCache(InstrumentedCacheMixin, TwoTierBackend):
+    pass
+
+
+registry.counter('barter_cache_l1_requests_total', 'Pogoci/promašaji L1 keša u procesu', ('cache', 'result'))
+registry.counter('barter_cache_single_flight_total', 'Single-flight: izračunavanja i čekanja na tuđe', ('cache', 'result'))
@@ -0,0 +1,162 @@
+"""
+Merenje SQL upita po request-u.
+
+QueryRecorder se kači na konekcije preko connection.execute_wrapper i beleži
+broj upita, ukupno vreme u bazi, duplikate (isti SQL sa istim parametrima) i
+N+1 obrasce (isti "otisak" SQL-a ponovljen više puta sa različitim
+parametrima). Koriste ga QueryInstrumentationMiddleware (barter/middleware.py)
+i test helperi u barter/testing.py.
+"""
+import os
+import re
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+N_PLUS_ONE_THRESHOLD = 5
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fingerprint(sql):
+    """SQL bez konkretnih vrednosti - isti upit sa drugim parametrima daje isti otisak"""
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+def _origin():
+    """Prva linija koda projekta (van biblioteka) koja je pokrenula upit"""
+    for frame in reversed(traceback.extract_stack()[:-3]):
+        filename = frame.filename
+        if filename.startswith(_PROJECT_ROOT) and 'site-packages' not in filename \
+                and not filename.endswith('instrumentation.py'):
+            return f'{os.path.relpath(filename, _PROJECT_ROOT)}:{frame.lineno} ({frame.name})'
+    return None
+
+
+class QueryRecorder:
+    """Wrapper za connection.execute_wrapper; skuplja statistiku upita"""
+
+    def __init__(self, n_plus_one_threshold=N_PLUS_ONE_THRESHOLD):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.exact = Counter()
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, params, time.perf_counter() - start)
+
+    def record(self, sql, params, duration):
+        self.count += 1
+        self.duration += duration
+        key = fingerprint(sql)
+        self.fingerprints[key] += 1
+        self.exact[(sql, repr(params))] += 1
+        if self.fingerprints[key] == self.n_plus_one_threshold:
+            self.origins[key] = _origin()
+
+    @property
+    def duplicates(self):
+        """Broj suvišnih izvršavanja potpuno istog upita"""
+        return sum(count - 1 for count in self.exact.values() if count > 1)
+
+    @property
+    def n_plus_one(self):
+        """[(otisak, broj, poreklo)] za upite ponovljene bar n_plus_one_threshold puta"""
+        return [
+            (key, count, self.origins.get(key))
+            for key, count in self.fingerprints.most_common()
+            if count >= self.n_plus_one_threshold
+        ]
+
+    def summary(self):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.duration * 1000, 2),
+            'duplicates': self.duplicates,
+            'n_plus_one': [
+                {'sql': key[:300], 'count': count, 'origin': origin}
+                for key, count, origin in self.n_plus_one
+            ],
+        }
+
+
+@contextmanager
+def record_queries(recorder=None, using=None):
+    """Snimaj upite na svim (ili datim) konekcijama u trenutnoj niti"""
+    recorder = recorder or QueryRecorder()
+    aliases = [using] if using else list(connections)
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
+
+
+class QueryProfile:
+    """Zbirna statistika po imenu URL-a za ovaj proces"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(lambda: {
+            'requests': 0, 'queries': 0, 'db_seconds': 0.0, 'duplicates': 0,
+            'over_budget': 0, 'n_plus_one': Counter(),
+        })
+
+    def add(self, route, recorder, budget=None):
+        with self._lock:
+            stats = self._routes[route]
+            stats['requests'] += 1
+            stats['queries'] += recorder.count
+            stats['db_seconds'] += recorder.duration
+            stats['duplicates'] += recorder.duplicates
+            if budget is not None and recorder.count > budget:
+                stats['over_budget'] += 1
+            for key, count, _ in recorder.n_plus_one:
+                stats['n_plus_one'][key] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                route: {**stats, 'n_plus_one': dict(stats['n_plus_one'])}
+                for route, stats in self._routes.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+query_profile = QueryProfile()
+
+
+def query_budget(max_queries):
+    """Deklariši najveći dozvoljen broj upita za view (proverava ga middleware i testovi)"""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def get_query_budget(view):
+    while view is not None:
+        if hasattr(view, 'query_budget'):
+            return view.query_budget
+        view = getattr(view, '__wrapped__', None)
+    return None
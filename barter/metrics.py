@@ -0,0 +1,229 @@
+"""
+Registar metrika u Prometheus tekstualnom formatu.
+
+Svaki proces (gunicorn worker) drži svoje brojače i histograme u memoriji i
+periodično (METRICS_FLUSH_INTERVAL) ih upisuje u METRICS_DIR/<pid>.json.
+/metrics sabira fajlove svih worker-a sa sopstvenim živim stanjem, pa se
+dobija zbir bez obzira koji worker odgovori. Gauge vrednosti (veličine
+pozadinskih redova) se čitaju u trenutku upisa i uzimaju se samo od živih
+procesa; zajednički gauge-i (npr. broj poslova u bazi) čitaju se samo pri
+prikazu i ne sabiraju se. Bez METRICS_DIR registar radi samo za trenutni proces.
+"""
+import atexit
+import glob
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    def __init__(self, name, kind, help, labels=(), buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets or DEFAULT_BUCKETS) if kind == 'histogram' else None
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._values = {}
+        self._gauges = {}
+        self._shared_gauges = {}
+        self._last_dump = 0.0
+
+    # ---------- definicije ----------
+
+    def counter(self, name, help, labels=()):
+        return self._define(Metric(name, 'counter', help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=None):
+        return self._define(Metric(name, 'histogram', help, labels, buckets))
+
+    def gauge(self, name, help, callback, shared=False):
+        """
+        Gauge čija se vrednost čita pozivom callback-a pri upisu/prikazu.
+        shared=True: vrednost je ista za sve procese, čita je samo proces koji prikazuje.
+        """
+        self._define(Metric(name, 'gauge', help))
+        (self._shared_gauges if shared else self._gauges)[name] = callback
+
+    def _define(self, metric):
+        self._metrics.setdefault(metric.name, metric)
+        return self._metrics[metric.name]
+
+    # ---------- beleženje ----------
+
+    def _key(self, name, labels):
+        metric = self._metrics[name]
+        return name, tuple(str(labels.get(label, '')) for label in metric.labels)
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+        self._maybe_dump()
+
+    def observe(self, name, value, **labels):
+        metric = self._metrics[name]
+        key = self._key(name, labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(metric.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(metric.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+        self._maybe_dump()
+
+    # ---------- više procesa ----------
+
+    def snapshot(self):
+        with self._lock:
+            values = json.loads(json.dumps(
+                [[name, list(labels), value] for (name, labels), value in self._values.items()]
+            ))
+        gauges = {name: _read(callback) for name, callback in self._gauges.items()}
+        return {'pid': os.getpid(), 'values': values, 'gauges': gauges}
+
+    def _directory(self):
+        return getattr(settings, 'METRICS_DIR', '')
+
+    def _maybe_dump(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+        if self._directory() and time.monotonic() - self._last_dump >= interval:
+            self.dump()
+
+    def dump(self):
+        """Upiši stanje procesa u METRICS_DIR (atomski, preko privremenog fajla)"""
+        directory = self._directory()
+        if not directory:
+            return
+        self._last_dump = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, os.path.join(directory, f'{os.getpid()}.json'))
+
+    def _collect(self):
+        snapshots = [self.snapshot()]
+        directory = self._directory()
+        if directory:
+            for path in glob.glob(os.path.join(directory, '*.json')):
+                try:
+                    with open(path) as f:
+                        snapshot = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if snapshot['pid'] != os.getpid():
+                    snapshot['alive'] = _pid_alive(snapshot['pid'])
+                    snapshots.append(snapshot)
+
+        values, gauges = {}, {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['values']:
+                if name not in self._metrics:
+                    continue
+                key = (name, tuple(labels))
+                if isinstance(value, dict):
+                    merged = values.setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0.0, 'count': 0})
+                    merged['buckets'] = [a + b for a, b in zip(merged['buckets'], value['buckets'])]
+                    merged['sum'] += value['sum']
+                    merged['count'] += value['count']
+                else:
+                    values[key] = values.get(key, 0) + value
+            if snapshot.get('alive', True):
+                for name, value in snapshot['gauges'].items():
+                    gauges[name] = gauges.get(name, 0) + value
+        for name, callback in self._shared_gauges.items():
+            gauges[name] = _read(callback)
+        return values, gauges
+
+    # ---------- prikaz ----------
+
+    def render(self):
+        """Sve metrike u Prometheus text exposition formatu"""
+        values, gauges = self._collect()
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            if metric.kind == 'gauge':
+                if metric.name in gauges:
+                    lines.append(f'{metric.name} {_number(gauges[metric.name])}')
+                continue
+            for (name, labels), value in sorted(values.items()):
+                if name != metric.name:
+                    continue
+                pairs = list(zip(metric.labels, labels))
+                if metric.kind == 'counter':
+                    lines.append(f'{name}{_labels(pairs)} {_number(value)}')
+                    continue
+                for bound, count in zip(metric.buckets, value['buckets']):
+                    lines.append(f'{name}_bucket{_labels(pairs + [("le", _number(bound))])} {count}')
+                lines.append(f'{name}_bucket{_labels(pairs + [("le", "+Inf")])} {value["count"]}')
+                lines.append(f'{name}_sum{_labels(pairs)} {_number(value["sum"])}')
+                lines.append(f'{name}_count{_labels(pairs)} {value["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _read(callback):
+    try:
+        return float(callback())
+    except Exception:
+        return math.nan
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _number(value):
+    if isinstance(value, float) and math.isnan(value):
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+registry = Registry()
+atexit.register(registry.dump)
+
+registry.counter('barter_http_requests_total', 'Broj obrađenih HTTP zahteva', ('route', 'method', 'status'))
+registry.histogram('barter_http_request_duration_seconds', 'Trajanje HTTP zahteva', ('route',))
+registry.counter('barter_db_queries_total', 'Broj SQL upita', ('route',))
+registry.counter('barter_db_duration_seconds_total', 'Ukupno vreme u bazi', ('route',))
+registry.counter('barter_cache_requests_total', 'Čitanja iz keša po ishodu', ('cache', 'result'))
+
+
+def clear_directory():
+    """Obriši snimke prethodnog pokretanja (gunicorn on_starting)"""
+    directory = getattr(settings, 'METRICS_DIR', '')
+    for path in glob.glob(os.path.join(directory, '*.json')) if directory else ():
+        os.remove(path)
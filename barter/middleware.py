@@ -1,9 +1,21 @@
+import json
 import logging
+import random
+import time
 import traceback
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import empty
+
+from .metrics import registry
+from .instrumentation import (
+    N_PLUS_ONE_THRESHOLD, QueryRecorder, get_query_budget, query_profile, record_queries,
+)
 
 logger = logging.getLogger('oauth_debug')
 allauth_logger = logging.getLogger('allauth')
+sql_logger = logging.getLogger('barter.sql')
 
 class OAuthDebugMiddleware(MiddlewareMixin):
     def process_exception(self, request, exception):
@@ -26,3 +38,98 @@ class OAuthDebugMiddleware(MiddlewareMixin):
         if 'google' in request.path and 'callback' in request.path:
             logger.debug(f"🟢 Callback Response: {response.status_code}")
         return response
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Broj upita, vreme u bazi, duplikati i N+1 obrasci po request-u.
+
+    Rezultat ide u Server-Timing header (SQL_SERVER_TIMING ili staff korisnik),
+    u zbirnu statistiku po imenu URL-a (instrumentation.query_profile) i u
+    strukturisani log 'barter.sql' - uzorkovano (SQL_LOG_SAMPLE_RATE), a uvek
+    kada postoji N+1 obrazac ili je prekoračen budžet view-a (@query_budget).
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_INSTRUMENTATION', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'SQL_N_PLUS_ONE_THRESHOLD', N_PLUS_ONE_THRESHOLD)
+        self.sample_rate = getattr(settings, 'SQL_LOG_SAMPLE_RATE', 0.0)
+        self.server_timing = getattr(settings, 'SQL_SERVER_TIMING', False)
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with record_queries(QueryRecorder(self.threshold)) as recorder:
+            request.query_recorder = recorder
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unresolved'
+        budget = get_query_budget(match.func) if match else None
+        query_profile.add(route, recorder, budget)
+
+        if self.server_timing or self.staff(request):
+            response['Server-Timing'] = self.server_timing_header(recorder, total)
+        self.log(request, response, route, recorder, total, budget)
+        return response
+
+    @staticmethod
+    def staff(request):
+        """Staff korisnik, samo ako ga je view već učitao - merenje ne sme da doda upite sesije"""
+        user = getattr(request, 'user', None)
+        if user is None or getattr(user, '_wrapped', None) is empty:
+            return False
+        return user.is_staff
+
+    @staticmethod
+    def server_timing_header(recorder, total):
+        metrics = [
+            f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries"',
+            f'app;dur={total * 1000:.2f}',
+        ]
+        if recorder.duplicates:
+            metrics.append(f'dup;desc="{recorder.duplicates} duplicate queries"')
+        if recorder.n_plus_one:
+            metrics.append(f'nplusone;desc="{len(recorder.n_plus_one)} N+1 patterns"')
+        return ', '.join(metrics)
+
+    def log(self, request, response, route, recorder, total, budget):
+        over_budget = budget is not None and recorder.count > budget
+        problem = over_budget or bool(recorder.n_plus_one)
+        if not problem and random.random() >= self.sample_rate:
+            return
+        record = {
+            'route': route,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'budget': budget,
+            **recorder.summary(),
+        }
+        sql_logger.log(logging.WARNING if problem else logging.INFO, json.dumps(record, ensure_ascii=False))
+
+
+class MetricsMiddleware:
+    """Trajanje, status i vreme u bazi po imenu URL-a za /metrics (barter/metrics.py)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unresolved'
+        registry.inc('barter_http_requests_total', route=route, method=request.method, status=response.status_code)
+        registry.observe('barter_http_request_duration_seconds', duration, route=route)
+
+        recorder = getattr(request, 'query_recorder', None)
+        if recorder is not None:
+            registry.inc('barter_db_queries_total', recorder.count, route=route)
+            registry.inc('barter_db_duration_seconds_total', recorder.duration, route=route)
+        return response
@@ -0,0 +1,177 @@
+"""
+Keš celih HTML odgovora, deljen među posetiocima.
+
+@cache_page čuva odgovor GET zahteva pod ključem od putanje i normalizovanog
+query string-a (sortirani parametri, bez praznih i utm_*/fbclid/gclid). View
+označava od čega stranica zavisi preko tag(request, 'offer:5', ...); uz
+odgovor se pamte trenutne verzije tih tagova, a purge('offer:5') posle
+commit-a briše verziju taga, pa se zastarele stranice više ne serviraju - i
+samo one.
+
+Sa PAGE_SHELL stranica se renderuje kao "ljuska" nezavisna od korisnika, a
+navbar, dugmad vlasnika i slično učitava /fragments/ jednim zahtevom, pa
+keširano telo dele i prijavljeni korisnici. Bez PAGE_SHELL keširaju se samo
+odgovori anonimnim posetiocima.
+
+Ne kešira se odgovor koji postavlja kolačiće, koristi CSRF token, troši
+flash poruke ili nije 200. Keširani odgovori dobijaju Cache-Control: public
+sa PAGE_CACHE_MAX_AGE, ostali odgovori prijavljenim korisnicima private;
+svi Vary: Cookie.
+"""
+import hashlib
+import time
+from contextlib import nullcontext
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from .metrics import registry
+
+IGNORED_PARAMS = ('utm_', 'fbclid', 'gclid')
+
+
+def normalized_query(request):
+    return urlencode(sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        for value in values
+        if value and not key.startswith(IGNORED_PARAMS)
+    ))
+
+
+def page_key(request):
+    url = f'{request.path}?{normalized_query(request)}'
+    return f'page:{hashlib.md5(url.encode()).hexdigest()}'
+
+
+def _tag_key(tag):
+    return f'page-tag:{tag}'
+
+
+def tag(request, *tags):
+    """Označi zavisnosti stranice; verzije tagova se čitaju odmah, pre rendera"""
+    keys = [_tag_key(name) for name in tags]
+    for key in keys:
+        cache.add(key, time.time_ns(), None)
+    versions = cache.get_many(keys)
+    request._page_cache_tags = {**getattr(request, '_page_cache_tags', {}), **versions}
+
+
+def purge(*tags):
+    """Poništi sve keširane stranice sa bilo kojim od tagova (posle commit-a)"""
+    keys = [_tag_key(name) for name in tags if name]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _fresh(entry):
+    return cache.get_many(list(entry['tags'])) == entry['tags']
+
+
+def _cacheable(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def _headers(response, public):
+    if public:
+        patch_cache_control(response, public=True, max_age=settings.PAGE_CACHE_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def _render(view, request, args, kwargs, shell):
+    """U shell režimu view vidi anonimnog korisnika - telo ne zavisi od sesije"""
+    if not shell:
+        return view(request, *args, **kwargs)
+    user = request.user
+    request.user = AnonymousUser()
+    request.page_shell = True
+    try:
+        return view(request, *args, **kwargs)
+    finally:
+        request.user = user
+
+
+def cache_page(name, on_request=None):
+    """
+    Keširaj odgovor view-a.
+
+    Bez PAGE_SHELL keširaju se samo odgovori anonimnim posetiocima. Sa
+    PAGE_SHELL view se renderuje kao za anonimnog posetioca (request.page_shell),
+    delove za prijavljenog korisnika template-i ostavljaju kao data-fragment
+    mesta koja popunjava /fragments/, pa isto telo dele svi korisnici.
+
+    on_request(request, *args, **kwargs) se poziva za svaki uspešan odgovor,
+    i iz keša, sa stvarnim korisnikom (npr. brojanje pregleda).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            shell = settings.PAGE_SHELL
+            if (
+                not settings.PAGE_CACHE_ENABLED
+                or request.method != 'GET'
+                or (not shell and request.user.is_authenticated)
+                or len(get_messages(request))
+            ):
+                response = _render(view, request, args, kwargs, shell)
+                if request.user.is_authenticated:
+                    _headers(response, public=False)
+            else:
+                response = _cached(name, view, request, args, kwargs, shell)
+            if on_request and response.status_code == 200:
+                on_request(request, *args, **kwargs)
+            return response
+        return wrapper
+    return decorator
+
+
+def _hit(name, key):
+    entry = cache.get(key)
+    if entry is None or not _fresh(entry):
+        return None
+    registry.inc('barter_page_cache_requests_total', view=name, result='hit')
+    response = entry['response']
+    response['X-Page-Cache'] = 'HIT'
+    return response
+
+
+def _cached(name, view, request, args, kwargs, shell):
+    key = page_key(request)
+    response = _hit(name, key)
+    if response is not None:
+        return response
+
+    # Promašaj na popularnoj stranici renderuje samo jedan zahtev (TwoTierCache)
+    single_flight = getattr(cache, 'single_flight', None)
+    with single_flight(key) if single_flight else nullcontext():
+        response = _hit(name, key) if single_flight else None
+        if response is not None:
+            return response
+
+        registry.inc('barter_page_cache_requests_total', view=name, result='miss')
+        response = _render(view, request, args, kwargs, shell)
+        if _cacheable(request, response):
+            _headers(response, public=True)
+            cache.set(key, {
+                'tags': getattr(request, '_page_cache_tags', {}),
+                'response': response,
+            }, settings.PAGE_CACHE_TIMEOUT)
+    response['X-Page-Cache'] = 'MISS'
+    return response
+
+
+registry.counter('barter_page_cache_requests_total', 'Keš celih stranica po ishodu', ('view', 'result'))
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from decouple import config, Csv
 import dj_database_url
@@ -19,6 +20,7 @@ ALLOWED_HOSTS = [
     'web-production-07975.up.railway.app',    # Old Railway
     '*.railway.app',                           # Railway wildcard
     '*.onrender.com',                          # Render wildcard
+    'healthcheck.railway.app',                 # Railway healthcheck
     'localhost',
     '127.0.0.1'
 ]
@@ -55,6 +57,8 @@ SITE_ID = 1
 
 # MIDDLEWARE
 MIDDLEWARE = [
+    'barter.middleware.MetricsMiddleware',
+    'barter.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -86,8 +90,13 @@ TEMPLATES = [
     },
 ]
 
-# WSGI
+# WSGI / ASGI - produkcija ide preko ASGI-ja zbog SSE stream-a (core.views.unread_stream)
 WSGI_APPLICATION = 'barter_app.wsgi.application'
+ASGI_APPLICATION = 'barter.asgi.application'
+
+# PUSH EVENTS - broker za badge delte (core.events)
+EVENTS_BROKER = 'core.events.InProcessBroker'
+EVENTS_SYNC_INTERVAL = config('EVENTS_SYNC_INTERVAL', default=15, cast=int)  # sekunde, provera promena iz drugih procesa
 
 # DATABASE
 if os.getenv('DATABASE_URL'):
@@ -136,6 +145,79 @@ CLOUDINARY_STORAGE = {
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 MEDIA_URL = '/media/'
 
+# OFFER VIEW COUNTER - baferovani upis pregleda (core.view_counter)
+OFFER_VIEWS_FLUSH_INTERVAL = config('OFFER_VIEWS_FLUSH_INTERVAL', default=10, cast=int)
+OFFER_VIEWS_FLUSH_THRESHOLD = config('OFFER_VIEWS_FLUSH_THRESHOLD', default=100, cast=int)
+OFFER_VIEWS_DEDUP_WINDOW = config('OFFER_VIEWS_DEDUP_WINDOW', default=0, cast=int)  # 0 = bez deduplikacije
+
+# UNREAD COUNTERS - brojači na UserProfile-u, run_workers ih periodično usklađuje (core.counters)
+UNREAD_RECONCILE_INTERVAL = config('UNREAD_RECONCILE_INTERVAL', default=3600, cast=int)  # sekunde
+UNREAD_RECONCILE_BATCH_SIZE = config('UNREAD_RECONCILE_BATCH_SIZE', default=5000, cast=int)
+
+# TRADE RESERVATIONS - ponude prihvaćene razmene su zauzete dok se razmena ne završi (core.trades)
+TRADE_RESERVATION_HOURS = config('TRADE_RESERVATION_HOURS', default=72, cast=int)
+# Isticanje rezervacija pokreće run_workers; bez worker-a: cron "python manage.py expire_reservations"
+TRADE_RESERVATION_CHECK_INTERVAL = config('TRADE_RESERVATION_CHECK_INTERVAL', default=900, cast=int)  # sekunde
+
+# JOB QUEUE - poslovi u bazi, izvršava ih manage.py run_workers (core.jobs)
+# gunicorn (gunicorn.conf.py) uz web pokreće i run_workers, osim ako je JOBS_EMBEDDED_WORKER=False
+# (poseban worker proces/servis). Lokalno uz runserver: "python manage.py run_workers" ili JOBS_EAGER=True.
+JOBS_EAGER = config('JOBS_EAGER', default=False, cast=bool)  # True = izvrši posle commit-a u request-u
+JOBS_EMBEDDED_WORKER = config('JOBS_EMBEDDED_WORKER', default=True, cast=bool)
+JOBS_MAX_ATTEMPTS = config('JOBS_MAX_ATTEMPTS', default=5, cast=int)
+JOBS_LOCK_TIMEOUT = config('JOBS_LOCK_TIMEOUT', default=300, cast=int)
+NOTIFICATIONS_BATCH_SIZE = config('NOTIFICATIONS_BATCH_SIZE', default=500, cast=int)
+NOTIFICATIONS_COALESCE_WINDOW = config('NOTIFICATIONS_COALESCE_WINDOW', default=3600, cast=int)  # sekunde
+
+# RETENTION - dani čuvanja po politici, 0 = ne briše se (core.retention, manage.py purge_expired)
+RETENTION_NOTIFICATIONS_READ_DAYS = config('RETENTION_NOTIFICATIONS_READ_DAYS', default=90, cast=int)
+RETENTION_NOTIFICATIONS_UNREAD_DAYS = config('RETENTION_NOTIFICATIONS_UNREAD_DAYS', default=365, cast=int)
+RETENTION_NOTIFICATIONS_ACTIVITY_DAYS = config('RETENTION_NOTIFICATIONS_ACTIVITY_DAYS', default=30, cast=int)  # offer_viewed/liked
+RETENTION_MESSAGES_READ_DAYS = config('RETENTION_MESSAGES_READ_DAYS', default=365, cast=int)
+
+# SQL INSTRUMENTATION - broj/vreme upita, duplikati i N+1 po request-u (barter/middleware.py)
+SQL_INSTRUMENTATION = config('SQL_INSTRUMENTATION', default=True, cast=bool)
+SQL_SERVER_TIMING = config('SQL_SERVER_TIMING', default=DEBUG, cast=bool)
+SQL_LOG_SAMPLE_RATE = config('SQL_LOG_SAMPLE_RATE', default=0.01, cast=float)
+SQL_N_PLUS_ONE_THRESHOLD = config('SQL_N_PLUS_ONE_THRESHOLD', default=5, cast=int)
+
+# METRICS - /metrics, zbir svih gunicorn worker-a preko METRICS_DIR (barter/metrics.py)
+METRICS_DIR = config('METRICS_DIR', default=os.path.join(tempfile.gettempdir(), 'barter-metrics'))
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=int)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # /metrics traži Bearer token; bez njega radi samo uz DEBUG
+
+# CACHE - L1 LRU u procesu ispred keša deljenog među worker-ima (barter/cache.py)
+# L2 je Redis ako je CACHE_REDIS_URL postavljen, inače fajl keš na lokalnom disku
+CACHE_REDIS_URL = config('CACHE_REDIS_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'barter.cache.TwoTierCache',
+        'METRICS_NAME': 'default',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'L1_MAX_ENTRIES': config('CACHE_L1_MAX_ENTRIES', default=1000, cast=int),
+            'L1_TIMEOUT': config('CACHE_L1_TIMEOUT', default=60, cast=int),  # sekunde
+            'SYNC_INTERVAL': config('CACHE_L1_SYNC_INTERVAL', default=1.0, cast=float),  # provera invalidacija
+        },
+    },
+    'shared': {
+        'BACKEND': 'barter.cache.InstrumentedRedisCache' if CACHE_REDIS_URL else 'barter.cache.InstrumentedFileBasedCache',
+        'LOCATION': CACHE_REDIS_URL or config('CACHE_DIR', default=os.path.join(tempfile.gettempdir(), 'barter-cache')),
+        'METRICS_NAME': 'shared',
+        'OPTIONS': {} if CACHE_REDIS_URL else {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=20000, cast=int)},
+    },
+}
+
+# PAGE CACHE - celi odgovori home/offer_list/offer_detail, deljeni među posetiocima (barter/page_cache.py)
+PAGE_CACHE_ENABLED = config('PAGE_CACHE_ENABLED', default=True, cast=bool)
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=300, cast=int)  # sekunde u kešu servera
+PAGE_CACHE_MAX_AGE = config('PAGE_CACHE_MAX_AGE', default=60, cast=int)  # Cache-Control max-age za browser/CDN
+PAGE_SHELL = config('PAGE_SHELL', default=True, cast=bool)  # telo bez korisnika + /fragments/, keš i za prijavljene
+
+# IMAGE VARIANTS - thumb/medium/large + WebP (core.images)
+IMAGE_VARIANT_WORKERS = config('IMAGE_VARIANT_WORKERS', default=2, cast=int)
+IMAGE_VARIANTS_ASYNC = config('IMAGE_VARIANTS_ASYNC', default=True, cast=bool)
+
 # DEFAULT PRIMARY KEY
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -187,6 +269,7 @@ CSRF_TRUSTED_ORIGINS = [
 
 # SSL REDIRECT (Production = True, Dev = False)
 SECURE_SSL_REDIRECT = not DEBUG
+SECURE_REDIRECT_EXEMPT = [r'^healthz$', r'^readyz$', r'^metrics$']  # interni HTTP pozivi
 
 # HSTS Settings
 SECURE_HSTS_SECONDS = 31536000
@@ -216,5 +299,10 @@ LOGGING = {
             'handlers': ['console'],
             'level': 'DEBUG',
         },
+        'barter.sql': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
@@ -0,0 +1,52 @@
+"""
+Test helperi za budžet SQL upita.
+
+    with assert_max_queries(5):
+        ...
+
+    assert_query_budget(self.client, reverse('core:my_messages'))
+
+assert_query_budget čita budžet deklarisan na view-u (@query_budget) i pada
+sa listom otisaka upita kada ga view prekorači ili ima N+1 obrazac.
+"""
+from contextlib import contextmanager
+
+from django.urls import resolve
+
+from .instrumentation import QueryRecorder, get_query_budget, record_queries
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _report(recorder, limit, label):
+    lines = [f'{label}: {recorder.count} upita, budžet {limit}']
+    for key, count in recorder.fingerprints.most_common(10):
+        lines.append(f'  {count}x {key[:200]}')
+    for key, count, origin in recorder.n_plus_one:
+        lines.append(f'  N+1 ({count}x) iz {origin or "?"}: {key[:200]}')
+    return '\n'.join(lines)
+
+
+@contextmanager
+def assert_max_queries(limit, using=None, label='Blok'):
+    """Pada ako blok izvrši više od limit upita"""
+    with record_queries(QueryRecorder(), using=using) as recorder:
+        yield recorder
+    if recorder.count > limit:
+        raise QueryBudgetExceeded(_report(recorder, limit, label))
+
+
+def assert_query_budget(client, url, method='get', allow_n_plus_one=False, **kwargs):
+    """Pozovi view test klijentom i proveri njegov deklarisani budžet upita"""
+    match = resolve(url.split('?')[0])
+    budget = get_query_budget(match.func)
+    if budget is None:
+        raise AssertionError(f'{match.view_name} nema deklarisan budžet (@query_budget)')
+
+    with assert_max_queries(budget, label=match.view_name) as recorder:
+        response = getattr(client, method)(url, **kwargs)
+    if recorder.n_plus_one and not allow_n_plus_one:
+        raise QueryBudgetExceeded(_report(recorder, budget, f'{match.view_name} (N+1)'))
+    return response
@@ -1,7 +1,12 @@
 import logging
-from django.http import JsonResponse
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.http import HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
 from django.views.decorators.csrf import csrf_exempt
 
+from .metrics import registry
+
 logger = logging.getLogger('oauth_debug')
 
 
@@ -18,3 +23,32 @@ def debug_callback(request):
         'code': request.GET.get('code'),
         'url': request.build_absolute_uri(),
     })
+
+
+# ==================== HEALTH & METRICS ====================
+
+def healthz(request):
+    """Liveness - proces odgovara (bez baze i šablona)"""
+    return HttpResponse('ok', content_type='text/plain')
+
+
+def readyz(request):
+    """Readiness - baza je dostupna"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except DatabaseError as exc:
+        logger.error(f"🔴 Readiness check failed: {exc}")
+        return JsonResponse({'status': 'unavailable', 'database': 'error'}, status=503)
+    return JsonResponse({'status': 'ok', 'database': 'ok'})
+
+
+def metrics(request):
+    """Prometheus metrike svih worker-a (Bearer METRICS_TOKEN; bez tokena samo uz DEBUG)"""
+    token = settings.METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        return HttpResponse(status=403)
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -4,6 +4,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 import logging
 
+from barter import views as project_views
+
 logger = logging.getLogger('allauth')
 
 
@@ -32,6 +34,9 @@ def setup_allauth_logging():
 setup_allauth_logging()
 
 urlpatterns = [
+    path('healthz', project_views.healthz, name='healthz'),
+    path('readyz', project_views.readyz, name='readyz'),
+    path('metrics', project_views.metrics, name='metrics'),
     path('admin/', admin.site.urls),
     path('accounts/', include('allauth.urls')),
     path('', include('core.urls')),
@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Category, Offer, Message, Trade, UserProfile, Review, Notification
+
+from . import catalog
+from .models import (
+    Category, Offer, Message, Conversation, Trade, OfferReservation, UserProfile, Review, Notification, Job,
+)
 
 
 @admin.register(Category)
@@ -10,10 +14,25 @@ class CategoryAdmin(admin.ModelAdmin):
     ordering = ('name',)
 
 
+class CatalogCategoryFilter(admin.SimpleListFilter):
+    """Filter po kategoriji iz keša kataloga (bez upita za kategorije)"""
+    title = 'kategorija'
+    parameter_name = 'category'
+
+    def lookups(self, request, model_admin):
+        return [(category.pk, category.name) for category in catalog.categories()]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(category_id=self.value())
+        return queryset
+
+
 @admin.register(Offer)
 class OfferAdmin(admin.ModelAdmin):
-    list_display = ('title', 'owner', 'category', 'is_active', 'is_premium', 'created_at')
-    list_filter = ('is_active', 'is_premium', 'category', 'created_at')
+    list_display = ('title', 'owner', 'category_name', 'is_active', 'is_premium', 'created_at')
+    list_filter = ('is_active', 'is_premium', CatalogCategoryFilter, 'created_at')
+    list_select_related = ('owner',)
     search_fields = ('title', 'description', 'owner__username')
     readonly_fields = ('slug', 'views_count', 'likes_count', 'created_at', 'updated_at')
     fieldsets = (
@@ -39,6 +58,11 @@ class OfferAdmin(admin.ModelAdmin):
     )
     ordering = ('-created_at',)
 
+    @admin.display(description='Kategorija', ordering='category__name')
+    def category_name(self, obj):
+        category = catalog.get(obj.category_id)
+        return category.name if category else '-'
+
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
@@ -49,6 +73,15 @@ class MessageAdmin(admin.ModelAdmin):
     ordering = ('-timestamp',)
 
 
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ('user_low', 'user_high', 'last_activity', 'unread_low', 'unread_high')
+    search_fields = ('user_low__username', 'user_high__username')
+    readonly_fields = ('user_low', 'user_high', 'last_message', 'last_activity', 'created_at')
+    list_select_related = ('user_low', 'user_high')
+    ordering = ('-last_activity',)
+
+
 @admin.register(Trade)
 class TradeAdmin(admin.ModelAdmin):
     list_display = ('offer1', 'offer2', 'user1', 'user2', 'status', 'created_at')
@@ -76,12 +109,24 @@ class TradeAdmin(admin.ModelAdmin):
     ordering = ('-created_at',)
 
 
+
+@admin.register(OfferReservation)
+class OfferReservationAdmin(admin.ModelAdmin):
+    list_display = ('offer', 'trade', 'expires_at', 'created_at')
+    list_filter = ('expires_at',)
+    search_fields = ('offer__title',)
+    list_select_related = ('offer', 'trade')
+    raw_id_fields = ('offer', 'trade')
+    ordering = ('expires_at',)
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'location', 'rating', 'is_verified', 'trades_completed', 'total_reviews')
     list_filter = ('is_verified', 'rating')
     search_fields = ('user__username', 'user__email', 'location')
-    readonly_fields = ('created_at', 'average_rating', 'total_reviews')
+    list_select_related = ('user',)
+    readonly_fields = ('created_at', 'average_rating', 'total_reviews', 'rating_sum', 'rating_count',
+                       'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5')
     fieldsets = (
         ('Korisnik', {
             'fields': ('user',)
@@ -92,6 +137,10 @@ class UserProfileAdmin(admin.ModelAdmin):
         ('Reputacija', {
             'fields': ('rating', 'average_rating', 'total_reviews', 'trades_completed', 'is_verified')
         }),
+        ('Raspodela ocena', {
+            'fields': ('rating_sum', 'rating_count', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5'),
+            'classes': ('collapse',)
+        }),
         ('Vremenske marke', {
             'fields': ('created_at',),
             'classes': ('collapse',)
@@ -134,7 +183,7 @@ class ReviewAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('recipient', 'notification_type', 'title', 'is_read', 'created_at')
+    list_display = ('recipient', 'notification_type', 'title', 'count', 'is_read', 'created_at')
     list_filter = ('notification_type', 'is_read', 'created_at')
     search_fields = ('recipient__username', 'actor__username', 'title', 'message')
     readonly_fields = ('created_at', 'updated_at')
@@ -167,3 +216,11 @@ class NotificationAdmin(admin.ModelAdmin):
             return self.readonly_fields + ['recipient', 'actor', 'notification_type', 'title', 'message', 'offer',
                                            'trade', 'is_read']
         return self.readonly_fields
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('task', 'status', 'attempts', 'run_after', 'locked_by', 'created_at')
+    list_filter = ('status', 'task')
+    readonly_fields = ('created_at', 'locked_at', 'locked_by', 'last_error')
+    ordering = ('run_after',)
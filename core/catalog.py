@@ -0,0 +1,123 @@
+"""
+Katalog kategorija u verzionisanom kešu.
+
+Lista kategorija i broj aktivnih ponuda po kategoriji čuvaju se pod ključevima
+koji sadrže verziju kataloga (catalog:version). Svaka izmena ili brisanje
+kategorije menja verziju, pa se stari ključevi više ne čitaju i ne treba ih
+brisati. Brojevi ponuda se ne preračunavaju nego menjaju inkrementalno
+(cache.incr posle commit-a) kada se ponuda aktivira, deaktivira, premesti u
+drugu kategoriju ili obriše; posle upisa bez signala (seeding) dovoljno je
+pozvati bump_version(). Izračunati brojevi se upisuju sa add(), pa ne
+prepisuju broj koji je drugi proces već upisao i uvećao.
+
+Sa toplim kešom home, offer_list, forma ponude, get_categories i admin ne
+šalju nijedan upit za kategorije.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+# Brojevi se menjaju inkrementalno; kraći rok ograničava moguće odstupanje
+# (incr koji se desi dok se brojevi preračunavaju) na nekoliko minuta
+COUNT_CACHE_TIMEOUT = 60 * 5
+VERSION_KEY = 'catalog:version'
+
+
+def _new_version():
+    # Vreme umesto brojača: ni posle izbacivanja iz keša verzija se ne ponavlja
+    return time.time_ns()
+
+
+def version():
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        cache.add(VERSION_KEY, _new_version(), None)
+        current = cache.get(VERSION_KEY)
+    return current
+
+
+def bump_version():
+    """Obeleži ceo katalog (kategorije i brojeve) kao zastareo posle commit-a"""
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, _new_version(), None))
+
+
+def _count_key(current, category_id):
+    return f'catalog:{current}:count:{category_id}'
+
+
+def categories():
+    """Sve kategorije (Category instance, po imenu)"""
+    from .models import Category
+
+    return cache.get_or_set(
+        f'catalog:{version()}:categories', lambda: list(Category.objects.all()), CATALOG_CACHE_TIMEOUT,
+    )
+
+
+def get(category_id):
+    """Kategorija po id-u ili None"""
+    try:
+        category_id = int(category_id)
+    except (TypeError, ValueError):
+        return None
+    return next((category for category in categories() if category.pk == category_id), None)
+
+
+def counts():
+    """Broj aktivnih ponuda po id-u kategorije"""
+    from .models import Offer
+
+    current = version()
+    ids = [category.pk for category in categories()]
+    keys = {_count_key(current, pk): pk for pk in ids}
+    found = cache.get_many(keys)
+    if len(found) == len(keys):
+        return {keys[key]: value for key, value in found.items()}
+
+    totals = dict.fromkeys(ids, 0)
+    totals.update(
+        Offer.objects.filter(is_active=True).order_by()
+        .values_list('category_id').annotate(total=Count('pk'))
+    )
+    result = {}
+    for key, pk in keys.items():
+        if key in found:
+            result[pk] = found[key]
+        elif cache.add(key, totals[pk], COUNT_CACHE_TIMEOUT):
+            result[pk] = totals[pk]
+        else:
+            # Drugi proces je u međuvremenu upisao broj (i možda ga uvećao) - njegov važi
+            result[pk] = cache.get(key, totals[pk])
+    return result
+
+
+def offer_count(category_id):
+    return counts().get(category_id, 0)
+
+
+def adjust_count(category_id, delta):
+    """Promeni broj aktivnih ponuda kategorije posle commit-a tekuće transakcije"""
+    if not category_id or not delta:
+        return
+
+    def apply():
+        try:
+            cache.incr(_count_key(version(), category_id), delta)
+        except ValueError:
+            # Broj nije u kešu - izračunaće se ceo pri sledećem čitanju
+            pass
+
+    transaction.on_commit(apply)
+
+
+def attach(offers):
+    """Postavi offer.category iz kataloga (bez upita po ponudi); vraća listu"""
+    offers = list(offers)
+    by_id = {category.pk: category for category in categories()}
+    for offer in offers:
+        if offer.category_id in by_id:
+            offer.category = by_id[offer.category_id]
+    return offers
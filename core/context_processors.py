@@ -1,22 +1,23 @@
-from .models import Message, Notification
+from functools import cache
+
+from django.utils.functional import lazy
+
+from . import counters
 
 
 def unread_count(request):
-    """Dodaj broj nepročitanih poruka i notifikacija u sve template-e"""
+    """Dodaj broj nepročitanih poruka i notifikacija u sve template-e (lenjo)"""
     if request.user.is_authenticated:
-        unread_messages = Message.objects.filter(
-            recipient=request.user,
-            is_read=False
-        ).count()
+        user_id = request.user.pk
 
-        unread_notifications = Notification.objects.filter(
-            recipient=request.user,
-            is_read=False
-        ).count()
+        # Upit se izvršava tek kada template zaista pročita brojač, i samo jednom
+        @cache
+        def unread():
+            return counters.get_unread_counts(user_id)
 
         return {
-            'unread_count': unread_messages,
-            'unread_notifications': unread_notifications,
+            'unread_count': lazy(lambda: unread()['messages'], int)(),
+            'unread_notifications': lazy(lambda: unread()['notifications'], int)(),
         }
 
     return {
@@ -0,0 +1,144 @@
+"""
+Brojači nepročitanih poruka i notifikacija, čuvani na UserProfile-u.
+
+Umesto dva COUNT upita na svaki render, brojači se menjaju atomski (F izrazi)
+na svakom mestu gde nastaje, čita se ili briše poruka/notifikacija, a čitaju
+se jednim upitom po primarnom ključu. Svaka promena se objavljuje i kao
+badge delta (core.events). Eventualna odstupanja ispravlja periodični zadatak
+counters.reconcile (run_workers, UNREAD_RECONCILE_INTERVAL) ili komanda
+reconcile_unread_counters.
+
+version(user_id) je verzija brojača u kešu koja se menja posle svake
+promene (commit-a); služi kao ETag za get_unread_count bez upita u bazu.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from . import jobs
+from .events import publish_badge
+
+
+def _counter(field, delta):
+    return Greatest(F(field) + delta, Value(0))
+
+
+def adjust(user_id, messages=0, notifications=0):
+    """Promeni brojače korisnika za datu deltu (nikad ispod nule)"""
+    from .models import UserProfile
+
+    changes = {}
+    if messages:
+        changes['unread_messages'] = _counter('unread_messages', messages)
+    if notifications:
+        changes['unread_notifications'] = _counter('unread_notifications', notifications)
+    if not changes:
+        return
+
+    UserProfile.objects.filter(user_id=user_id).update(**changes)
+    _bump_versions([user_id])
+    publish_badge(user_id, messages=messages, notifications=notifications)
+
+
+GLOBAL_VERSION_KEY = 'unread_version'
+
+
+def _version(key):
+    current = cache.get(key)
+    if current is None:
+        cache.add(key, time.time_ns(), None)
+        current = cache.get(key)
+    return current
+
+
+def version(user_id):
+    """Verzija brojača korisnika; reconcile svih profila menja globalni deo"""
+    return f'{_version(GLOBAL_VERSION_KEY)}-{_version(f"unread_version:{user_id}")}'
+
+
+def _bump_versions(user_ids=None):
+    """Posle commit-a obriši verzije (sledeće čitanje dobija novu)"""
+    if user_ids is None:
+        keys = [GLOBAL_VERSION_KEY]
+    else:
+        keys = [f'unread_version:{user_id}' for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def count_unread(user_id):
+    """Tačan broj nepročitanih direktno iz tabela poruka i notifikacija"""
+    from .models import Message, Notification
+
+    return {
+        'messages': Message.objects.filter(recipient_id=user_id, is_read=False).count(),
+        'notifications': Notification.objects.filter(recipient_id=user_id, is_read=False).count(),
+    }
+
+
+def get_unread_counts(user_id):
+    """Brojači sa profila (jedan upit); bez profila se računaju iz tabela"""
+    from .models import UserProfile
+
+    row = (
+        UserProfile.objects
+        .filter(user_id=user_id)
+        .values_list('unread_messages', 'unread_notifications')
+        .first()
+    )
+    if row is None:
+        return count_unread(user_id)
+    return {'messages': row[0], 'notifications': row[1]}
+
+
+def _unread_subquery(model, recipient_field='recipient'):
+    rows = (
+        model.objects
+        .filter(**{recipient_field: OuterRef('user_id')}, is_read=False)
+        .order_by()
+        .values(recipient_field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def reconcile(user_ids=None):
+    """Preračunaj brojače jednim UPDATE-om (za sve ili date korisnike)"""
+    from .models import Message, Notification, UserProfile
+
+    profiles = UserProfile.objects.all()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        profiles = profiles.filter(user_id__in=user_ids)
+    updated = profiles.update(
+        unread_messages=_unread_subquery(Message),
+        unread_notifications=_unread_subquery(Notification),
+    )
+    _bump_versions(user_ids)
+    return updated
+
+
+def reconcile_all(batch_size=None):
+    """Preračunaj brojače svih profila u grupama po opsegu user_id-a"""
+    from .models import UserProfile
+
+    batch_size = batch_size or settings.UNREAD_RECONCILE_BATCH_SIZE
+    last_id = UserProfile.objects.aggregate(last=Max('user_id'))['last'] or 0
+
+    updated = 0
+    for start in range(0, last_id + 1, batch_size):
+        user_ids = UserProfile.objects.filter(
+            user_id__gte=start, user_id__lt=start + batch_size
+        ).values_list('user_id', flat=True)
+        updated += reconcile(user_ids)
+    return updated
+
+
+@jobs.periodic('counters.reconcile', every=settings.UNREAD_RECONCILE_INTERVAL)
+def reconcile_task(payloads):
+    reconcile_all()
@@ -0,0 +1,102 @@
+"""
+Push događaji za badge-ove nepročitanih poruka i notifikacija.
+
+Promene se objavljuju kao delte ({"messages": +1}, {"notifications": -3}) na
+kanal korisnika, a core.views.unread_stream ih šalje browseru kao Server-Sent
+Events preko ASGI servera (barter/asgi.py). Podrazumevani broker radi unutar
+jednog procesa; EVENTS_BROKER u settings-u može da ga zameni brokerom koji
+deli događaje između worker-a (npr. lokalni Redis pub/sub) - dovoljno je da
+ima iste subscribe/unsubscribe/publish metode.
+
+Promene iz drugih procesa (npr. notifikacije koje isporučuje run_workers)
+ne stižu kroz InProcessBroker; stream ih hvata proverom counters.version
+na svakih EVENTS_SYNC_INTERVAL sekundi i šalje novi snapshot.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from barter.metrics import registry
+
+
+class Subscription:
+    """Red događaja jednog SSE klijenta, vezan za njegov event loop"""
+
+    def __init__(self, loop, maxsize=100):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, event):
+        # Spor klijent gubi događaje; snapshot pri ponovnom povezivanju ih ispravlja
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def clear(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+class InProcessBroker:
+    """Pub/sub unutar procesa; publish je bezbedan iz bilo koje niti"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(subscription.put, event)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'EVENTS_BROKER', 'core.events.InProcessBroker'))()
+    return _broker
+
+
+registry.gauge(
+    'barter_sse_subscribers', 'Otvorene SSE konekcije',
+    lambda: _broker.subscriber_count() if _broker is not None and hasattr(_broker, 'subscriber_count') else 0,
+)
+
+
+def publish_badge(user_id, messages=0, notifications=0):
+    """Objavi promenu broja nepročitanih nakon commit-a transakcije"""
+    event = {}
+    if messages:
+        event['messages'] = messages
+    if notifications:
+        event['notifications'] = notifications
+    if event:
+        transaction.on_commit(lambda: get_broker().publish(user_id, event))
@@ -0,0 +1,51 @@
+"""
+Delovi stranica koji zavise od korisnika (PAGE_SHELL, barter.page_cache).
+
+Keširana ljuska ostavlja mesta data-fragment="ime" ili "ime:id"; base.html
+ih skuplja i traži jednim zahtevom /fragments/?f=navbar&f=offer_actions:5.
+render() sve ponude iz zahteva učitava jednim upitom.
+"""
+from django.template.loader import render_to_string
+
+FRAGMENTS = {
+    'navbar': 'core/fragments/navbar.html',
+    'offer_contact': 'core/fragments/offer_contact.html',
+    'offer_actions': 'core/fragments/offer_actions.html',
+}
+OFFER_FRAGMENTS = {'offer_contact', 'offer_actions'}
+MAX_FRAGMENTS = 20
+
+
+def _parse(names):
+    """Poznati fragmenti kao (pun naziv, ime, id ponude ili None)"""
+    requested = []
+    for full in dict.fromkeys(names[:MAX_FRAGMENTS]):
+        name, _, arg = full.partition(':')
+        if name not in FRAGMENTS:
+            continue
+        if name in OFFER_FRAGMENTS:
+            if not arg.isdigit():
+                continue
+            requested.append((full, name, int(arg)))
+        else:
+            requested.append((full, name, None))
+    return requested
+
+
+def render(request, names):
+    """HTML traženih fragmenata za korisnika iz request-a"""
+    from .models import Offer
+
+    requested = _parse(names)
+    offer_ids = {arg for _, name, arg in requested if name in OFFER_FRAGMENTS}
+    offers = Offer.objects.select_related('owner').in_bulk(offer_ids) if offer_ids else {}
+
+    html = {}
+    for full, name, offer_id in requested:
+        context = {}
+        if name in OFFER_FRAGMENTS:
+            if offer_id not in offers:
+                continue
+            context['offer'] = offers[offer_id]
+        html[full] = render_to_string(FRAGMENTS[name], context, request=request)
+    return html
@@ -0,0 +1,210 @@
+"""
+Varijante slika (thumb/medium/large + WebP) za ponude i avatare.
+
+Posle čuvanja modela sa novom slikom, varijante se prave u pozadinskoj niti
+(nakon commit-a transakcije) preko Pillow-a i upisuju kroz isti storage kao
+original (lokalni FileSystemStorage ili podešeni, npr. Cloudinary). Imena
+fajlova se čuvaju u JSON polju <polje>_variants zajedno sa imenom originala,
+pa se zastarele varijante prepoznaju po promeni izvora. Komanda
+generate_image_variants pravi varijante za postojeće slike.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from barter import page_cache
+from barter.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# (naziv, širina, visina, isecanje na tačnu veličinu)
+OFFER_VARIANTS = (
+    ('thumb', 320, 240, True),
+    ('medium', 800, 600, False),
+    ('large', 1600, 1200, False),
+)
+AVATAR_VARIANTS = (
+    ('thumb', 96, 96, True),
+    ('medium', 256, 256, True),
+    ('large', 512, 512, True),
+)
+VARIANT_SPECS = {
+    ('core.offer', 'image'): OFFER_VARIANTS,
+    ('core.userprofile', 'avatar'): AVATAR_VARIANTS,
+}
+
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+_executor = None
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def _specs(instance, field_name):
+    return VARIANT_SPECS[(instance._meta.label_lower, field_name)]
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _resize(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+    resized = image.copy()
+    resized.thumbnail((width, height), Image.Resampling.LANCZOS)
+    return resized
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == 'JPEG':
+        image.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    elif fmt == 'PNG':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def render_variants(fieldfile, specs):
+    """Napravi i sačuvaj varijante slike; vraća rečnik za <polje>_variants"""
+    storage = fieldfile.storage
+    with storage.open(fieldfile.name, 'rb') as source:
+        image = Image.open(source)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    alpha = _has_alpha(image)
+    image = image.convert('RGBA' if alpha else 'RGB')
+    fallback_format, fallback_ext = ('PNG', 'png') if alpha else ('JPEG', 'jpg')
+
+    root = os.path.splitext(fieldfile.name)[0]
+    data = {'source': fieldfile.name}
+    for name, width, height, crop in specs:
+        resized = _resize(image, width, height, crop)
+        data[name] = {
+            'width': resized.width,
+            'height': resized.height,
+            'src': storage.save(f'{root}__{name}.{fallback_ext}', ContentFile(_encode(resized, fallback_format))),
+            'webp': storage.save(f'{root}__{name}.webp', ContentFile(_encode(resized, 'WEBP'))),
+        }
+    return data
+
+
+def variant_names(data):
+    return [
+        value[key]
+        for value in (data or {}).values() if isinstance(value, dict)
+        for key in ('src', 'webp') if value.get(key)
+    ]
+
+
+def is_stale(instance, field_name):
+    fieldfile = getattr(instance, field_name)
+    data = getattr(instance, variants_field(field_name)) or {}
+    return (fieldfile.name or None) != data.get('source')
+
+
+def generate(instance, field_name):
+    """Osveži varijante jedne slike i upiši ih bez signala; vraća True ako su napravljene"""
+    fieldfile = getattr(instance, field_name)
+    field = variants_field(field_name)
+    old = getattr(instance, field) or {}
+    data = render_variants(fieldfile, _specs(instance, field_name)) if fieldfile else {}
+
+    # Upis samo ako slika u međuvremenu nije zamenjena
+    if fieldfile:
+        same_image = Q(**{field_name: fieldfile.name})
+    else:
+        same_image = Q(**{f'{field_name}__isnull': True}) | Q(**{field_name: ''})
+    updated = type(instance).objects.filter(same_image, pk=instance.pk).update(**{field: data})
+    stale = variant_names(old) if updated else variant_names(data)
+    for name in stale:
+        fieldfile.storage.delete(name)
+    if updated:
+        setattr(instance, field, data)
+        # update() ne okida signale - keširane stranice bi ostale bez srcset-a
+        page_cache.purge(*_page_tags(instance))
+    return bool(updated and data)
+
+
+def _page_tags(instance):
+    """Tagovi keširanih stranica (barter.page_cache) koje prikazuju sliku"""
+    if instance._meta.label_lower == 'core.offer':
+        return ('offers', f'offer:{instance.pk}')
+    return (f'user:{instance.user_id}',)
+
+
+def _run(model, pk, field_name):
+    try:
+        instance = model.objects.filter(pk=pk).first()
+        if instance is not None and is_stale(instance, field_name):
+            generate(instance, field_name)
+    except Exception:
+        logger.exception('Varijante slike nisu napravljene (%s #%s)', model._meta.label, pk)
+    finally:
+        # Pozadinska nit ima sopstvenu konekciju
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+            thread_name_prefix='image-variants',
+        )
+    return _executor
+
+
+def pending():
+    """Broj slika koje čekaju obradu"""
+    return _executor._work_queue.qsize() if _executor is not None else 0
+
+
+registry.gauge('barter_image_variants_pending', 'Slike koje čekaju pravljenje varijanti', pending)
+
+
+def schedule(instance, field_name):
+    """Napravi varijante nakon commit-a, van request-a"""
+    model, pk = type(instance), instance.pk
+    if getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+        transaction.on_commit(lambda: get_executor().submit(_run, model, pk, field_name))
+    else:
+        transaction.on_commit(lambda: generate(model.objects.get(pk=pk), field_name))
+
+
+# ---------- URL-ovi za šablone i API ----------
+
+def variant_urls(fieldfile, data):
+    """{'thumb': {'url', 'webp', 'width', 'height'}, ...} za aktuelnu sliku"""
+    if not fieldfile or not data or data.get('source') != fieldfile.name:
+        return {}
+    storage = fieldfile.storage
+    return {
+        name: {
+            'url': storage.url(value['src']),
+            'webp': storage.url(value['webp']),
+            'width': value['width'],
+            'height': value['height'],
+        }
+        for name, value in data.items() if isinstance(value, dict)
+    }
+
+
+def srcset(urls, key='url'):
+    """srcset atribut iz variant_urls, po rastućoj širini"""
+    by_width = {}
+    for value in urls.values():
+        by_width.setdefault(value['width'], value[key])
+    return ', '.join(f'{url} {width}w' for width, url in sorted(by_width.items()))
@@ -0,0 +1,209 @@
+"""
+Lokalni red poslova u bazi (model Job).
+
+enqueue() upisuje posao u tekućoj transakciji, pa posao postoji samo ako je
+i promena koja ga je izazvala commit-ovana. Posao sa istim (task, dedup_key)
+koji još čeka se ne upisuje ponovo. manage.py run_workers uzima poslove u
+serijama (SELECT ... FOR UPDATE SKIP LOCKED gde baza to podržava), grupiše
+ih po zadatku i handler-u predaje sve payload-e odjednom. Uspešni poslovi se
+brišu. Ako serija padne, poslovi se izvršavaju pojedinačno, svaki u svojoj
+transakciji, pa se ponavljaju samo neuspešni - sa eksponencijalnim
+odlaganjem do JOBS_MAX_ATTEMPTS. Posao čiji je worker pao se vraća u red
+posle JOBS_LOCK_TIMEOUT sekundi.
+
+Periodični zadaci (@periodic) uvek imaju po jedan posao koji čeka; kada ga
+worker uzme, run_workers upisuje sledeći, pa se zadatak izvršava otprilike
+na svakih `every` sekundi bez cron-a.
+
+Sa JOBS_EAGER=True (npr. lokalno bez worker-a) handler se poziva odmah
+posle commit-a, bez upisa u tabelu; greška handler-a se loguje i ne ruši
+request. U produkciji worker pokreće gunicorn.conf.py uz web proces.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from barter.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_periodic = {}
+
+
+def task(name):
+    """Registruj handler zadatka; handler prima listu payload-a"""
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def periodic(name, every):
+    """Registruj zadatak koji run_workers zakazuje na svakih `every` sekundi"""
+    def decorator(func):
+        _periodic[name] = every
+        return task(name)(func)
+    return decorator
+
+
+def schedule_periodic():
+    """
+    Zakaži sledeće izvršavanje periodičnih zadataka.
+
+    Zadatak koji već čeka, radi ili se ponavlja posle greške (claim briše
+    dedup_key) se preskače, pa u redu nikad nema više od jednog posla po zadatku.
+    """
+    from .models import Job
+
+    active = set(
+        Job.objects.filter(task__in=list(_periodic), status__in=('pending', 'running'))
+        .values_list('task', flat=True)
+    )
+    now = timezone.now()
+    Job.objects.bulk_create(
+        [
+            Job(task=name, dedup_key='periodic', run_after=now + timedelta(seconds=every))
+            for name, every in _periodic.items()
+            if name not in active
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def enqueue(name, payload, dedup_key=None, delay=0):
+    enqueue_many(name, [(payload, dedup_key)], delay=delay)
+
+
+def enqueue_many(name, items, delay=0):
+    """Upiši poslove jednim INSERT-om; items su parovi (payload, dedup_key)"""
+    from .models import Job
+
+    if not items:
+        return
+    if settings.JOBS_EAGER:
+        payloads = [payload for payload, _ in items]
+        transaction.on_commit(lambda: _handlers[name](payloads), robust=True)
+        return
+
+    run_after = timezone.now() + timedelta(seconds=delay)
+    Job.objects.bulk_create(
+        [Job(task=name, payload=payload, dedup_key=dedup_key, run_after=run_after) for payload, dedup_key in items],
+        ignore_conflicts=True,
+    )
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def claim(batch_size, worker=None):
+    """Zauzmi do batch_size poslova koji su na redu i vrati ih"""
+    from .models import Job
+
+    now = timezone.now()
+    token = f'{worker or worker_name()}:{uuid.uuid4().hex[:8]}'[:100]
+
+    with transaction.atomic():
+        # Posao čiji worker se nije javio u roku ponovo čeka
+        Job.objects.filter(
+            status='running', locked_at__lt=now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT),
+        ).update(status='pending')
+
+        due = Job.objects.filter(status='pending', run_after__lte=now).order_by('run_after', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('pk', flat=True)[:batch_size])
+        # dedup_key važi samo dok posao čeka; uslov na statusu štiti od
+        # dvostrukog zauzimanja na bazama bez SKIP LOCKED
+        Job.objects.filter(pk__in=ids, status='pending').update(
+            status='running', locked_by=token, locked_at=now, dedup_key=None, attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.filter(locked_by=token, status='running'))
+
+
+def run_batch(batch_size=100, worker=None):
+    """Izvrši jednu seriju poslova; vraća broj obrađenih"""
+    jobs = claim(batch_size, worker)
+    by_task = {}
+    for job in jobs:
+        by_task.setdefault(job.task, []).append(job)
+    for name, group in by_task.items():
+        _run(name, group)
+    return len(jobs)
+
+
+def _run(name, jobs):
+    """Cela serija u jednoj transakciji; ako padne, svaki posao posebno"""
+    started = time.perf_counter()
+    try:
+        _execute(name, jobs)
+    except Exception as e:
+        if len(jobs) == 1:
+            _failed(name, jobs, e)
+        else:
+            logger.warning('Serija %s nije uspela (%d poslova), izvršavaju se pojedinačno: %r', name, len(jobs), e)
+            for job in jobs:
+                _run_one(name, job)
+    else:
+        registry.inc('barter_jobs_total', len(jobs), task=name, result='ok')
+    registry.inc('barter_jobs_duration_seconds_total', time.perf_counter() - started, task=name)
+
+
+def _run_one(name, job):
+    try:
+        _execute(name, [job])
+    except Exception as e:
+        _failed(name, [job], e)
+    else:
+        registry.inc('barter_jobs_total', task=name, result='ok')
+
+
+def _execute(name, jobs):
+    from .models import Job
+
+    handler = _handlers[name]
+    with transaction.atomic():
+        handler([job.payload for job in jobs])
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).delete()
+
+
+def _failed(name, jobs, error):
+    logger.exception('Posao %s nije uspeo (%d u seriji)', name, len(jobs))
+    _retry(jobs, repr(error))
+    registry.inc('barter_jobs_total', len(jobs), task=name, result='error')
+
+
+def _retry(jobs, error):
+    from .models import Job
+
+    now = timezone.now()
+    for job in jobs:
+        if job.attempts >= settings.JOBS_MAX_ATTEMPTS:
+            changes = {'status': 'failed'}
+        else:
+            changes = {'status': 'pending', 'run_after': now + timedelta(seconds=2 ** job.attempts)}
+        Job.objects.filter(pk=job.pk).update(last_error=error[:2000], locked_by='', locked_at=None, **changes)
+
+
+registry.counter('barter_jobs_total', 'Obrađeni poslovi iz reda', ('task', 'result'))
+registry.counter('barter_jobs_duration_seconds_total', 'Vreme izvršavanja poslova', ('task',))
+
+
+def _queue_size(status):
+    from .models import Job
+
+    return Job.objects.filter(status=status).count()
+
+
+registry.gauge('barter_jobs_pending', 'Poslovi koji čekaju u redu', lambda: _queue_size('pending'), shared=True)
+registry.gauge('barter_jobs_failed', 'Poslovi koji su odustali posle JOBS_MAX_ATTEMPTS', lambda: _queue_size('failed'), shared=True)
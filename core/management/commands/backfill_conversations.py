@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Greatest, Least
+
+from core.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = 'Popuni tabelu razgovora iz postojećih poruka'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        pairs = (
+            Message.objects
+            .annotate(low=Least('sender_id', 'recipient_id'), high=Greatest('sender_id', 'recipient_id'))
+            .values('low', 'high')
+            .annotate(
+                last_message_id=Max('id'),
+                last_activity=Max('timestamp'),
+                unread_low=Count('id', filter=Q(is_read=False, recipient_id=F('low'))),
+                unread_high=Count('id', filter=Q(is_read=False, recipient_id=F('high'))),
+            )
+            .order_by('low', 'high')
+        )
+
+        batch, total = [], 0
+        for row in pairs.iterator(chunk_size=batch_size):
+            batch.append(Conversation(
+                user_low_id=row['low'],
+                user_high_id=row['high'],
+                last_message_id=row['last_message_id'],
+                last_activity=row['last_activity'],
+                unread_low=row['unread_low'],
+                unread_high=row['unread_high'],
+            ))
+            if len(batch) >= batch_size:
+                total += self._save(batch)
+                batch = []
+        if batch:
+            total += self._save(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Ažurirano razgovora: {total}'))
+
+    def _save(self, batch):
+        Conversation.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['user_low', 'user_high'],
+            update_fields=['last_message', 'last_activity', 'unread_low', 'unread_high'],
+        )
+        return len(batch)
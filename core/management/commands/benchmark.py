@@ -0,0 +1,243 @@
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, reverse
+
+from barter.instrumentation import QueryRecorder, record_queries
+from core import urls as core_urls
+from core.models import Message, Offer
+from core.seeding import SCALES, MarketplaceSeeder
+
+PAGES = [
+    'home', 'offer_list', 'offer_detail', 'my_messages', 'view_conversation',
+    'my_trades', 'notifications',
+]
+# Beskonačan SSE stream se ne meri
+SKIP = {'unread_stream'}
+QUIET_LOGGERS = ('barter.sql', 'django.request', 'django.server')
+
+
+def percentile(values, p):
+    """Percentil sa linearnom interpolacijom (values su sortirane)"""
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+def isolated_caches(location):
+    """CACHES sa praznim deljenim kešom u location - bez stranica i verzija iz ranijih baza"""
+    caches = {alias: dict(config) for alias, config in settings.CACHES.items()}
+    caches['shared'] = {
+        **caches['shared'],
+        'BACKEND': 'barter.cache.InstrumentedFileBasedCache',
+        'LOCATION': location,
+        'OPTIONS': {},
+    }
+    return caches
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark stranica i JSON API-ja nad determinističkim podacima u test bazi i praznom '
+        'privremenom kešu (latencija p50/p90/p95/p99 i broj upita, izlaz u JSON-u); svaki URL mora da vrati 200'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+        for table in SCALES['small']:
+            parser.add_argument(f'--{table}', type=int, help=f'Broj redova za {table} (menja --scale)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', nargs='+', metavar='URL_NAME', help='Meri samo navedene URL-ove')
+        parser.add_argument('--keepdb', action='store_true', help='Zadrži test bazu i podatke između pokretanja')
+        parser.add_argument('--output', help='Upiši JSON u fajl umesto na stdout')
+        parser.add_argument('--compare', help='JSON prethodnog pokretanja za poređenje')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Dozvoljeni rast p95 pre nego što se prijavi regresija (0.2 = 20%%)')
+
+    def handle(self, *args, **options):
+        sizes = {table: options[table] or default for table, default in SCALES[options['scale']].items()}
+        for name in QUIET_LOGGERS:
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'], serialize=False,
+        )
+        try:
+            with tempfile.TemporaryDirectory(prefix='barter-bench-cache-') as cache_dir, \
+                    override_settings(CACHES=isolated_caches(cache_dir)):
+                seeded_in = self.seed(sizes, options['seed'])
+                results = self.run_all(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'git_revision': git_revision(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'scale': sizes,
+                'seed': options['seed'],
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+                'seed_seconds': seeded_in,
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f'✅ Rezultati upisani u {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+        failed = {name: result['status'] for name, result in results.items() if result['status'] != [200]}
+        if failed:
+            for name, statuses in failed.items():
+                self.stderr.write(self.style.ERROR(f'❌ {name}: status {statuses}'))
+            raise CommandError(f'{len(failed)} URL-ova nije vratilo 200 - merenje nije validno')
+
+        if options['compare']:
+            self.compare(results, options['compare'], options['threshold'])
+
+    # ---------- podaci ----------
+
+    def seed(self, sizes, seed):
+        seeder = MarketplaceSeeder(seed=seed, prefix='bench')
+        started = time.perf_counter()
+        if not seeder.load_existing():
+            self.stderr.write(f'Generišem podatke: {sizes}')
+            seeder.run(**sizes)
+        self.user = seeder.hot_user
+        return round(time.perf_counter() - started, 2)
+
+    def fixtures(self):
+        """Vrednosti URL parametara: tuđa ponuda i najčešći sagovornik korisnika"""
+        offer = Offer.objects.filter(is_active=True).exclude(owner=self.user).order_by('pk').first()
+        partner = (
+            Message.objects.filter(recipient=self.user).order_by('pk')
+            .values_list('sender__username', flat=True).first()
+        )
+        return {
+            'pk': offer.pk,
+            'offer_id': offer.pk,
+            'username': partner,
+            'query': {
+                'search_offers': {'q': offer.offered.split()[0]},
+                'get_messages_list': {'username': partner},
+            },
+        }
+
+    def targets(self, only):
+        names = list(PAGES)
+        for pattern in core_urls.urlpatterns:
+            if isinstance(pattern, URLPattern) and str(pattern.pattern).startswith('api/') \
+                    and pattern.name not in SKIP:
+                names.append(pattern.name)
+        if only:
+            unknown = set(only) - set(names)
+            if unknown:
+                raise CommandError(f'Nepoznati URL-ovi: {", ".join(sorted(unknown))}')
+            names = [name for name in names if name in only]
+        return names
+
+    def url_for(self, name, fixtures):
+        pattern = next(p for p in core_urls.urlpatterns if getattr(p, 'name', None) == name)
+        kwargs = {key: fixtures[key] for key in pattern.pattern.converters}
+        return reverse(f'core:{name}', kwargs=kwargs), fixtures['query'].get(name, {})
+
+    # ---------- merenje ----------
+
+    def run_all(self, options):
+        client = Client()
+        client.force_login(self.user)
+        fixtures = self.fixtures()
+
+        results = {}
+        for name in self.targets(options['only']):
+            url, query = self.url_for(name, fixtures)
+            results[name] = self.measure(client, url, query, options['warmup'], options['iterations'])
+            self.stderr.write(
+                f'{name:<28} p50 {results[name]["p50_ms"]:>8.2f} ms  '
+                f'p95 {results[name]["p95_ms"]:>8.2f} ms  upita {results[name]["queries"]}'
+            )
+        return results
+
+    def measure(self, client, url, query, warmup, iterations):
+        timings, queries, statuses = [], [], set()
+        for i in range(warmup + iterations):
+            with record_queries(QueryRecorder()) as recorder:
+                started = time.perf_counter()
+                # secure=True: bez SECURE_SSL_REDIRECT preusmerenja kada je DEBUG=False
+                response = client.get(url, query, secure=True)
+                elapsed = time.perf_counter() - started
+            if i < warmup:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(recorder.count)
+            statuses.add(response.status_code)
+
+        timings.sort()
+        return {
+            'url': url,
+            'status': sorted(statuses),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p90_ms': round(percentile(timings, 90), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'max_ms': round(timings[-1], 3),
+            'queries': max(queries),
+        }
+
+    # ---------- poređenje ----------
+
+    def compare(self, results, path, threshold):
+        with open(path) as f:
+            baseline = json.load(f)['results']
+
+        regressions = []
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            if current['queries'] > previous['queries']:
+                regressions.append(f'{name}: upita {previous["queries"]} → {current["queries"]}')
+            if current['p95_ms'] > previous['p95_ms'] * (1 + threshold) and current['p95_ms'] - previous['p95_ms'] > 1:
+                regressions.append(f'{name}: p95 {previous["p95_ms"]} → {current["p95_ms"]} ms')
+
+        if regressions:
+            for line in regressions:
+                self.stderr.write(self.style.ERROR(f'❌ {line}'))
+            raise CommandError(f'Regresija u {len(regressions)} merenja u odnosu na {path}')
+        self.stderr.write(self.style.SUCCESS(f'✅ Bez regresija u odnosu na {path}'))
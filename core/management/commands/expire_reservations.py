@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import trades
+
+
+class Command(BaseCommand):
+    help = 'Otkaži prihvaćene razmene čije su rezervacije ponuda istekle (run_workers ovo radi sam; bez worker-a pokretati cron-om)'
+
+    def handle(self, *args, **options):
+        cancelled = trades.expire_reservations()
+        self.stdout.write(self.style.SUCCESS(f'✅ Otkazano razmena sa isteklom rezervacijom: {cancelled}'))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core import images
+from core.models import Offer, UserProfile
+
+TARGETS = {
+    'offers': (Offer, 'image'),
+    'avatars': (UserProfile, 'avatar'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Napravi varijante (thumb/medium/large + WebP) za postojeće slike ponuda i avatare'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=sorted(TARGETS), help='Samo ponude ili samo avatari')
+        parser.add_argument('--force', action='store_true', help='Ponovo napravi i aktuelne varijante')
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        targets = [options['only']] if options['only'] else sorted(TARGETS)
+        for target in targets:
+            model, field_name = TARGETS[target]
+            done, failed = self.generate(model, field_name, options['force'], options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'✅ {target}: napravljeno {done}, neuspešno {failed}'))
+
+    def generate(self, model, field_name, force, batch_size):
+        queryset = (
+            model.objects
+            .exclude(Q(**{f'{field_name}__isnull': True}) | Q(**{field_name: ''}))
+            .only('pk', field_name, images.variants_field(field_name))
+            .order_by('pk')
+        )
+        done = failed = 0
+        last_pk = None
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            for instance in batch:
+                if not force and not images.is_stale(instance, field_name):
+                    continue
+                try:
+                    if images.generate(instance, field_name):
+                        done += 1
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{model.__name__} #{instance.pk}: {exc}')
+        return done, failed
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from core import retention
+
+
+class Command(BaseCommand):
+    help = (
+        'Obriši zastarele notifikacije i pročitane poruke po politici čuvanja '
+        '(serije po indeksu vremena, sa pauzom i opcionom gzip JSONL arhivom)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=[policy.name for policy in retention.POLICIES],
+                            help='Samo navedene politike')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.1, help='Pauza između serija u sekundama')
+        parser.add_argument('--max-batches', type=int, help='Najviše serija po politici (za kraće prozore održavanja)')
+        parser.add_argument('--archive', metavar='DIR', help='Pre brisanja upiši redove u DIR/<politika>-<vreme>.jsonl.gz')
+        parser.add_argument('--dry-run', action='store_true', help='Samo prebroj zastarele redove')
+
+    def handle(self, *args, **options):
+        policies = [p for p in retention.POLICIES if not options['only'] or p.name in options['only']]
+
+        total = 0
+        for policy in policies:
+            if not policy.days:
+                self.stdout.write(f'{policy.name}: isključeno ({policy.setting}=0)')
+                continue
+            if options['dry_run']:
+                count = retention.count_expired(policy)
+                self.stdout.write(f'{policy.name}: {count} redova starijih od {policy.days} dana')
+            else:
+                count = retention.purge(
+                    policy,
+                    batch_size=options['batch_size'],
+                    sleep=options['sleep'],
+                    archive_dir=options['archive'],
+                    max_batches=options['max_batches'],
+                    progress=self.progress,
+                )
+                self.stdout.write(f'{policy.name}: obrisano {count}')
+            total += count
+
+        verb = 'Zastarelo' if options['dry_run'] else 'Obrisano'
+        self.stdout.write(self.style.SUCCESS(f'✅ {verb} ukupno: {total}'))
+
+    def progress(self, policy, deleted):
+        self.stdout.write(f'  {policy.name}: {deleted}', ending='\r')
+        self.stdout.flush()
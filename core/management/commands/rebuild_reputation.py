@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, FloatField, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Round
+
+from core.models import Review, UserProfile
+
+
+def review_aggregate(aggregate):
+    rows = (
+        Review.objects
+        .filter(reviewed_user=OuterRef('user_id'))
+        .order_by()
+        .values('reviewed_user')
+        .annotate(value=aggregate)
+        .values('value')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+class Command(BaseCommand):
+    help = 'Preračunaj reputaciju (zbir, broj i raspodelu ocena) za sve profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = UserProfile.objects.aggregate(last=Max('user_id'))['last'] or 0
+
+        updated = 0
+        for start in range(0, last_id + 1, batch_size):
+            profiles = UserProfile.objects.filter(user_id__gte=start, user_id__lt=start + batch_size)
+            updated += profiles.update(
+                rating_sum=review_aggregate(Sum('rating')),
+                rating_count=review_aggregate(Count('pk')),
+                **{
+                    f'rating_{stars}': review_aggregate(Count('pk', filter=Q(rating=stars)))
+                    for stars in range(1, 6)
+                },
+            )
+            profiles.filter(rating_count__gt=0).update(
+                rating=Round(Cast('rating_sum', FloatField()) / Cast('rating_count', FloatField()), 1)
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Preračunato profila: {updated}'))
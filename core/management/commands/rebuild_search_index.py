@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core import search
+from core.models import Offer
+
+
+class Command(BaseCommand):
+    help = 'Ponovo izgradi indeks pretrage za sve ponude'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        backend = search.get_backend()
+        with connection.schema_editor() as schema_editor:
+            backend.drop_schema(schema_editor)
+            backend.create_schema(schema_editor)
+
+        offers = Offer.objects.only('title', 'description', 'offered', 'wanted', 'city').order_by('pk')
+        indexed = 0
+        batch = []
+        for offer in offers.iterator(chunk_size=batch_size):
+            batch.append((offer.pk, *search.offer_document(offer)))
+            if len(batch) >= batch_size:
+                indexed += self._index(backend, batch)
+                batch = []
+        if batch:
+            indexed += self._index(backend, batch)
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Indeksirano ponuda: {indexed}'))
+
+    def _index(self, backend, batch):
+        with transaction.atomic():
+            backend.index_many(batch)
+        return len(batch)
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import counters
+
+
+class Command(BaseCommand):
+    help = 'Preračunaj brojače nepročitanih poruka i notifikacija (ispravka odstupanja)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.UNREAD_RECONCILE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        updated = counters.reconcile_all(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Usklađeno profila: {updated}'))
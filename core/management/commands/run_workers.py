@@ -0,0 +1,67 @@
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import jobs
+from core import counters, trades  # noqa: F401 - registruje periodične zadatke
+
+
+class Command(BaseCommand):
+    help = 'Pokreni worker-e lokalnog reda poslova (notifikacije, periodični zadaci i ostali core.jobs zadaci)'
+
+    SCHEDULE_INTERVAL = 60
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Broj worker niti')
+        parser.add_argument('--batch-size', type=int, default=100, help='Poslova po seriji')
+        parser.add_argument('--poll', type=float, default=1.0, help='Pauza u sekundama kada je red prazan')
+        parser.add_argument('--once', action='store_true', help='Isprazni red i izađi')
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        self.processed = 0
+        self.lock = threading.Lock()
+        if not options['once']:
+            signal.signal(signal.SIGTERM, lambda *_: self.stop.set())
+            signal.signal(signal.SIGINT, lambda *_: self.stop.set())
+
+        threads = [
+            threading.Thread(target=self.work, args=(i, options), name=f'jobs-{i}')
+            for i in range(options['concurrency'])
+        ]
+        if settings.JOBS_EAGER:
+            self.stdout.write(self.style.WARNING(
+                'JOBS_EAGER=True: web proces izvršava poslove sam i ne upisuje ih u red - '
+                'ukloni JOBS_EAGER i za web i za worker'
+            ))
+        self.stdout.write(f'Pokrenuto worker-a: {len(threads)}')
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Obrađeno poslova: {self.processed}'))
+
+    def work(self, index, options):
+        worker = f'{jobs.worker_name()}:{index}'
+        scheduled = 0
+        try:
+            while not self.stop.is_set():
+                # Prva nit zakazuje periodične zadatke (jedan INSERT, duplikati se preskaču)
+                if index == 0 and not options['once'] and time.monotonic() - scheduled >= self.SCHEDULE_INTERVAL:
+                    jobs.schedule_periodic()
+                    scheduled = time.monotonic()
+                done = jobs.run_batch(options['batch_size'], worker)
+                with self.lock:
+                    self.processed += done
+                if done:
+                    continue
+                if options['once']:
+                    break
+                self.stop.wait(options['poll'])
+        finally:
+            connection.close()
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.seeding import SCALES, MarketplaceSeeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Generiši sintetičke korisnike, ponude, poruke, razmene, recenzije i notifikacije '
+        '(COPY na PostgreSQL-u, bulk_create na ostalim bazama, bez signala)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(SCALES), default='small')
+        for table in SCALES['small']:
+            parser.add_argument(f'--{table}', type=int, help=f'Broj redova za {table} (menja --scale)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=365, help='Raspon datuma unazad')
+        parser.add_argument('--prefix', default='seed', help='Prefiks korisničkih imena')
+        parser.add_argument('--no-copy', action='store_true', help='bulk_create i na PostgreSQL-u')
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help='Bez preračunavanja pretrage, razgovora, brojača i reputacije')
+
+    def handle(self, *args, **options):
+        sizes = {table: options[table] if options[table] is not None else default
+                 for table, default in SCALES[options['scale']].items()}
+        seeder = MarketplaceSeeder(
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            prefix=options['prefix'],
+            days=options['days'],
+            use_copy=False if options['no_copy'] else None,
+            progress=self.progress,
+        )
+        self.stdout.write(f'Metod upisa: {"COPY" if seeder.use_copy else "bulk_create"}, {sizes}')
+
+        started = time.perf_counter()
+        counts = seeder.run(**sizes, rebuild=False)
+        if not options['no_rebuild']:
+            self.stdout.write('Preračunavam izvedene podatke...')
+            rebuild_started = time.perf_counter()
+            seeder.rebuild_derived()
+            self.stdout.write(f'  izvedeni podaci: {time.perf_counter() - rebuild_started:.1f} s')
+
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        summary = ', '.join(f'{table} {count}' for table, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Upisano {total} redova za {elapsed:.1f} s ({total / max(elapsed, 0.001):,.0f} redova/s): {summary}'
+        ))
+
+    def progress(self, model, done, elapsed):
+        self.stdout.write(
+            f'  {model._meta.verbose_name_plural}: {done} ({done / max(elapsed, 0.001):,.0f}/s)',
+            ending='\r',
+        )
+        self.stdout.flush()
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core import notifications
+
+
+class Command(BaseCommand):
+    help = 'Pošalji e-mail pregled nepročitanih notifikacija korisnicima koji su ga uključili (pokretati periodično)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Samo prebroj korisnike, bez slanja')
+
+    def handle(self, *args, **options):
+        sent = notifications.send_digests(dry_run=options['dry_run'])
+        verb = 'Za slanje' if options['dry_run'] else 'Poslato'
+        self.stdout.write(self.style.SUCCESS(f'✅ {verb} pregleda: {sent}'))
@@ -0,0 +1,83 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+# Kopija šeme i normalizacije iz core.search u trenutku ove migracije - kasnije
+# izmene modula ne smeju da menjaju šta ova migracija pravi
+
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_offer_fts "
+    "USING fts5(title, body, tokenize='unicode61')"
+)
+SQLITE_DROP = "DROP TABLE IF EXISTS core_offer_fts"
+SQLITE_INSERT = "INSERT INTO core_offer_fts (rowid, title, body) VALUES (%s, %s, %s)"
+
+POSTGRES_CREATE = [
+    "CREATE TABLE IF NOT EXISTS core_offer_search ("
+    "offer_id bigint PRIMARY KEY REFERENCES core_offer (id) ON DELETE CASCADE, "
+    "vector tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS core_offer_search_vector_gin ON core_offer_search USING GIN (vector)",
+]
+POSTGRES_DROP = "DROP TABLE IF EXISTS core_offer_search"
+POSTGRES_INSERT = (
+    "INSERT INTO core_offer_search (offer_id, vector) VALUES "
+    "(%s, setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'D')) "
+    "ON CONFLICT (offer_id) DO UPDATE SET vector = EXCLUDED.vector"
+)
+
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'ђ': 'đ', 'е': 'e', 'ж': 'ž',
+    'з': 'z', 'и': 'i', 'ј': 'j', 'к': 'k', 'л': 'l', 'љ': 'lj', 'м': 'm', 'н': 'n',
+    'њ': 'nj', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'ћ': 'ć', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'c', 'ч': 'č', 'џ': 'dž', 'ш': 'š',
+}
+DIACRITICS = {'č': 'c', 'ć': 'c', 'š': 's', 'ž': 'z', 'đ': 'dj'}
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokens(text):
+    text = (text or '').lower()
+    text = ''.join(CYRILLIC_TO_LATIN.get(ch, ch) for ch in text)
+    text = ''.join(DIACRITICS.get(ch, ch) for ch in text)
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(TOKEN_RE.findall(text))
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+        insert = SQLITE_INSERT
+    elif vendor == 'postgresql':
+        for statement in POSTGRES_CREATE:
+            schema_editor.execute(statement)
+        insert = POSTGRES_INSERT
+    else:
+        return
+
+    Offer = apps.get_model('core', 'Offer')
+    offers = Offer.objects.values_list('pk', 'title', 'description', 'offered', 'wanted', 'city')
+    with schema_editor.connection.cursor() as cursor:
+        for pk, title, *body in offers.iterator(chunk_size=500):
+            cursor.execute(insert, [pk, tokens(title), tokens(' '.join(filter(None, body)))])
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_DROP)
+    elif vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:28
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_unread_counters(apps, schema_editor):
+    UserProfile = apps.get_model('core', 'UserProfile')
+    Message = apps.get_model('core', 'Message')
+    Notification = apps.get_model('core', 'Notification')
+
+    def unread(model):
+        rows = (
+            model.objects
+            .filter(recipient=OuterRef('user_id'), is_read=False)
+            .order_by()
+            .values('recipient')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+    UserProfile.objects.update(
+        unread_messages=unread(Message),
+        unread_notifications=unread(Notification),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_conversation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='unread_messages',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_unread_counters, migrations.RunPython.noop),
+    ]
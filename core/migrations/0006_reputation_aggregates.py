@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:29
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Round
+
+
+def fill_reputation(apps, schema_editor):
+    UserProfile = apps.get_model('core', 'UserProfile')
+    Review = apps.get_model('core', 'Review')
+
+    def aggregate(expression):
+        rows = (
+            Review.objects
+            .filter(reviewed_user=OuterRef('user_id'))
+            .order_by()
+            .values('reviewed_user')
+            .annotate(value=expression)
+            .values('value')
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+    UserProfile.objects.update(
+        rating_sum=aggregate(Sum('rating')),
+        rating_count=aggregate(Count('pk')),
+        **{f'rating_{stars}': aggregate(Count('pk', filter=Q(rating=stars))) for stars in range(1, 6)},
+    )
+    UserProfile.objects.filter(rating_count__gt=0).update(
+        rating=Round(Cast('rating_sum', FloatField()) / Cast('rating_count', FloatField()), 1)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_unread_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_reputation, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:44
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def reserve_accepted_offers(apps, schema_editor):
+    """Rezerviši ponude postojećih prihvaćenih razmena (starija razmena ima prednost)"""
+    Trade = apps.get_model('core', 'Trade')
+    OfferReservation = apps.get_model('core', 'OfferReservation')
+
+    expires_at = timezone.now() + timedelta(hours=settings.TRADE_RESERVATION_HOURS)
+    reserved = set()
+    reservations = []
+    accepted = Trade.objects.filter(status='accepted').order_by('updated_at', 'pk')
+    for trade_id, offer1_id, offer2_id in accepted.values_list('pk', 'offer1_id', 'offer2_id').iterator():
+        for offer_id in (offer1_id, offer2_id):
+            if offer_id and offer_id not in reserved:
+                reserved.add(offer_id)
+                reservations.append(OfferReservation(offer_id=offer_id, trade_id=trade_id, expires_at=expires_at))
+    OfferReservation.objects.bulk_create(reservations, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfferReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('offer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reservation', to='core.offer')),
+                ('trade', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='core.trade')),
+            ],
+        ),
+        migrations.RunPython(reserve_accepted_offers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_offer_reservation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['user1', 'status', 'created_at'], name='core_trade_user1_i_2b92fb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['user2', 'status', 'created_at'], name='core_trade_user2_i_1d718b_idx'),
+        ),
+    ]
@@ -1,9 +1,20 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from barter import page_cache
+
+from . import search
+from . import catalog
+from . import counters
+from . import images
+from . import notifications
+from .stats import bump_stats_version
 
 
 class Category(models.Model):
@@ -29,7 +40,7 @@ class Category(models.Model):
 
     @property
     def offer_count(self):
-        return self.offers.filter(is_active=True).count()
+        return catalog.offer_count(self.pk)
 
 
 class Offer(models.Model):
@@ -46,6 +57,8 @@ class Offer(models.Model):
     )
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='offers')
     image = models.ImageField(upload_to='offers/%Y/%m/%d/', blank=True, null=True)
+    # Thumb/medium/large + WebP varijante slike (core.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     price_range = models.CharField(max_length=50, blank=True, null=True)
     location = models.CharField(max_length=100, blank=True, default="Srbija")
     city = models.CharField(max_length=100, blank=True, null=True)
@@ -61,11 +74,19 @@ class Offer(models.Model):
         indexes = [
             models.Index(fields=['is_active', 'created_at']),
             models.Index(fields=['category', 'is_active']),
+            models.Index(fields=['owner', 'created_at']),
         ]
 
     def __str__(self):
         return f"{self.title} ({self.owner.username})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Zapamti učitano stanje da bi signal znao kako da promeni brojeve u katalogu
+        instance._loaded_catalog = (instance.__dict__.get('category_id'), instance.__dict__.get('is_active'))
+        return instance
+
     def get_absolute_url(self):
         return reverse('core:offer_detail', kwargs={'pk': self.pk})
 
@@ -84,6 +105,10 @@ class Offer(models.Model):
     def has_multiple_images(self):
         return False
 
+    @property
+    def image_urls(self):
+        return images.variant_urls(self.image, self.image_variants)
+
 
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
@@ -98,6 +123,7 @@ class Message(models.Model):
         indexes = [
             models.Index(fields=['recipient', 'is_read']),
             models.Index(fields=['timestamp']),
+            models.Index(fields=['sender', 'recipient', 'timestamp']),
         ]
 
     def __str__(self):
@@ -108,6 +134,84 @@ class Message(models.Model):
         return self.body[:100] + '...' if len(self.body) > 100 else self.body
 
 
+class Conversation(models.Model):
+    """Razgovor dva korisnika - denormalizovan pregled za inbox (user_low.id <= user_high.id)"""
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations_low')
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations_high')
+    last_message = models.ForeignKey(
+        Message,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True,
+        blank=True
+    )
+    last_activity = models.DateTimeField()
+    unread_low = models.PositiveIntegerField(default=0)  # Nepročitano za user_low
+    unread_high = models.PositiveIntegerField(default=0)  # Nepročitano za user_high
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-last_activity']
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_conversation_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['user_low', 'last_activity']),
+            models.Index(fields=['user_high', 'last_activity']),
+        ]
+        verbose_name = "Razgovor"
+        verbose_name_plural = "Razgovori"
+
+    def __str__(self):
+        return f"{self.user_low_id} ↔ {self.user_high_id}"
+
+    @staticmethod
+    def pair(user_id, other_id):
+        return (user_id, other_id) if user_id <= other_id else (other_id, user_id)
+
+    @classmethod
+    def for_user(cls, user):
+        """Svi razgovori korisnika, najnoviji prvi"""
+        return cls.objects.filter(models.Q(user_low=user) | models.Q(user_high=user))
+
+    @classmethod
+    def record_message(cls, message):
+        """Ažuriraj razgovor posle nove poruke"""
+        low, high = cls.pair(message.sender_id, message.recipient_id)
+        unread_field = 'unread_low' if message.recipient_id == low else 'unread_high'
+        conversation, created = cls.objects.get_or_create(
+            user_low_id=low,
+            user_high_id=high,
+            defaults={
+                'last_message': message,
+                'last_activity': message.timestamp,
+                unread_field: 1,
+            },
+        )
+        if created:
+            return
+
+        conversations = cls.objects.filter(pk=conversation.pk)
+        conversations.update(**{unread_field: models.F(unread_field) + 1})
+        conversations.filter(last_activity__lte=message.timestamp).update(
+            last_message=message,
+            last_activity=message.timestamp,
+        )
+
+    @classmethod
+    def mark_read(cls, user, other_user):
+        """Resetuj brojač nepročitanih za korisnika u razgovoru"""
+        low, high = cls.pair(user.id, other_user.id)
+        unread_field = 'unread_low' if user.id == low else 'unread_high'
+        cls.objects.filter(user_low_id=low, user_high_id=high).update(**{unread_field: 0})
+
+    def other_user(self, user):
+        return self.user_high if user.id == self.user_low_id else self.user_low
+
+    def unread_for(self, user):
+        return self.unread_low if user.id == self.user_low_id else self.unread_high
+
+
 class Trade(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Čeka odobrenje'),
@@ -142,6 +246,8 @@ class Trade(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['user1', 'status', 'created_at']),
+            models.Index(fields=['user2', 'status', 'created_at']),
         ]
 
     def __str__(self):
@@ -164,15 +270,43 @@ class Trade(models.Model):
         return colors.get(self.status, 'info')
 
 
+class OfferReservation(models.Model):
+    """Ponuda zauzeta prihvaćenom razmenom - najviše jedna rezervacija po ponudi"""
+    offer = models.OneToOneField(Offer, on_delete=models.CASCADE, related_name='reservation')
+    trade = models.ForeignKey(Trade, on_delete=models.CASCADE, related_name='reservations')
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.offer_id} → razmena {self.trade_id} (do {self.expires_at:%d.%m.%Y %H:%M})"
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='userprofile')
     phone = models.CharField(max_length=20, blank=True)
     location = models.CharField(max_length=100, blank=True, default="Srbija")
     bio = models.TextField(max_length=500, blank=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     rating = models.FloatField(default=5.0)
     trades_completed = models.PositiveIntegerField(default=0)
     is_verified = models.BooleanField(default=False)
+    # Denormalizovani brojači (core.counters)
+    unread_messages = models.PositiveIntegerField(default=0)
+    unread_notifications = models.PositiveIntegerField(default=0)
+    # Reputacija - održava se inkrementalno iz signala za Review
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    # Verzija keširanih statistika (core.stats) - raste na promenu ponuda, razmena i recenzija
+    stats_version = models.PositiveIntegerField(default=0)
+    # Periodični pregled nepročitanih notifikacija e-mailom (send_notification_digest)
+    notification_digest = models.BooleanField(default=False)
+    digest_sent_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -182,18 +316,39 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"Profil {self.user.username}"
 
+    @property
+    def avatar_urls(self):
+        return images.variant_urls(self.avatar, self.avatar_variants)
+
     @property
     def average_rating(self):
         """Prosečna ocena korisnika"""
-        reviews = Review.objects.filter(reviewed_user=self.user)
-        if reviews.exists():
-            return round(reviews.aggregate(models.Avg('rating'))['rating__avg'], 1)
+        if self.rating_count:
+            return round(self.rating_sum / self.rating_count, 1)
         return 0.0
 
     @property
     def total_reviews(self):
         """Ukupan broj recenzija"""
-        return Review.objects.filter(reviewed_user=self.user).count()
+        return self.rating_count
+
+    @property
+    def rating_histogram(self):
+        """Broj ocena po zvezdicama, od 5 do 1"""
+        return [(stars, getattr(self, f'rating_{stars}')) for stars in range(5, 0, -1)]
+
+    @classmethod
+    def apply_rating(cls, user_id, rating, sign):
+        """Atomski dodaj (sign=1) ili oduzmi (sign=-1) jednu ocenu iz agregata"""
+        profiles = cls.objects.filter(user_id=user_id)
+        profiles.update(**{
+            'rating_sum': models.F('rating_sum') + sign * rating,
+            'rating_count': models.F('rating_count') + sign,
+            f'rating_{rating}': models.F(f'rating_{rating}') + sign,
+        })
+        profiles.filter(rating_count__gt=0).update(
+            rating=Round(Cast('rating_sum', models.FloatField()) / models.F('rating_count'), 1)
+        )
 
 
 class Review(models.Model):
@@ -235,6 +390,13 @@ class Review(models.Model):
     def __str__(self):
         return f"{self.reviewer.username} → {self.reviewed_user.username}: {self.get_rating_display()}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Zapamti učitane vrednosti da bi signal znao šta da oduzme iz agregata
+        instance._loaded_rating = (instance.__dict__.get('reviewed_user_id'), instance.__dict__.get('rating'))
+        return instance
+
     def get_rating_display(self):
         return dict(self.RATING_CHOICES).get(self.rating, '')
 
@@ -269,6 +431,9 @@ class Notification(models.Model):
     trade = models.ForeignKey(Trade, on_delete=models.CASCADE, blank=True, null=True, related_name='notifications')
 
     is_read = models.BooleanField(default=False)
+    # Spojeni događaji istog tipa za isti objekat (core.notifications.COALESCE_TYPES)
+    count = models.PositiveIntegerField(default=1)
+    group_key = models.CharField(max_length=255, blank=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -277,6 +442,15 @@ class Notification(models.Model):
         indexes = [
             models.Index(fields=['recipient', 'is_read']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['recipient', 'created_at']),
+        ]
+        constraints = [
+            # Cilj ON CONFLICT upsert-a - najviše jedna nepročitana po grupi
+            models.UniqueConstraint(
+                fields=['group_key'],
+                condition=models.Q(is_read=False),
+                name='core_notification_unread_group',
+            ),
         ]
         verbose_name = "Notifikacija"
         verbose_name_plural = "Notifikacije"
@@ -284,6 +458,14 @@ class Notification(models.Model):
     def __str__(self):
         return f"{self.get_notification_type_display()} → {self.recipient.username}"
 
+    @property
+    def text(self):
+        """Poruka za prikaz; spojena notifikacija prikazuje ukupan broj događaja"""
+        template = notifications.COALESCE_TYPES.get(self.notification_type)
+        if template and self.count > 1:
+            return template.format(count=self.count)
+        return self.message
+
     @property
     def is_recent(self):
         """Da li je notifikacija novija od 24 sata"""
@@ -292,6 +474,43 @@ class Notification(models.Model):
         return self.created_at >= timezone.now() - timedelta(hours=24)
 
 
+class Job(models.Model):
+    """Posao u lokalnom redu (core.jobs) - izvršava ga manage.py run_workers"""
+    STATUS_CHOICES = [
+        ('pending', 'Čeka'),
+        ('running', 'U toku'),
+        ('failed', 'Neuspešan'),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Isti (task, dedup_key) se ne upisuje ponovo dok posao čeka
+    dedup_key = models.CharField(max_length=255, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['task', 'dedup_key'],
+                condition=models.Q(status='pending'),
+                name='core_job_pending_dedup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.get_status_display()})"
+
+
 # ============================================
 # SIGNALI - Automatske akcije
 # ============================================
@@ -304,6 +523,33 @@ def save_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 
+@receiver(post_save, sender=Message)
+def update_conversation(sender, instance, created, **kwargs):
+    """Održavaj denormalizovan razgovor za inbox"""
+    if created:
+        Conversation.record_message(instance)
+        counters.adjust(instance.recipient_id, messages=1)
+
+
+@receiver(post_delete, sender=Message)
+def release_message_counter(sender, instance, **kwargs):
+    if not instance.is_read:
+        counters.adjust(instance.recipient_id, messages=-1)
+
+
+@receiver(post_save, sender=Notification)
+def update_notification_counter(sender, instance, created, **kwargs):
+    """Uvećaj brojač nepročitanih notifikacija"""
+    if created and not instance.is_read:
+        counters.adjust(instance.recipient_id, notifications=1)
+
+
+@receiver(post_delete, sender=Notification)
+def release_notification_counter(sender, instance, **kwargs):
+    if not instance.is_read:
+        counters.adjust(instance.recipient_id, notifications=-1)
+
+
 @receiver(post_save, sender=Offer)
 def update_offer_slug(sender, instance, created, **kwargs):
     """Automatski generiši slug kada se kreirа nova ponuda"""
@@ -312,59 +558,152 @@ def update_offer_slug(sender, instance, created, **kwargs):
         instance.save(update_fields=['slug'])
 
 
+SEARCH_FIELDS = {'title', 'description', 'offered', 'wanted', 'city'}
+
+
+@receiver(post_save, sender=Offer)
+def update_offer_search_index(sender, instance, created, update_fields=None, **kwargs):
+    """Inkrementalno ažuriraj indeks pretrage kada se promeni tekst ponude"""
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    search.index_offer(instance)
+
+
+@receiver(post_delete, sender=Offer)
+def remove_offer_search_index(sender, instance, **kwargs):
+    """Izbaci obrisanu ponudu iz indeksa pretrage"""
+    search.remove_offer(instance.pk)
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def invalidate_offer_owner_stats(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'is_active' in update_fields:
+        bump_stats_version(instance.owner_id)
+
+
+CATALOG_FIELDS = {'category', 'category_id', 'is_active'}
+
+
+@receiver(post_save, sender=Offer)
+def update_catalog_offer_count(sender, instance, created, update_fields=None, **kwargs):
+    """Inkrementalno promeni broj aktivnih ponuda po kategoriji"""
+    if update_fields is not None and not CATALOG_FIELDS.intersection(update_fields):
+        return
+    loaded = getattr(instance, '_loaded_catalog', None)
+    current = (instance.category_id, instance.is_active)
+    if not created and (loaded is None or None in loaded):
+        # Prethodno stanje nije poznato (npr. odložena polja) - brojevi se preračunavaju
+        catalog.bump_version()
+    elif loaded != current:
+        if loaded and loaded[1]:
+            catalog.adjust_count(loaded[0], -1)
+        if instance.is_active:
+            catalog.adjust_count(instance.category_id, 1)
+    instance._loaded_catalog = current
+
+
+@receiver(post_delete, sender=Offer)
+def release_catalog_offer_count(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_catalog', None)
+    if loaded is None or None in loaded:
+        loaded = (instance.category_id, instance.is_active)
+    if loaded[1]:
+        catalog.adjust_count(loaded[0], -1)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog(sender, instance, **kwargs):
+    catalog.bump_version()
+    page_cache.purge('catalog')
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def purge_offer_pages(sender, instance, **kwargs):
+    page_cache.purge(f'offer:{instance.pk}', 'offers')
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def purge_review_pages(sender, instance, **kwargs):
+    page_cache.purge(f'offer:{instance.offer_id}', f'user:{instance.reviewed_user_id}')
+
+
+@receiver(post_save, sender=UserProfile)
+def purge_profile_pages(sender, instance, **kwargs):
+    page_cache.purge(f'user:{instance.user_id}')
+
+
+@receiver(post_save, sender=Trade)
+@receiver(post_delete, sender=Trade)
+def invalidate_trade_user_stats(sender, instance, **kwargs):
+    bump_stats_version(instance.user1_id, instance.user2_id)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviewed_user_stats(sender, instance, **kwargs):
+    bump_stats_version(instance.reviewed_user_id)
+
+
 @receiver(post_save, sender=Review)
 def update_user_rating(sender, instance, created, **kwargs):
-    """Ažuriraj prosečnu ocenu korisnika kada se doda nova recenzija"""
+    """Ažuriraj reputaciju korisnika kada se doda ili izmeni recenzija"""
+    current = (instance.reviewed_user_id, instance.rating)
+    loaded = getattr(instance, '_loaded_rating', None)
+    if created or loaded != current:
+        if not created and loaded and loaded[1]:
+            UserProfile.apply_rating(loaded[0], loaded[1], -1)
+        UserProfile.apply_rating(instance.reviewed_user_id, instance.rating, 1)
+        instance._loaded_rating = current
+
     if created:
-        # Ažuriraj rating u UserProfile-u
-        user_profile = instance.reviewed_user.userprofile
-        avg_rating = user_profile.average_rating
-        if avg_rating > 0:
-            user_profile.rating = avg_rating
-            user_profile.save(update_fields=['rating'])
-
-        # Kreiraj notifikaciju za recenziju
-        Notification.objects.create(
-            recipient=instance.reviewed_user,
-            actor=instance.reviewer,
+        # Notifikacija za recenziju ide u red (core.notifications)
+        notifications.notify(
+            recipient_id=instance.reviewed_user_id,
+            actor_id=instance.reviewer_id,
             notification_type='review',
             title=f"Nova recenzija od {instance.reviewer.username}",
             message=f"{instance.reviewer.username} vam je dao ocenu: {instance.get_rating_display()}",
-            offer=instance.offer,
+            offer_id=instance.offer_id,
         )
 
 
+@receiver(post_delete, sender=Review)
+def remove_user_rating(sender, instance, **kwargs):
+    """Oduzmi obrisanu recenziju iz reputacije"""
+    reviewed_user_id, rating = getattr(instance, '_loaded_rating', (instance.reviewed_user_id, instance.rating))
+    if rating:
+        UserProfile.apply_rating(reviewed_user_id, rating, -1)
+
+
 @receiver(post_save, sender=Trade)
 def create_trade_notification(sender, instance, created=False, **kwargs):
-    """Kreiraj notifikaciju za zahtev za razmenu"""
+    """Notifikacija za novi zahtev (prelaze stanja javlja core.trades)"""
     if created:
-        Notification.objects.create(
-            recipient=instance.user2,
-            actor=instance.user1,
+        notifications.notify(
+            recipient_id=instance.user2_id,
+            actor_id=instance.user1_id,
             notification_type='trade_request',
             title=f"Zahtev za razmenu od {instance.user1.username}",
             message=f"{instance.user1.username} je poslao zahtev za razmenu: {instance.offer2.title}",
-            trade=instance,
-        )
-    elif instance.status == 'accepted':
-        # Notifikacija za prihvatenu razmenu
-        Notification.objects.create(
-            recipient=instance.user1,
-            actor=instance.user2,
-            notification_type='trade_accepted',
-            title=f"Razmena prihvaćena od {instance.user2.username}",
-            message=f"{instance.user2.username} je prihvatio vašu razmenu!",
-            trade=instance,
-        )
-    elif instance.status == 'rejected':
-        # Notifikacija za odbijena razmena
-        Notification.objects.create(
-            recipient=instance.user1,
-            actor=instance.user2,
-            notification_type='trade_rejected',
-            title=f"Razmena odbijena od {instance.user2.username}",
-            message=f"{instance.user2.username} je odbio vašu razmenu.",
-            trade=instance,
+            trade_id=instance.pk,
         )
 
 icon = models.CharField(max_length=50, default='fa-circle', blank=True)
+
+
+@receiver(post_save, sender=Offer)
+def schedule_offer_image_variants(sender, instance, update_fields=None, **kwargs):
+    """Nove varijante kada se slika ponude promeni"""
+    if (update_fields is None or 'image' in update_fields) and images.is_stale(instance, 'image'):
+        images.schedule(instance, 'image')
+
+
+@receiver(post_save, sender=UserProfile)
+def schedule_avatar_variants(sender, instance, update_fields=None, **kwargs):
+    """Nove varijante kada se avatar promeni"""
+    if (update_fields is None or 'avatar' in update_fields) and images.is_stale(instance, 'avatar'):
+        images.schedule(instance, 'avatar')
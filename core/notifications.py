@@ -0,0 +1,231 @@
+"""
+Servis notifikacija.
+
+notify() ne upisuje notifikaciju u request-u nego stavlja događaj u red
+poslova (core.jobs) u okviru tekuće transakcije, pa razmene, recenzije i
+poruke ne čekaju na fan-out. Worker (manage.py run_workers) isporučuje
+događaje u serijama: bulk INSERT po NOTIFICATIONS_BATCH_SIZE redova i jedna
+promena brojača nepročitanih po primaocu.
+
+Događaji se de-dupliciraju po (primalac, tip, objekat, akter) - u redu
+preko dedup_key i unutar serije - pa isti događaj prijavljen dva puta daje
+jednu notifikaciju, a isti tip od dva različita aktera dve.
+
+Česti tipovi (COALESCE_TYPES) se ne de-dupliciraju nego spajaju: događaji
+za isti (primalac, tip, objekat) u prozoru NOTIFICATIONS_COALESCE_WINDOW
+postaju jedan nepročitan red sa brojačem count ("pregledana 5 puta"), preko
+INSERT ... ON CONFLICT (group_key) DO UPDATE. Broj redova tako raste sa
+brojem različitih događaja, a ne sa brojem pregleda.
+
+send_digests() korisnicima koji su to uključili (UserProfile.notification_digest)
+šalje e-mailom sažetak nepročitanih notifikacija po tipu od poslednjeg pregleda.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.db import connection
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from . import counters
+from . import jobs
+
+DELIVER_TASK = 'notifications.deliver'
+FIELDS = ('recipient_id', 'actor_id', 'notification_type', 'title', 'message', 'offer_id', 'trade_id', 'count')
+
+# Tip -> poruka spojene notifikacije
+COALESCE_TYPES = {
+    'offer_viewed': 'Vaša ponuda je pregledana {count} puta.',
+    'offer_liked': '{count} korisnika je dodalo vašu ponudu u omiljene.',
+}
+
+
+def _object(event):
+    if event.get('trade_id'):
+        return f"trade:{event['trade_id']}"
+    if event.get('offer_id'):
+        return f"offer:{event['offer_id']}"
+    return ''
+
+
+def dedup_key(event):
+    """Ključ događaja: (primalac, tip, objekat, akter) - isti samo za istu prijavu"""
+    return f"{event['recipient_id']}:{event['notification_type']}:{_object(event)}:{event.get('actor_id') or ''}"
+
+
+def group_key(event, now):
+    """Ključ spajanja: (primalac, tip, objekat) i vremenski prozor, bez aktera"""
+    window = int(now.timestamp()) // settings.NOTIFICATIONS_COALESCE_WINDOW
+    return f"{event['recipient_id']}:{event['notification_type']}:{_object(event)}:{window}"
+
+
+def notify(recipient_id, notification_type, title, message, actor_id=None, offer_id=None, trade_id=None, count=1):
+    """Zakaži jednu notifikaciju"""
+    notify_many([{
+        'recipient_id': recipient_id,
+        'actor_id': actor_id,
+        'notification_type': notification_type,
+        'title': title,
+        'message': message,
+        'offer_id': offer_id,
+        'trade_id': trade_id,
+        'count': count,
+    }])
+
+
+def notify_many(events):
+    """Zakaži više notifikacija (rečnici sa poljima iz FIELDS) jednim upisom u red"""
+    events = [{field: event.get(field) for field in FIELDS} for event in events]
+    for event in events:
+        event['count'] = event['count'] or 1
+    if events:
+        # Događaji koji se spajaju ne smeju da se izgube kao duplikati u redu
+        jobs.enqueue_many(DELIVER_TASK, [
+            (event, None if event['notification_type'] in COALESCE_TYPES else dedup_key(event))
+            for event in events
+        ])
+
+
+def _existing(model, ids):
+    ids = {pk for pk in ids if pk}
+    return set(model.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+
+
+def _deliverable(events):
+    """Samo događaji čiji primalac, akter, ponuda i razmena još postoje"""
+    from django.contrib.auth.models import User
+    from .models import Offer, Trade
+
+    users = _existing(User, [e['recipient_id'] for e in events] + [e['actor_id'] for e in events])
+    offers = _existing(Offer, [e['offer_id'] for e in events])
+    trades = _existing(Trade, [e['trade_id'] for e in events])
+    return [
+        event for event in events
+        if event['recipient_id'] in users
+        and (not event['actor_id'] or event['actor_id'] in users)
+        and (not event['offer_id'] or event['offer_id'] in offers)
+        and (not event['trade_id'] or event['trade_id'] in trades)
+    ]
+
+
+def _coalesce(events, now):
+    """Spoji događaje iste grupe u seriji (zbir count-a, poslednji akter)"""
+    groups = {}
+    for event in events:
+        key = group_key(event, now)
+        if key in groups:
+            groups[key]['count'] += event['count']
+            groups[key]['actor_id'] = event['actor_id'] or groups[key]['actor_id']
+        else:
+            groups[key] = dict(event, group_key=key)
+    return list(groups.values())
+
+
+def _upsert(rows, now):
+    """
+    Upiši spojene notifikacije ili uvećaj count postojećoj nepročitanoj.
+
+    Vraća primaoce novih redova (samo oni menjaju brojač nepročitanih).
+    """
+    from .models import Notification
+
+    if not rows:
+        return []
+    q = connection.ops.quote_name
+    table = q(Notification._meta.db_table)
+    existing = set(
+        Notification.objects.filter(group_key__in=[row['group_key'] for row in rows], is_read=False)
+        .values_list('group_key', flat=True)
+    )
+    columns = FIELDS + ('group_key', 'is_read', 'created_at', 'updated_at')
+    sql = (
+        f'INSERT INTO {table} ({", ".join(q(column) for column in columns)}) '
+        f'VALUES ({", ".join(["%s"] * len(columns))}) '
+        f'ON CONFLICT ({q("group_key")}) WHERE NOT {q("is_read")} DO UPDATE SET '
+        f'{q("count")} = {table}.{q("count")} + EXCLUDED.{q("count")}, '
+        f'{q("actor_id")} = COALESCE(EXCLUDED.{q("actor_id")}, {table}.{q("actor_id")}), '
+        f'{q("updated_at")} = EXCLUDED.{q("updated_at")}'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [row[field] for field in FIELDS] + [row['group_key'], False, now, now]
+            for row in rows
+        ])
+    return [row['recipient_id'] for row in rows if row['group_key'] not in existing]
+
+
+@jobs.task(DELIVER_TASK)
+def deliver(events):
+    """Upiši notifikacije u serijama; preskoči duplikate i događaje obrisanih objekata"""
+    from .models import Notification
+
+    now = timezone.now()
+    events = _deliverable([
+        {field: event.get(field) for field in FIELDS} | {'count': event.get('count') or 1}
+        for event in events
+    ])
+    coalesced = _coalesce([e for e in events if e['notification_type'] in COALESCE_TYPES], now)
+
+    unique = {}
+    for event in events:
+        if event['notification_type'] not in COALESCE_TYPES:
+            unique.setdefault(dedup_key(event), event)
+    rows = [Notification(**event) for event in unique.values()]
+
+    Notification.objects.bulk_create(rows, batch_size=settings.NOTIFICATIONS_BATCH_SIZE)
+    created = Counter(row.recipient_id for row in rows)
+    created.update(_upsert(coalesced, now))
+    for recipient_id, total in created.items():
+        counters.adjust(recipient_id, notifications=total)
+    return sum(created.values())
+
+
+def digest_rows(now=None):
+    """Nepročitano po (primalac, tip) od poslednjeg pregleda - jedan agregatni upit"""
+    from .models import Notification
+
+    now = now or timezone.now()
+    return (
+        Notification.objects
+        .filter(is_read=False, recipient__userprofile__notification_digest=True, updated_at__lte=now)
+        .filter(
+            Q(recipient__userprofile__digest_sent_at__isnull=True)
+            | Q(updated_at__gt=F('recipient__userprofile__digest_sent_at'))
+        )
+        .exclude(recipient__email='')
+        .values('recipient_id', 'recipient__username', 'recipient__email', 'notification_type')
+        .annotate(items=Count('pk'), events=Sum('count'))
+        .order_by('recipient_id', 'notification_type')
+    )
+
+
+def send_digests(now=None, dry_run=False):
+    """Pošalji sažetke i zabeleži vreme slanja; vraća broj korisnika"""
+    from .models import Notification, UserProfile
+
+    now = now or timezone.now()
+    labels = dict(Notification.NOTIFICATION_TYPES)
+    digests = {}
+    for row in digest_rows(now).iterator():
+        digest = digests.setdefault(row['recipient_id'], {
+            'username': row['recipient__username'], 'email': row['recipient__email'], 'lines': [],
+        })
+        digest['lines'].append(f"• {labels.get(row['notification_type'], row['notification_type'])}: {row['events']}")
+
+    if dry_run or not digests:
+        return len(digests)
+
+    send_mass_mail([
+        (
+            'Pregled nepročitanih notifikacija - BarterApp',
+            f"Zdravo {digest['username']},\n\nod poslednjeg pregleda imaš nepročitano:\n\n"
+            + '\n'.join(digest['lines']),
+            None,
+            [digest['email']],
+        )
+        for digest in digests.values()
+    ], fail_silently=False)
+    UserProfile.objects.filter(user_id__in=list(digests)).update(digest_sent_at=now)
+    return len(digests)
+
@@ -0,0 +1,156 @@
+"""
+Keyset (cursor) paginacija.
+
+Umesto COUNT(*) + OFFSET, stranica se čita sa WHERE (created_at, id) < (kursor)
+preko postojećih indeksa i uzima se jedan red više da bi se znalo da li postoji
+sledeća strana. Kursor je neproziran base64 token sa vrednostima ključeva
+poslednjeg (ili prvog) reda na strani.
+"""
+import base64
+import datetime
+import json
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+
+
+class CursorPage:
+    """Jedna strana rezultata sa tokenima za prethodnu i sledeću stranu"""
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class CursorPaginator:
+    """
+    Paginator po jedinstvenom, sortiranom ključu, npr. ('-created_at', '-id').
+
+    Polja iz .extra(select=...) (npr. search_rank iz core.search) su podržana,
+    pa se i rangirani rezultati pretrage listaju bez OFFSET-a. Radi i nad
+    .values() upitima (redovi su rečnici).
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    # ---------- kursor ----------
+
+    def encode_cursor(self, direction, obj):
+        values = []
+        for name, _ in self.ordering:
+            value = obj[name] if isinstance(obj, dict) else getattr(obj, name)
+            if isinstance(value, datetime.datetime):
+                value = value.isoformat()
+            values.append(value)
+        payload = json.dumps([direction, values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if direction not in ('next', 'prev') or len(values) != len(self.ordering):
+                return None
+            return direction, [self._to_python(name, value) for (name, _), value in zip(self.ordering, values)]
+        except (ValueError, TypeError, ValidationError):
+            # Ručno napravljen kursor sa pogrešnim vrednostima je samo neispravan kursor
+            return None
+
+    def _to_python(self, name, value):
+        if name in self.queryset.query.extra:
+            return float(value)
+        return self.queryset.model._meta.get_field(name).to_python(value)
+
+    # ---------- upit ----------
+
+    def _ordered(self, reverse):
+        order = []
+        for name, descending in self.ordering:
+            descending = descending != reverse
+            order.append(f'-{name}' if descending else name)
+        return self.queryset.order_by(*order)
+
+    def _seek(self, queryset, values, reverse):
+        """Zadrži samo redove posle (ili pre, ako je reverse) datih vrednosti ključa"""
+        extra = self.queryset.query.extra
+        if any(name in extra for name, _ in self.ordering):
+            return self._seek_sql(queryset, values, reverse)
+
+        conditions = []
+        for i, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            equal = {prev_name: values[j] for j, (prev_name, _) in enumerate(self.ordering[:i])}
+            conditions.append(Q(**equal, **{f'{name}__{lookup}': values[i]}))
+        return queryset.filter(reduce(lambda a, b: a | b, conditions))
+
+    def _seek_sql(self, queryset, values, reverse):
+        extra = self.queryset.query.extra
+        table = connection.ops.quote_name(self.queryset.model._meta.db_table)
+
+        expressions = []
+        for name, _ in self.ordering:
+            if name in extra:
+                sql, params = extra[name]
+                expressions.append((f'({sql})', list(params)))
+            else:
+                column = self.queryset.model._meta.get_field(name).column
+                expressions.append((f'{table}.{connection.ops.quote_name(column)}', []))
+
+        clauses, params = [], []
+        for i, (name, descending) in enumerate(self.ordering):
+            operator = '<' if descending != reverse else '>'
+            parts = []
+            for j in range(i):
+                sql, expr_params = expressions[j]
+                parts.append(f'{sql} = %s')
+                params.extend(expr_params + [values[j]])
+            sql, expr_params = expressions[i]
+            parts.append(f'{sql} {operator} %s')
+            params.extend(expr_params + [values[i]])
+            clauses.append('(' + ' AND '.join(parts) + ')')
+        return queryset.extra(where=['(' + ' OR '.join(clauses) + ')'], params=params)
+
+    def get_page(self, cursor=None):
+        """Strana za dati kursor; neispravan ili prazan kursor daje prvu stranu"""
+        decoded = self.decode_cursor(cursor) if cursor else None
+        direction, values = decoded if decoded else ('next', None)
+        reverse = direction == 'prev'
+
+        queryset = self._ordered(reverse)
+        if values is not None:
+            queryset = self._seek(queryset, values, reverse)
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        return CursorPage(
+            rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=self.encode_cursor('next', rows[-1]) if has_next and rows else None,
+            previous_cursor=self.encode_cursor('prev', rows[0]) if has_previous and rows else None,
+        )
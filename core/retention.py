@@ -0,0 +1,153 @@
+"""
+Politika čuvanja notifikacija i poruka.
+
+Svaka politika (POLICIES) određuje koji redovi zastarevaju i posle koliko
+dana (podešavanje RETENTION_*_DAYS, 0 = isključeno). manage.py purge_expired
+ih briše u ograničenim serijama po indeksu vremena (najstariji prvo), sa
+pauzom između serija, pa može da radi i dok sajt ima saobraćaj. Sa arhivom
+se redovi serije prvo upišu u gzip JSONL fajl, pa tek onda brišu.
+
+Brisanje je jedan DELETE po seriji, bez signala; brojači nepročitanih se
+zato ispravljaju eksplicitno za obrisane nepročitane notifikacije, a
+poslednja poruka razgovora (Conversation.last_message) se nikad ne briše.
+"""
+import gzip
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from barter.metrics import registry
+
+from . import counters
+from .notifications import COALESCE_TYPES
+
+
+@dataclass(frozen=True)
+class Policy:
+    name: str
+    model: str
+    time_field: str
+    condition: Q
+    setting: str
+
+    def get_model(self):
+        return apps.get_model(self.model)
+
+    @property
+    def days(self):
+        return getattr(settings, self.setting)
+
+    def queryset(self, now):
+        """Zastareli redovi, najstariji prvo (po indeksu vremena)"""
+        model = self.get_model()
+        cutoff = now - timedelta(days=self.days)
+        rows = model.objects.filter(self.condition, **{f'{self.time_field}__lt': cutoff})
+        if model._meta.label == 'core.Message':
+            conversations = apps.get_model('core.Conversation').objects.filter(last_message__isnull=False)
+            rows = rows.exclude(pk__in=conversations.values('last_message'))
+        return rows.order_by(self.time_field, 'pk')
+
+
+POLICIES = [
+    Policy('notifications_activity', 'core.Notification', 'created_at',
+           Q(notification_type__in=list(COALESCE_TYPES)), 'RETENTION_NOTIFICATIONS_ACTIVITY_DAYS'),
+    Policy('notifications_read', 'core.Notification', 'created_at',
+           Q(is_read=True), 'RETENTION_NOTIFICATIONS_READ_DAYS'),
+    Policy('notifications_unread', 'core.Notification', 'created_at',
+           Q(is_read=False), 'RETENTION_NOTIFICATIONS_UNREAD_DAYS'),
+    Policy('messages_read', 'core.Message', 'timestamp',
+           Q(is_read=True), 'RETENTION_MESSAGES_READ_DAYS'),
+]
+
+
+def get_policy(name):
+    return next(policy for policy in POLICIES if policy.name == name)
+
+
+def count_expired(policy, now=None):
+    if not policy.days:
+        return 0
+    return policy.queryset(now or timezone.now()).count()
+
+
+class Archive:
+    """gzip JSONL arhiva jedne politike; svaka serija se flush-uje pre brisanja"""
+
+    def __init__(self, directory, policy, now):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{policy.name}-{now:%Y%m%dT%H%M%S}.jsonl.gz')
+        self.file = gzip.open(self.path, 'at', encoding='utf-8')
+
+    def write(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def _delete(model, ids):
+    """DELETE ... WHERE id IN (...) bez učitavanja objekata i signala"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(ids))})', ids)
+        return cursor.rowcount
+
+
+def purge(policy, batch_size=1000, sleep=0.1, archive_dir=None, max_batches=None, now=None, progress=None):
+    """Obriši zastarele redove politike u serijama; vraća broj obrisanih"""
+    if not policy.days:
+        return 0
+    model = policy.get_model()
+    now = now or timezone.now()
+    archive = Archive(archive_dir, policy, now) if archive_dir else None
+    is_notification = model._meta.label == 'core.Notification'
+
+    deleted = batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            ids = list(policy.queryset(now).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+
+            with transaction.atomic():
+                batch = model.objects.filter(pk__in=ids)
+                if archive:
+                    archive.write(batch.order_by(policy.time_field, 'pk').values().iterator())
+                unread = []
+                if is_notification:
+                    unread = list(
+                        batch.filter(is_read=False).order_by().values('recipient_id')
+                        .annotate(total=Count('pk')).values_list('recipient_id', 'total')
+                    )
+                count = _delete(model, ids)
+                for recipient_id, total in unread:
+                    counters.adjust(recipient_id, notifications=-total)
+
+            deleted += count
+            batches += 1
+            registry.inc('barter_retention_purged_total', count, policy=policy.name)
+            if progress:
+                progress(policy, deleted)
+            if len(ids) < batch_size:
+                break
+            if sleep:
+                time.sleep(sleep)
+    finally:
+        if archive:
+            archive.close()
+    return deleted
+
+
+registry.counter('barter_retention_purged_total', 'Obrisani zastareli redovi', ('policy',))
@@ -0,0 +1,218 @@
+"""
+Pretraga ponuda - invertovani indeks nad tekstom ponude.
+
+Tekst se pre indeksiranja normalizuje (ćirilica -> latinica, č/ć/š/ž/đ -> c/c/s/z/dj),
+pa "Бицикл", "bicikl" i "bićikl" nalaze iste ponude. Backend se bira prema bazi:
+SQLite koristi FTS5 tabelu sa bm25() rangiranjem, PostgreSQL tsvector + GIN indeks
+sa ts_rank_cd(), a za ostale baze ostaje stari icontains filter.
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'ђ': 'đ', 'е': 'e', 'ж': 'ž',
+    'з': 'z', 'и': 'i', 'ј': 'j', 'к': 'k', 'л': 'l', 'љ': 'lj', 'м': 'm', 'н': 'n',
+    'њ': 'nj', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'ћ': 'ć', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'c', 'ч': 'č', 'џ': 'dž', 'ш': 'š',
+}
+
+DIACRITICS = {'č': 'c', 'ć': 'c', 'š': 's', 'ž': 'z', 'đ': 'dj'}
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Naslov nosi najveću težinu pri rangiranju
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+
+def normalize(text):
+    """Svedi tekst na mala latinična slova bez dijakritika"""
+    text = (text or '').lower()
+    text = ''.join(CYRILLIC_TO_LATIN.get(ch, ch) for ch in text)
+    text = ''.join(DIACRITICS.get(ch, ch) for ch in text)
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    """Normalizovani tokeni teksta"""
+    return TOKEN_RE.findall(normalize(text))
+
+
+def offer_document(offer):
+    """(naslov, telo) koji se indeksiraju za ponudu"""
+    body = ' '.join(filter(None, [offer.description, offer.offered, offer.wanted, offer.city]))
+    return ' '.join(tokenize(offer.title)), ' '.join(tokenize(body))
+
+
+# ==================== BACKENDS ====================
+
+class SimpleSearchBackend:
+    """Bez indeksa - icontains nad kolonama ponude (rezervna varijanta)"""
+
+    def create_schema(self, schema_editor):
+        pass
+
+    def drop_schema(self, schema_editor):
+        pass
+
+    def index(self, offer_id, title, body):
+        pass
+
+    def index_many(self, rows):
+        pass
+
+    def remove(self, offer_id):
+        pass
+
+    def search(self, queryset, query):
+        for token in query.split():
+            queryset = queryset.filter(
+                Q(title__icontains=token) |
+                Q(description__icontains=token) |
+                Q(offered__icontains=token) |
+                Q(wanted__icontains=token)
+            )
+        return queryset.extra(select={'search_rank': '0'})
+
+
+class SQLiteSearchBackend:
+    """FTS5 virtuelna tabela; rowid je id ponude"""
+    table = 'core_offer_fts'
+
+    def create_schema(self, schema_editor):
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+            f"USING fts5(title, body, tokenize='unicode61')"
+        )
+
+    def drop_schema(self, schema_editor):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def index(self, offer_id, title, body):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [offer_id])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, title, body) VALUES (%s, %s, %s)",
+                [offer_id, title, body],
+            )
+
+    def index_many(self, rows):
+        """Grupno indeksiranje [(offer_id, title, body), ...]"""
+        rows = list(rows)
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [[row[0]] for row in rows])
+            cursor.executemany(f"INSERT INTO {self.table} (rowid, title, body) VALUES (%s, %s, %s)", rows)
+
+    def remove(self, offer_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [offer_id])
+
+    def search(self, queryset, query):
+        match = ' '.join(f'"{token}"*' for token in tokenize(query))
+        offer_table = queryset.model._meta.db_table
+        return queryset.extra(
+            select={'search_rank': f'-bm25({self.table}, {TITLE_WEIGHT}, {BODY_WEIGHT})'},
+            tables=[self.table],
+            where=[f'{self.table} MATCH %s', f'{self.table}.rowid = {offer_table}.id'],
+            params=[match],
+        )
+
+
+class PostgresSearchBackend:
+    """Tabela sa tsvector kolonom i GIN indeksom"""
+    table = 'core_offer_search'
+
+    def create_schema(self, schema_editor):
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            f"offer_id bigint PRIMARY KEY REFERENCES core_offer (id) ON DELETE CASCADE, "
+            f"vector tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_vector_gin ON {self.table} USING GIN (vector)"
+        )
+
+    def drop_schema(self, schema_editor):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    upsert = (
+        f"INSERT INTO {table} (offer_id, vector) VALUES "
+        f"(%s, setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'D')) "
+        f"ON CONFLICT (offer_id) DO UPDATE SET vector = EXCLUDED.vector"
+    )
+
+    def index(self, offer_id, title, body):
+        with connection.cursor() as cursor:
+            cursor.execute(self.upsert, [offer_id, title, body])
+
+    def index_many(self, rows):
+        """Grupno indeksiranje [(offer_id, title, body), ...]"""
+        with connection.cursor() as cursor:
+            cursor.executemany(self.upsert, list(rows))
+
+    def remove(self, offer_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE offer_id = %s", [offer_id])
+
+    def search(self, queryset, query):
+        tsquery = ' & '.join(f'{token}:*' for token in tokenize(query))
+        offer_table = queryset.model._meta.db_table
+        # Normalizacija 32 -> rank / (rank + 1), slično bm25 zasićenju
+        return queryset.extra(
+            select={'search_rank': f"ts_rank_cd({self.table}.vector, to_tsquery('simple', %s), 32)"},
+            select_params=[tsquery],
+            tables=[self.table],
+            where=[f"{self.table}.vector @@ to_tsquery('simple', %s)", f'{self.table}.offer_id = {offer_table}.id'],
+            params=[tsquery],
+        )
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backend = None
+
+
+def backend_for(conn):
+    """Backend koji odgovara datoj konekciji"""
+    return BACKENDS.get(conn.vendor, SimpleSearchBackend)()
+
+
+def get_backend():
+    """Aktivni backend (SEARCH_BACKEND u settings-u ili prema bazi)"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SEARCH_BACKEND', None)
+        _backend = import_string(path)() if path else backend_for(connection)
+    return _backend
+
+
+# ==================== API ====================
+
+def index_offer(offer):
+    """Ažuriraj indeks za jednu ponudu"""
+    get_backend().index(offer.pk, *offer_document(offer))
+
+
+def remove_offer(offer_id):
+    """Izbaci ponudu iz indeksa"""
+    get_backend().remove(offer_id)
+
+
+def search_offers(queryset, query):
+    """
+    Filtriraj queryset ponuda po upitu i dodaj search_rank (veći = relevantnije).
+    Rezultati su sortirani po rangu pa po datumu.
+    """
+    if not tokenize(query):
+        return queryset
+    return get_backend().search(queryset, query).order_by('-search_rank', '-created_at')
@@ -0,0 +1,447 @@
+"""
+Generator determinističkih podataka za marketplace (benchmark, load test).
+
+Isti seed daje iste korisnike, ponude, poruke, razmene, recenzije i
+notifikacije. Redovi se generišu u toku (generatori) i upisuju u grupama -
+COPY na PostgreSQL-u, bulk_create na ostalim bazama - bez signala, pa je
+memorija ograničena veličinom grupe i nizovima id-jeva. Posle upisa se
+jednom preračunavaju izvedeni podaci: indeks pretrage, razgovori, brojači
+nepročitanih i reputacija.
+"""
+import io
+import json
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import partial
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models, transaction
+from django.db.models.fields import AutoFieldMixin
+from django.utils import timezone
+from django.utils.text import slugify
+
+from barter import page_cache
+
+from . import catalog
+from .models import Category, Message, Notification, Offer, Review, Trade, UserProfile
+from .search import normalize
+
+SEED_PASSWORD = 'barter-seed'
+
+SCALES = {
+    'small': {'users': 50, 'offers': 300, 'messages': 1500, 'trades': 200, 'reviews': 150, 'notifications': 800},
+    'medium': {'users': 500, 'offers': 5000, 'messages': 25000, 'trades': 3000, 'reviews': 2000, 'notifications': 15000},
+    'large': {'users': 5000, 'offers': 60000, 'messages': 300000, 'trades': 40000, 'reviews': 25000, 'notifications': 200000},
+    'production': {'users': 200000, 'offers': 1500000, 'messages': 6000000, 'trades': 800000, 'reviews': 400000, 'notifications': 4000000},
+}
+
+# Grad i relativna težina (približno po broju stanovnika)
+CITIES = [
+    ('Beograd', 30), ('Novi Sad', 10), ('Niš', 7), ('Kragujevac', 5), ('Subotica', 4),
+    ('Zrenjanin', 3), ('Pančevo', 3), ('Čačak', 3), ('Kraljevo', 3), ('Novi Pazar', 3),
+    ('Kruševac', 3), ('Leskovac', 3), ('Smederevo', 2), ('Valjevo', 2), ('Šabac', 2),
+    ('Užice', 2), ('Vranje', 2), ('Sombor', 2), ('Požarevac', 2), ('Pirot', 1),
+]
+
+FIRST_NAMES = [
+    'Marko', 'Nikola', 'Stefan', 'Luka', 'Nemanja', 'Milan', 'Đorđe', 'Aleksandar', 'Vuk', 'Dušan',
+    'Jelena', 'Milica', 'Ana', 'Jovana', 'Teodora', 'Marija', 'Ivana', 'Katarina', 'Sanja', 'Dragana',
+]
+LAST_NAMES = [
+    'Jovanović', 'Petrović', 'Nikolić', 'Marković', 'Đorđević', 'Stojanović', 'Ilić', 'Stanković',
+    'Pavlović', 'Milošević', 'Popović', 'Kovačević', 'Todorović', 'Živković', 'Lukić', 'Savić',
+]
+
+ITEMS = [
+    'bicikl Capriolo', 'mobilni Samsung Galaxy', 'laptop Lenovo ThinkPad', 'PlayStation 4', 'gitara Yamaha',
+    'kauč na razvlačenje', 'frižider Gorenje', 'zimske gume 16"', 'knjige za srednju školu', 'dečija kolica',
+    'bušilica Bosch', 'foto-aparat Canon', 'patike Nike', 'jakna North Face', 'sto od punog drveta',
+    'kosačica za travu', 'televizor LG 43"', 'romobil Xiaomi', 'šivaća mašina Singer', 'ribolovački štap',
+]
+CONDITIONS = ['kao nov', 'očuvan', 'malo korišćen', 'ispravan', 'sa garancijom', 'za delove']
+WANTED = [
+    'zamena za telefon', 'alat', 'bicikl', 'konzolu', 'nameštaj', 'knjige', 'dogovor', 'gitaru', 'laptop',
+]
+MESSAGE_TEXTS = [
+    'Zdravo, da li je ponuda još aktuelna?',
+    'Može li zamena za {item}?',
+    'Gde se nalazite tačno? Ja sam iz {city}.',
+    'Može li malo fotografija sa strane?',
+    'Dogovoreno, javljam se sutra.',
+    'Hvala, vidimo se u {city}.',
+    'Da li je cena fiksna ili može dogovor?',
+]
+REVIEW_TEXTS = [
+    'Sve po dogovoru, preporuka!', 'Korektan i brz.', 'Stvar kao na slici.',
+    'Kasnio je sa slanjem, ali je sve u redu.', 'Odlična saradnja.', 'Nije odgovarao na poruke.',
+]
+TRADE_STATUSES = [('pending', 30), ('accepted', 15), ('rejected', 15), ('cancelled', 10), ('completed', 30)]
+NOTIFICATION_TYPES = [('message', 40), ('trade_request', 20), ('trade_accepted', 10), ('review', 10), ('offer_viewed', 20)]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def supports_copy():
+    """COPY se koristi na PostgreSQL-u preko psycopg 3 drajvera"""
+    if connection.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    return is_psycopg3
+
+
+@contextmanager
+def explicit_timestamps(*model_classes):
+    """Privremeno isključi auto_now/auto_now_add da bi generisani datumi ostali"""
+    changed = []
+    for model in model_classes:
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.DateField) and (field.auto_now or field.auto_now_add):
+                changed.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in changed:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class MarketplaceSeeder:
+    """
+    Upisuje podatke u grupama. Prvi generisani korisnik (hot_user) dobija deo
+    svih poruka, razmena i notifikacija, da bi benchmark stranice imale
+    realno popunjen inbox. Aktivnost korisnika i ponuda je neravnomerna
+    (mali broj korisnika ima većinu ponuda), a datumi su raspoređeni kroz
+    poslednjih `days` dana.
+    """
+
+    def __init__(self, seed=42, batch_size=5000, hot_share=0.05, prefix='seed', days=365,
+                 use_copy=None, progress=None):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.hot_share = hot_share
+        self.prefix = prefix
+        self.days = days
+        self.use_copy = supports_copy() if use_copy is None else use_copy
+        self.progress = progress
+        self.now = timezone.now()
+        self.cities, self.city_weights = zip(*CITIES)
+        self.user_ids = array('q')
+        self.offer_ids = array('q')
+        self.offer_owner_ids = array('q')
+
+    # ---------- izbor vrednosti ----------
+
+    def pick_city(self):
+        return self.random.choices(self.cities, self.city_weights)[0]
+
+    def pick_weighted(self, choices):
+        values, weights = zip(*choices)
+        return self.random.choices(values, weights)[0]
+
+    def pick_user(self):
+        """Korisnik sa neravnomernom raspodelom (aktivniji su češći)"""
+        if self.random.random() < self.hot_share:
+            return self.user_ids[0]
+        return self.user_ids[int(len(self.user_ids) * self.random.random() ** 2)]
+
+    def other_user(self, user_id):
+        other = self.random.choice(self.user_ids)
+        while other == user_id and len(self.user_ids) > 1:
+            other = self.random.choice(self.user_ids)
+        return other
+
+    def partner(self, index):
+        """Jedan od pet stalnih sagovornika korisnika - bez čuvanja mape u memoriji"""
+        step = 7919 * (1 + self.random.randrange(5))
+        return self.user_ids[(index + step) % len(self.user_ids)]
+
+    def pick_offer(self):
+        """(id ponude, id vlasnika)"""
+        i = self.random.randrange(len(self.offer_ids))
+        return self.offer_ids[i], self.offer_owner_ids[i]
+
+    def moment(self, after=None):
+        """Slučajan trenutak u poslednjih `days` dana (ili posle `after`)"""
+        start = after or self.now - timedelta(days=self.days)
+        return start + (self.now - start) * self.random.random()
+
+    # ---------- upis ----------
+
+    def insert(self, model, rows, ignore_conflicts=False):
+        total = 0
+        started = time.perf_counter()
+        with explicit_timestamps(model):
+            for chunk in chunked(rows, self.batch_size):
+                with transaction.atomic():
+                    if ignore_conflicts:
+                        model.objects.bulk_create(chunk, batch_size=self.batch_size, ignore_conflicts=True)
+                    elif self.use_copy:
+                        self.copy(model, chunk)
+                    else:
+                        self.execute_many(model, chunk)
+                total += len(chunk)
+                if self.progress:
+                    self.progress(model, total, time.perf_counter() - started)
+        return total
+
+    @staticmethod
+    def columns(model):
+        fields = [f for f in model._meta.concrete_fields if not isinstance(f, AutoFieldMixin)]
+        table = connection.ops.quote_name(model._meta.db_table)
+        return fields, table, ', '.join(connection.ops.quote_name(f.column) for f in fields)
+
+    @staticmethod
+    def db_rows(fields, objs):
+        """Vrednosti kolona kao pri bulk_create (auto_now je isključen u insert-u)"""
+        conn = connections[DEFAULT_DB_ALIAS]
+        converters = [
+            (f.attname, json.dumps if isinstance(f, models.JSONField) else partial(f.get_db_prep_save, connection=conn))
+            for f in fields
+        ]
+        for obj in objs:
+            values = obj.__dict__
+            yield [convert(values[attname]) for attname, convert in converters]
+
+    def copy(self, model, objs):
+        """COPY ... FROM STDIN (psycopg 3)"""
+        fields, table, columns = self.columns(model)
+        with connection.cursor() as cursor:
+            with cursor.cursor.copy(f'COPY {table} ({columns}) FROM STDIN') as copy:
+                for row in self.db_rows(fields, objs):
+                    copy.write_row(row)
+
+    def execute_many(self, model, objs):
+        """Jedan pripremljen INSERT za celu grupu - bez ORM kompajliranja po redu"""
+        fields, table, columns = self.columns(model)
+        placeholders = ', '.join(['%s'] * len(fields))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', list(self.db_rows(fields, objs)),
+            )
+
+    def load_ids(self, queryset, *fields):
+        """Id-jevi novih redova kao kompaktni nizovi (bez model instanci)"""
+        arrays = [array('q') for _ in fields]
+        for row in queryset.order_by('pk').values_list(*fields).iterator(chunk_size=self.batch_size * 4):
+            for target, value in zip(arrays, row):
+                target.append(value)
+        return arrays
+
+    # ---------- generisanje ----------
+
+    def run(self, users, offers, messages, trades, reviews, notifications, rebuild=True):
+        """Generiši sve tabele redom; vraća broj upisanih redova po modelu"""
+        counts = {
+            'users': self.seed_users(users),
+            'offers': self.seed_offers(offers),
+            'messages': self.seed_messages(messages),
+            'trades': self.seed_trades(trades),
+            'reviews': self.seed_reviews(reviews),
+            'notifications': self.seed_notifications(notifications),
+        }
+        # Ponude su upisane bez signala - brojevi u katalogu se preračunavaju
+        catalog.bump_version()
+        page_cache.purge('offers')
+        if rebuild:
+            self.rebuild_derived()
+        return counts
+
+    def load_existing(self):
+        """Učitaj ranije generisane korisnike (npr. --keepdb); False ako ih nema"""
+        self.user_ids, = self.load_ids(User.objects.filter(username__startswith=f'{self.prefix}_'), 'pk')
+        return bool(self.user_ids)
+
+    @property
+    def hot_user(self):
+        return User.objects.get(pk=self.user_ids[0])
+
+    def seed_users(self, count):
+        if not Category.objects.exists():
+            call_command('create_categories', verbosity=0, stdout=io.StringIO())
+        self.category_ids = list(Category.objects.values_list('pk', flat=True))
+
+        seeded = User.objects.filter(username__startswith=f'{self.prefix}_')
+        start = seeded.count()
+        last_pk = User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        password = make_password(SEED_PASSWORD)
+
+        def users():
+            for n in range(start, start + count):
+                first, last = self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+                username = f'{self.prefix}_{normalize(first)}.{normalize(last)}{n}'
+                yield User(
+                    username=username, first_name=first, last_name=last,
+                    email=f'{username}@example.rs', password=password,
+                    date_joined=self.moment(),
+                )
+
+        created = self.insert(User, users())
+        new_ids, = self.load_ids(seeded.filter(pk__gt=last_pk), 'pk')
+
+        def profiles():
+            for user_id in new_ids:
+                yield UserProfile(
+                    user_id=user_id, location=self.pick_city(), bio='Volim razmenu!', created_at=self.now,
+                )
+
+        self.insert(UserProfile, profiles(), ignore_conflicts=True)
+        self.load_existing()
+        return created
+
+    def seed_offers(self, count):
+        last_pk = Offer.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+        def offers():
+            for _ in range(count):
+                item = self.random.choice(ITEMS)
+                condition = self.random.choice(CONDITIONS)
+                city = self.pick_city()
+                title = f'{item[0].upper()}{item[1:]} - {condition}'
+                created_at = self.moment()
+                yield Offer(
+                    title=title,
+                    slug=slugify(normalize(title))[:200],
+                    description=f'Menjam {item}, {condition}. Lično preuzimanje u mestu {city}.',
+                    offered=item,
+                    wanted=self.random.choice(WANTED),
+                    category_id=self.random.choice(self.category_ids),
+                    owner_id=self.pick_user(),
+                    city=city,
+                    is_active=self.random.random() < 0.85,
+                    views_count=int(self.random.paretovariate(1.5) * 10),
+                    created_at=created_at,
+                    updated_at=created_at,
+                )
+
+        created = self.insert(Offer, offers())
+        self.offer_ids, self.offer_owner_ids = self.load_ids(
+            Offer.objects.filter(pk__gt=last_pk), 'pk', 'owner_id',
+        )
+        return created
+
+    def seed_messages(self, count):
+        # Svaki korisnik se dopisuje sa malim brojem stalnih sagovornika, kao u praksi
+        def messages():
+            for _ in range(count):
+                index = self.random.randrange(len(self.user_ids))
+                sender, recipient = self.user_ids[index], self.partner(index)
+                if self.random.random() < self.hot_share:
+                    sender, recipient = recipient, self.user_ids[0]
+                if sender == recipient:
+                    continue
+                text = self.random.choice(MESSAGE_TEXTS)
+                yield Message(
+                    sender_id=sender,
+                    recipient_id=recipient,
+                    body=text.format(item=self.random.choice(ITEMS), city=self.pick_city()),
+                    timestamp=self.moment(),
+                    is_read=self.random.random() < 0.7,
+                )
+
+        return self.insert(Message, messages())
+
+    def seed_trades(self, count):
+        def trades():
+            for _ in range(count):
+                offer2, user2 = self.pick_offer()
+                if self.random.random() < self.hot_share:
+                    offer1, user1 = None, self.user_ids[0]
+                elif self.random.random() < 0.8:
+                    offer1, user1 = self.pick_offer()
+                else:
+                    offer1, user1 = None, self.other_user(user2)
+                if user1 == user2:
+                    continue
+                created_at = self.moment()
+                yield Trade(
+                    user1_id=user1,
+                    user2_id=user2,
+                    offer1_id=offer1,
+                    offer2_id=offer2,
+                    status=self.pick_weighted(TRADE_STATUSES),
+                    message='Da li vas zanima zamena?',
+                    created_at=created_at,
+                    updated_at=self.moment(after=created_at),
+                )
+
+        return self.insert(Trade, trades())
+
+    def seed_reviews(self, count):
+        def completed_trades():
+            # Keyset stranice umesto otvorenog kursora dok traje upis
+            last_pk = 0
+            while True:
+                rows = list(
+                    Trade.objects.filter(status='completed', pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'user1_id', 'user2_id', 'offer2_id', 'updated_at')[:self.batch_size]
+                )
+                if not rows:
+                    return
+                yield from rows
+                last_pk = rows[-1][0]
+
+        def reviews():
+            completed = completed_trades()
+            for _ in range(count):
+                row = next(completed, None)
+                if row is not None:
+                    trade_id, reviewer, reviewed, offer_id, after = row
+                else:
+                    offer_id, reviewed = self.pick_offer()
+                    reviewer, trade_id, after = self.other_user(reviewed), None, None
+                if reviewer == reviewed:
+                    continue
+                rating = self.pick_weighted([(5, 45), (4, 30), (3, 12), (2, 7), (1, 6)])
+                created_at = self.moment(after=after)
+                yield Review(
+                    reviewer_id=reviewer,
+                    reviewed_user_id=reviewed,
+                    offer_id=offer_id,
+                    trade_id=trade_id,
+                    rating=rating,
+                    comment=self.random.choice(REVIEW_TEXTS),
+                    is_verified_purchase=trade_id is not None,
+                    is_positive=rating >= 4,
+                    created_at=created_at,
+                    updated_at=created_at,
+                )
+
+        # (reviewer, reviewed_user, offer) je jedinstven - duplikati se preskaču u bazi
+        return self.insert(Review, reviews(), ignore_conflicts=True)
+
+    def seed_notifications(self, count):
+        titles = dict(Notification.NOTIFICATION_TYPES)
+
+        def notifications():
+            for _ in range(count):
+                recipient = self.pick_user()
+                kind = self.pick_weighted(NOTIFICATION_TYPES)
+                created_at = self.moment()
+                yield Notification(
+                    recipient_id=recipient,
+                    actor_id=self.other_user(recipient),
+                    notification_type=kind,
+                    title=titles[kind],
+                    message='Imate novu aktivnost na vašem nalogu.',
+                    is_read=self.random.random() < 0.6,
+                    created_at=created_at,
+                    updated_at=created_at,
+                )
+
+        return self.insert(Notification, notifications())
+
+    def rebuild_derived(self):
+        """Izvedeni podaci koje bi inače održavali signali"""
+        for command in ('rebuild_search_index', 'backfill_conversations',
+                        'reconcile_unread_counters', 'rebuild_reputation'):
+            call_command(command, verbosity=0, stdout=io.StringIO())
@@ -0,0 +1,66 @@
+"""
+Keširane statistike korisnika za get_user_stats i get_user_detail_api.
+
+Statistike se računaju jednim upitom (COUNT podupiti + agregati reputacije sa
+profila) i čuvaju u kešu pod ključem koji sadrži UserProfile.stats_version.
+Verzija se povećava iz signala za Offer, Trade i Review, pa keš nikad ne
+vraća zastarele podatke i ne treba ga eksplicitno brisati - a ista verzija
+služi i kao ETag.
+"""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F, Func, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+STATS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _count(queryset):
+    """COUNT(*) podupit bez GROUP BY"""
+    rows = queryset.order_by().annotate(total=Func(F('pk'), function='COUNT')).values('total')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def bump_stats_version(*user_ids):
+    """Obeleži statistike korisnika kao zastarele"""
+    from .models import UserProfile
+
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if user_ids:
+        UserProfile.objects.filter(user_id__in=user_ids).update(stats_version=F('stats_version') + 1)
+
+
+def compute_user_stats(user_id):
+    """Sve statistike korisnika u jednom upitu"""
+    from .models import Offer, Trade
+
+    offers = Offer.objects.filter(owner=OuterRef('pk'))
+    completed = Trade.objects.filter(
+        Q(user1=OuterRef('pk')) | Q(user2=OuterRef('pk')),
+        status='completed',
+    )
+    row = (
+        User.objects
+        .filter(pk=user_id)
+        .annotate(
+            total_offers=_count(offers),
+            active_offers=_count(offers.filter(is_active=True)),
+            completed_trades=_count(completed),
+        )
+        .values('total_offers', 'active_offers', 'completed_trades',
+                'userprofile__rating_sum', 'userprofile__rating_count')
+        .first()
+    )
+    if row is None:
+        return None
+
+    rating_sum = row.pop('userprofile__rating_sum') or 0
+    rating_count = row.pop('userprofile__rating_count') or 0
+    row['reviews_count'] = rating_count
+    row['average_rating'] = round(rating_sum / rating_count, 1) if rating_count else 0
+    return row
+
+
+def get_user_stats(user_id, version):
+    """Statistike iz keša za datu verziju (računaju se samo na promašaj)"""
+    return cache.get_or_set(f'user_stats:{user_id}:{version}', lambda: compute_user_stats(user_id), STATS_CACHE_TIMEOUT)
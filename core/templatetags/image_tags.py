@@ -0,0 +1,27 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from core.images import srcset, variant_urls
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(fieldfile, variants, alt='', sizes='100vw', size='medium', **attrs):
+    """<picture> sa WebP i srcset varijantama; bez varijanti vraća original."""
+    attrs.setdefault('loading', 'lazy')
+    urls = variant_urls(fieldfile, variants)
+    if not urls:
+        return format_html('<img src="{}" alt="{}"{}>', fieldfile.url, alt, flatatt(attrs))
+
+    default = urls.get(size) or next(iter(urls.values()))
+    attrs.update(width=default['width'], height=default['height'])
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}>'
+        '</picture>',
+        srcset(urls, 'webp'), sizes,
+        default['url'], srcset(urls), sizes, alt, flatatt(attrs),
+    )
@@ -1,3 +1,1236 @@
-from django.test import TestCase
+import glob
+import gzip
+import json
+import os
+import tempfile
+import threading
+import warnings
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from barter import page_cache
+from barter.testing import assert_query_budget
+
+from . import catalog, counters, jobs, notifications, retention, search, trades
+from .models import Category, Conversation, Job, Message, Notification, Offer, OfferReservation, Review, Trade, UserProfile
+from .pagination import CursorPaginator
+from .seeding import MarketplaceSeeder
+from .view_counter import ViewCounter, record_view
+from .views import trade_status_counts
+
+
+# Dva nivoa kao u produkciji, ali deljeni nivo u memoriji - testovi ne diraju pravi keš
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'barter.cache.TwoTierCache',
+        'OPTIONS': {'SHARED': 'shared', 'SYNC_INTERVAL': 0},
+    },
+    'shared': {
+        'BACKEND': 'barter.cache.InstrumentedLocMemCache',
+        'LOCATION': 'barter-tests',
+    },
+}
+
+
+@override_settings(CACHES=TEST_CACHES, SECURE_SSL_REDIRECT=False)
+class BarterTestCase(TestCase):
+    """Zajednički podaci: korisnici, kategorija i ponuda; prazan test keš, bez HTTPS preusmerenja"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('vlasnik', 'vlasnik@example.com', 'lozinka123')
+        cls.other = User.objects.create_user('kupac', 'kupac@example.com', 'lozinka123')
+        cls.third = User.objects.create_user('treci', 'treci@example.com', 'lozinka123')
+        cls.category = Category.objects.create(name='Elektronika')
+        cls.offer = Offer.objects.create(
+            title='Bicikl', description='Dobar bicikl', offered='Bicikl', wanted='Laptop',
+            category=cls.category, owner=cls.owner,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+
+@override_settings(JOBS_EAGER=False)
+class NotificationQueueTests(BarterTestCase):
+
+    def event(self, actor, notification_type='review', **extra):
+        return {
+            'recipient_id': self.owner.pk, 'actor_id': actor.pk, 'notification_type': notification_type,
+            'title': 'Naslov', 'message': 'Poruka', 'offer_id': self.offer.pk, **extra,
+        }
+
+    def deliver(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.run_batch()
+
+    def test_same_event_twice_is_one_notification(self):
+        notifications.notify_many([self.event(self.other), self.event(self.other)])
+
+        self.assertEqual(Job.objects.count(), 1)
+        self.deliver()
+        self.assertEqual(Notification.objects.filter(recipient=self.owner).count(), 1)
+
+    def test_different_actors_are_not_merged(self):
+        notifications.notify_many([self.event(self.other)])
+        notifications.notify_many([self.event(self.third)])
+
+        self.assertEqual(Job.objects.count(), 2)
+        self.deliver()
+        self.assertEqual(
+            set(Notification.objects.filter(recipient=self.owner).values_list('actor_id', flat=True)),
+            {self.other.pk, self.third.pk},
+        )
+        self.assertEqual(UserProfile.objects.get(user=self.owner).unread_notifications, 2)
+
+    def test_coalesced_types_sum_counts_across_actors(self):
+        notifications.notify_many([self.event(self.other, 'offer_liked'), self.event(self.third, 'offer_liked')])
+        self.deliver()
+        notifications.notify_many([self.event(self.other, 'offer_liked')])
+        self.deliver()
+
+        notification = Notification.objects.get(recipient=self.owner, notification_type='offer_liked')
+        self.assertEqual(notification.count, 3)
+
+
+FAILING_TASK = 'tests.fail_on_negative'
+
+
+@jobs.task(FAILING_TASK)
+def fail_on_negative(payloads):
+    for payload in payloads:
+        if payload['value'] < 0:
+            raise ValueError('negativna vrednost')
+        Category.objects.create(name=f"Posao {payload['value']}")
+
+
+@override_settings(JOBS_EAGER=False)
+class JobRunTests(BarterTestCase):
+
+    def test_failing_job_does_not_retry_the_batch(self):
+        jobs.enqueue_many(FAILING_TASK, [({'value': 1}, None), ({'value': -1}, None), ({'value': 2}, None)])
+
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_batch(), 3)
+
+        self.assertEqual(
+            set(Category.objects.filter(name__startswith='Posao').values_list('name', flat=True)),
+            {'Posao 1', 'Posao 2'},
+        )
+        failed = Job.objects.get()
+        self.assertEqual(failed.payload, {'value': -1})
+        self.assertEqual(failed.status, 'pending')
+        self.assertIn('negativna vrednost', failed.last_error)
+
+    def test_periodic_tasks_are_scheduled_once(self):
+        jobs.schedule_periodic()
+        jobs.schedule_periodic()
+
+        scheduled = Job.objects.filter(task='trades.expire_reservations')
+        self.assertEqual(scheduled.count(), 1)
+        self.assertGreater(scheduled.get().run_after, timezone.now())
+
+    def test_failed_periodic_job_is_not_duplicated(self):
+        jobs.schedule_periodic()
+        Job.objects.filter(task='trades.expire_reservations').update(run_after=timezone.now())
+        with mock.patch.dict(jobs._handlers, {'trades.expire_reservations': mock.Mock(side_effect=ValueError)}):
+            with self.assertLogs('core.jobs', 'ERROR'):
+                jobs.run_batch()
+
+        for _ in range(3):
+            jobs.schedule_periodic()
+        self.assertEqual(Job.objects.filter(task='trades.expire_reservations').count(), 1)
+
+
+@override_settings(EVENTS_SYNC_INTERVAL=0)
+class UnreadStreamTests(BarterTestCase):
+
+    async def test_change_from_another_process_sends_snapshot(self):
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncRequestFactory
+
+        from .views import unread_stream
+
+        request = AsyncRequestFactory().get('/api/unread-stream/')
+
+        async def auser():
+            return self.owner
+        request.auser = auser
+
+        response = await unread_stream(request)
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n')
+        self.assertIn(b'"notifications": 0', await anext(stream))
+
+        # Worker menja brojač i verziju, bez objave u brokeru ovog procesa
+        await sync_to_async(UserProfile.objects.filter(user=self.owner).update)(unread_notifications=3)
+        await sync_to_async(cache.delete)(f'unread_version:{self.owner.pk}')
+
+        snapshot = await anext(stream)
+        self.assertTrue(snapshot.startswith(b'event: snapshot'))
+        self.assertIn(b'"notifications": 3', snapshot)
+        await stream.aclose()
+
+    def test_wsgi_gets_no_stream(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('core:unread_stream'))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+
+
+class FileCacheAtomicityTests(SimpleTestCase):
+
+    def test_concurrent_incr_loses_no_updates(self):
+        from barter.cache import InstrumentedFileBasedCache
+
+        with tempfile.TemporaryDirectory() as location:
+            shared = InstrumentedFileBasedCache(location, {})
+            shared.set('brojac', 0, None)
+
+            def work():
+                for _ in range(50):
+                    shared.incr('brojac')
+
+            threads = [threading.Thread(target=work) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(shared.get('brojac'), 400)
+
+    def test_incr_keeps_expiry(self):
+        from barter.cache import InstrumentedFileBasedCache
+
+        with tempfile.TemporaryDirectory() as location:
+            shared = InstrumentedFileBasedCache(location, {})
+            shared.set('brojac', 1, 60)
+            shared.incr('brojac', 4)
+
+            self.assertEqual(shared.get('brojac'), 5)
+            self.assertLessEqual(shared._remaining('brojac', None), 60)
+            with self.assertRaises(ValueError):
+                shared.incr('nepostojeci')
+
+    def test_stale_lock_cleanup_spares_new_owner(self):
+        from barter.cache import InstrumentedFileBasedCache
+
+        with tempfile.TemporaryDirectory() as location:
+            shared = InstrumentedFileBasedCache(location, {})
+            lock = shared._key_to_file('brojac') + '.lock'
+
+            # Zaostalo zaključavanje procesa koji je pao
+            shared._createdir()
+            with open(lock, 'wb') as f:
+                f.write(b'pao')
+            os.utime(lock, (0, 0))
+
+            with shared._key_lock('brojac'):
+                # Drugi proces ga proglasi zastarelim i preuzme
+                os.remove(lock)
+                with open(lock, 'wb') as f:
+                    f.write(b'drugi')
+
+            self.assertEqual(shared._lock_owner(lock), b'drugi')
+
+
+class RejectTradeViewTests(BarterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.trade = Trade.objects.create(offer2=self.offer, user1=self.other, user2=self.owner)
+        self.url = reverse('core:reject_trade', args=[self.trade.pk])
+
+    def post_as(self, user):
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url)
+        self.trade.refresh_from_db()
+
+    def test_recipient_rejects(self):
+        self.post_as(self.owner)
+        self.assertEqual(self.trade.status, 'rejected')
+
+    def test_sender_withdraws_own_pending_request(self):
+        self.post_as(self.other)
+        self.assertEqual(self.trade.status, 'cancelled')
+
+    def test_sender_cannot_withdraw_accepted_trade(self):
+        Trade.objects.filter(pk=self.trade.pk).update(status='accepted')
+        self.post_as(self.other)
+        self.assertEqual(self.trade.status, 'accepted')
+
+    def test_other_users_are_denied(self):
+        self.post_as(self.third)
+        self.assertEqual(self.trade.status, 'pending')
+
+
+class QueryBudgetTests(BarterTestCase):
+    """Svaki view sa @query_budget ostaje u budžetu i bez N+1, i sa više redova"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(6):
+            offer = Offer.objects.create(
+                title=f'Ponuda {i}', description='Opis', offered='Knjige', wanted='Alat',
+                category=cls.category, owner=cls.other if i % 2 else cls.third,
+            )
+            Trade.objects.create(offer1=offer, offer2=cls.offer, user1=offer.owner, user2=cls.owner)
+            Message.objects.create(sender=offer.owner, recipient=cls.owner, body=f'Poruka {i}')
+            Message.objects.create(sender=cls.owner, recipient=offer.owner, body=f'Odgovor {i}')
+
+    def test_views_stay_within_budget(self):
+        self.client.force_login(self.owner)
+        urls = [
+            reverse('core:my_messages'),
+            reverse('core:my_trades'),
+            reverse('core:page_fragments') + f'?f=navbar&f=offer_actions:{self.offer.pk}&f=offer_contact:{self.offer.pk}',
+            reverse('core:get_offer_stats', args=[self.offer.pk]),
+            reverse('core:get_user_stats', args=[self.other.username]),
+            reverse('core:get_categories'),
+            reverse('core:search_offers') + '?q=ponuda',
+            reverse('core:get_messages_list') + f'?username={self.other.username}',
+            reverse('core:get_offer_detail_api', args=[self.offer.pk]),
+            reverse('core:get_user_detail_api', args=[self.other.username]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = assert_query_budget(self.client, url)
+                self.assertEqual(response.status_code, 200)
+
+
+class TradesStreamTests(BarterTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for _ in range(5):
+            Trade.objects.create(offer2=cls.offer, user1=cls.other, user2=cls.owner)
+
+    def url(self):
+        return reverse('core:get_trades_list') + '?format=ndjson'
+
+    def assert_trades(self, lines):
+        rows = [json.loads(line) for line in b''.join(lines).decode().splitlines()]
+        self.assertEqual(len(rows), 5)
+
+    def test_wsgi_gets_a_sync_stream(self):
+        self.client.force_login(self.owner)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            response = self.client.get(self.url())
+            self.assertFalse(response.is_async)
+            self.assert_trades(list(response.streaming_content))
+
+    async def test_asgi_gets_an_async_stream(self):
+        from asgiref.sync import sync_to_async
+
+        await sync_to_async(self.async_client.force_login)(self.owner)
+        response = await self.async_client.get(self.url())
+        self.assertTrue(response.is_async)
+        self.assert_trades([chunk async for chunk in response.streaming_content])
+
+
+class SearchTests(BarterTestCase):
+
+    def test_normalize(self):
+        self.assertEqual(search.normalize('Ђурђевак ČAŠA Žeđ'), 'djurdjevak casa zedj')
+        self.assertEqual(search.tokenize('Škoda, Fabia-1.4!'), ['skoda', 'fabia', '1', '4'])
+
+    def test_cyrillic_and_diacritics_match_latin_offers(self):
+        Offer.objects.create(
+            title='Čelična šerpa', description='Opis', offered='Šerpa', wanted='Knjige',
+            category=self.category, owner=self.other,
+        )
+
+        for query in ('бицикл', 'BICIKL', 'celicna serpa', 'ЧЕЛИЧНА'):
+            with self.subTest(query=query):
+                found = search.search_offers(Offer.objects.all(), query)
+                self.assertTrue(found.exists())
+        self.assertEqual(search.search_offers(Offer.objects.all(), 'бицикл').get(), self.offer)
+
+
+class CursorPaginationTests(BarterTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        now = timezone.now()
+        for i in range(7):
+            offer = Offer.objects.create(
+                title=f'Ponuda {i}', description='Opis', offered='Knjige', wanted='Alat',
+                category=cls.category, owner=cls.other,
+            )
+            # Dve ponude sa istim vremenom - redosled odlučuje id
+            Offer.objects.filter(pk=offer.pk).update(created_at=now - timedelta(minutes=i // 2))
+
+    def test_round_trip_visits_every_row_once(self):
+        queryset = Offer.objects.all()
+        expected = list(queryset.order_by('-created_at', '-id').values_list('pk', flat=True))
+        paginator = CursorPaginator(queryset, per_page=3)
+
+        seen, pages, cursor = [], [], None
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append(page)
+            seen += [offer.pk for offer in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+
+        # Nazad sa poslednje strane daje istu pretposlednju stranu
+        previous = paginator.get_page(pages[-1].previous_cursor)
+        self.assertEqual([offer.pk for offer in previous], [offer.pk for offer in pages[-2]])
+
+    def test_invalid_cursor_gives_first_page(self):
+        paginator = CursorPaginator(Offer.objects.all(), per_page=3)
+        first = [offer.pk for offer in paginator.get_page()]
+
+        invalid = (
+            'nije-kursor',
+            'W10',
+            paginator.encode_cursor('next', {'created_at': 'x', 'id': 1}),
+            paginator.encode_cursor('next', {'created_at': timezone.now(), 'id': 'x'}),
+        )
+        for cursor in invalid:
+            with self.subTest(cursor=cursor):
+                self.assertEqual([offer.pk for offer in paginator.get_page(cursor)], first)
+
+        response = self.client.get(reverse('core:search_offers'), {'cursor': invalid[2]})
+        self.assertEqual(response.status_code, 200)
+
+
+class TradeTestCase(BarterTestCase):
+    """Zahtev za razmenu i konkurentni zahtev za istu ponudu"""
+
+    def setUp(self):
+        super().setUp()
+        self.offered = Offer.objects.create(
+            title='Laptop', description='Opis', offered='Laptop', wanted='Bicikl',
+            category=self.category, owner=self.other,
+        )
+        self.competing_offer = Offer.objects.create(
+            title='Gitara', description='Opis', offered='Gitara', wanted='Bicikl',
+            category=self.category, owner=self.third,
+        )
+        self.trade = Trade.objects.create(offer1=self.offered, offer2=self.offer, user1=self.other, user2=self.owner)
+        self.competing = Trade.objects.create(
+            offer1=self.competing_offer, offer2=self.offer, user1=self.third, user2=self.owner,
+        )
+
+
+class TradeTransitionTests(TradeTestCase):
+
+    def test_only_allowed_transitions(self):
+        with self.assertRaises(trades.TradePermissionError):
+            trades.accept(self.trade.pk, self.other)
+        with self.assertRaises(trades.TradePermissionError):
+            trades.complete(self.trade.pk, self.third)
+
+        trades.reject(self.trade.pk, self.owner)
+        with self.assertRaises(trades.InvalidTransition):
+            trades.accept(self.trade.pk, self.owner)
+
+    def test_accept_rejects_competing_requests(self):
+        trades.accept(self.trade.pk, self.owner)
+
+        self.trade.refresh_from_db()
+        self.competing.refresh_from_db()
+        self.assertEqual(self.trade.status, 'accepted')
+        self.assertEqual(self.competing.status, 'rejected')
+
+    def test_complete_deactivates_both_offers(self):
+        trades.accept(self.trade.pk, self.owner)
+        trades.complete(self.trade.pk, self.other)
+
+        self.assertEqual(Trade.objects.get(pk=self.trade.pk).status, 'completed')
+        self.assertFalse(Offer.objects.filter(pk__in=[self.offer.pk, self.offered.pk], is_active=True).exists())
+
+
+class OfferReservationTests(TradeTestCase):
+
+    def test_accept_reserves_both_offers(self):
+        trades.accept(self.trade.pk, self.owner)
+
+        self.assertEqual(
+            set(OfferReservation.objects.filter(trade=self.trade).values_list('offer_id', flat=True)),
+            {self.offer.pk, self.offered.pk},
+        )
+
+    def test_reserved_offer_cannot_be_accepted_twice(self):
+        trades.accept(self.trade.pk, self.owner)
+        other_request = Trade.objects.create(offer2=self.offered, user1=self.third, user2=self.other)
+
+        with self.assertRaises(trades.InvalidTransition):
+            trades.accept(other_request.pk, self.other)
+
+    def test_complete_releases_reservation(self):
+        trades.accept(self.trade.pk, self.owner)
+        trades.complete(self.trade.pk, self.other)
+
+        self.assertFalse(OfferReservation.objects.exists())
+
+    def test_expired_reservation_cancels_trade(self):
+        trades.accept(self.trade.pk, self.owner)
+
+        later = timezone.now() + timedelta(hours=settings.TRADE_RESERVATION_HOURS, seconds=1)
+        self.assertEqual(trades.expire_reservations(now=later), 1)
+
+        self.trade.refresh_from_db()
+        self.assertEqual(self.trade.status, 'cancelled')
+        self.assertFalse(OfferReservation.objects.exists())
+
+
+class ImageVariantTests(BarterTestCase):
+
+    def test_new_variants_purge_cached_pages(self):
+        from . import images
+
+        Offer.objects.filter(pk=self.offer.pk).update(image='offers/bicikl.jpg')
+        self.offer.refresh_from_db()
+        variants = {'source': 'offers/bicikl.jpg', 'thumb': {'jpeg': 'offers/bicikl_thumb.jpg'}}
+
+        with mock.patch.object(images, 'render_variants', return_value=variants), \
+                mock.patch.object(images.page_cache, 'purge') as purge:
+            self.assertTrue(images.generate(self.offer, 'image'))
+            purge.assert_called_once_with('offers', f'offer:{self.offer.pk}')
+
+            profile = UserProfile.objects.get(user=self.owner)
+            UserProfile.objects.filter(pk=profile.pk).update(avatar='avatars/vlasnik.jpg')
+            profile.refresh_from_db()
+            purge.reset_mock()
+            images.generate(profile, 'avatar')
+            purge.assert_called_once_with(f'user:{self.owner.pk}')
+
+        self.assertEqual(Offer.objects.get(pk=self.offer.pk).image_variants, variants)
+
+
+class CatalogCountTests(BarterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.books = Category.objects.create(name='Knjige')
+        self.assertEqual(catalog.counts(), {self.category.pk: 1, self.books.pk: 0})
+
+    def create_offer(self, **fields):
+        fields = {
+            'title': 'Knjiga', 'description': 'Roman', 'offered': 'Knjiga', 'wanted': 'Lampa',
+            'category': self.books, 'owner': self.other, **fields,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            return Offer.objects.create(**fields)
+
+    def test_counts_follow_offer_changes_without_queries(self):
+        offer = self.create_offer()
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.offer_count(self.books.pk), 1)
+
+        offer.category = self.category
+        with self.captureOnCommitCallbacks(execute=True):
+            offer.save()
+        offer.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            offer.save(update_fields=['is_active'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.offer.delete()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.counts(), {self.category.pk: 0, self.books.pk: 0})
+
+    def test_rollback_leaves_counts_unchanged(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            Offer.objects.create(
+                title='Lampa', description='Stona', offered='Lampa', wanted='Knjiga',
+                category=self.books, owner=self.other,
+            )
+        self.assertEqual(catalog.offer_count(self.books.pk), 0)
+
+    def test_seeding_keeps_count_written_concurrently(self):
+        current = catalog.version()
+        cache.delete_many([catalog._count_key(current, pk) for pk in (self.category.pk, self.books.pk)])
+
+        original_add = cache.add
+
+        def racing_add(key, value, *args, **kwargs):
+            # Drugi proces upisuje i uvećava broj između čitanja baze i upisa
+            if key == catalog._count_key(current, self.books.pk):
+                original_add(key, 0, *args, **kwargs)
+                cache.incr(key)
+            return original_add(key, value, *args, **kwargs)
+
+        with mock.patch.object(cache, 'add', side_effect=racing_add):
+            self.assertEqual(catalog.counts(), {self.category.pk: 1, self.books.pk: 1})
+        self.assertEqual(catalog.offer_count(self.books.pk), 1)
+
+    def test_missing_count_is_recomputed(self):
+        self.create_offer()
+        cache.delete(catalog._count_key(catalog.version(), self.books.pk))
+        self.create_offer(title='Druga knjiga')
+
+        self.assertEqual(catalog.offer_count(self.books.pk), 2)
+
+
+class UnreadCounterTests(BarterTestCase):
+
+    def unread(self, user):
+        return counters.get_unread_counts(user.pk)
+
+    def notify(self, **fields):
+        return Notification.objects.create(
+            recipient=self.owner, actor=self.other, notification_type='review',
+            title='Nova recenzija', message='Ocena 5', **fields,
+        )
+
+    def test_messages_follow_create_read_and_delete(self):
+        first = Message.objects.create(sender=self.other, recipient=self.owner, body='Zdravo')
+        Message.objects.create(sender=self.other, recipient=self.owner, body='Da li je dostupno?')
+        Message.objects.create(sender=self.third, recipient=self.owner, body='Menjam')
+        self.assertEqual(self.unread(self.owner)['messages'], 3)
+
+        self.client.force_login(self.owner)
+        self.client.get(reverse('core:view_conversation', args=[self.other.username]))
+        self.assertEqual(self.unread(self.owner)['messages'], 1)
+
+        # Pročitana poruka ne menja brojač kad se obriše, nepročitana ga smanjuje
+        first.delete()
+        Message.objects.get(sender=self.third).delete()
+        self.assertEqual(self.unread(self.owner), {'messages': 0, 'notifications': 0})
+
+    def test_notifications_follow_read_bulk_read_and_delete(self):
+        first, second, third = (self.notify() for _ in range(3))
+        self.notify(is_read=True)
+        self.assertEqual(self.unread(self.owner)['notifications'], 3)
+
+        self.client.force_login(self.owner)
+        self.client.get(reverse('core:mark_notification_read', args=[first.pk]))
+        self.client.get(reverse('core:mark_notification_read', args=[first.pk]))
+        self.assertEqual(self.unread(self.owner)['notifications'], 2)
+
+        self.client.post(reverse('core:delete_notification', args=[second.pk]))
+        self.assertEqual(self.unread(self.owner)['notifications'], 1)
+
+        self.client.get(reverse('core:notifications'), {'mark_all_read': 1})
+        self.assertEqual(self.unread(self.owner)['notifications'], 0)
+        self.assertEqual(counters.count_unread(self.owner.pk), self.unread(self.owner))
+
+    def test_periodic_reconcile_fixes_drift(self):
+        self.notify()
+        UserProfile.objects.filter(user=self.owner).update(unread_messages=7, unread_notifications=0)
+
+        self.assertIn('counters.reconcile', jobs._periodic)
+        jobs._handlers['counters.reconcile']([{}])
+
+        self.assertEqual(self.unread(self.owner), {'messages': 0, 'notifications': 1})
+        self.assertEqual(self.unread(self.other), {'messages': 0, 'notifications': 0})
+
+
+class ViewCounterTests(BarterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.counter = ViewCounter(flush_interval=3600, flush_threshold=10)
+
+    def test_flush_writes_buffered_views_in_one_update_per_count(self):
+        second = Offer.objects.create(
+            title='Laptop', description='Polovan', offered='Laptop', wanted='Bicikl',
+            category=self.category, owner=self.other,
+        )
+        updated_at = Offer.objects.get(pk=self.offer.pk).updated_at
+        for offer_id in (self.offer.pk, self.offer.pk, second.pk, second.pk):
+            self.counter.record(offer_id)
+        self.assertEqual(self.counter.pending(self.offer.pk), 2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.counter.flush(), 4)
+
+        self.assertEqual(self.counter.size(), 0)
+        offer = Offer.objects.get(pk=self.offer.pk)
+        self.assertEqual(offer.views_count, 2)
+        self.assertEqual(offer.updated_at, updated_at)
+        self.assertEqual(Offer.objects.get(pk=second.pk).views_count, 2)
+
+    def test_threshold_triggers_flush(self):
+        self.counter.record(self.offer.pk, count=9)
+        self.assertEqual(Offer.objects.get(pk=self.offer.pk).views_count, 0)
+        self.counter.record(self.offer.pk)
+
+        self.assertEqual(self.counter.size(), 0)
+        self.assertEqual(Offer.objects.get(pk=self.offer.pk).views_count, 10)
+
+    def test_failed_flush_keeps_views_buffered(self):
+        self.counter.record(self.offer.pk, count=3)
+        with mock.patch.object(Offer.objects, 'filter', side_effect=RuntimeError), \
+                self.assertLogs('core.view_counter', 'ERROR'):
+            self.assertEqual(self.counter.flush(), 0)
+
+        self.assertEqual(self.counter.pending(self.offer.pk), 3)
+
+    @override_settings(OFFER_VIEWS_DEDUP_WINDOW=60)
+    def test_dedup_window_counts_visitor_once(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+        with mock.patch('core.view_counter.view_counter', self.counter):
+            self.assertTrue(record_view(request, self.offer.pk))
+            self.assertFalse(record_view(request, self.offer.pk))
+            self.assertTrue(record_view(RequestFactory().get('/', REMOTE_ADDR='10.0.0.2'), self.offer.pk))
+
+        self.assertEqual(self.counter.pending(self.offer.pk), 2)
+
+
+class ConversationTests(BarterTestCase):
+
+    def send(self, sender, recipient, body='Zdravo'):
+        return Message.objects.create(sender=sender, recipient=recipient, body=body)
+
+    def conversation(self, user, other):
+        return Conversation.objects.get(user_low_id=min(user.pk, other.pk), user_high_id=max(user.pk, other.pk))
+
+    def test_messages_update_thread_and_mark_read_resets_it(self):
+        self.send(self.other, self.owner)
+        self.send(self.owner, self.other, 'Zdravo i tebi')
+        last = self.send(self.other, self.owner, 'Da li je bicikl dostupan?')
+
+        conversation = self.conversation(self.owner, self.other)
+        self.assertEqual(conversation.last_message, last)
+        self.assertEqual(conversation.unread_for(self.owner), 2)
+        self.assertEqual(conversation.unread_for(self.other), 1)
+
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('core:my_messages'))
+        self.assertEqual(response.status_code, 200)
+        self.client.get(reverse('core:view_conversation', args=[self.other.username]))
+
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.unread_for(self.owner), 0)
+        self.assertEqual(conversation.unread_for(self.other), 1)
+
+    def test_backfill_rebuilds_threads_from_messages(self):
+        self.send(self.other, self.owner)
+        last = self.send(self.owner, self.other, 'Može')
+        Message.objects.filter(pk=last.pk).update(is_read=True)
+        from_third = self.send(self.third, self.owner)
+        Conversation.objects.all().delete()
+
+        call_command('backfill_conversations', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(Conversation.objects.count(), 2)
+        conversation = self.conversation(self.owner, self.other)
+        self.assertEqual(conversation.last_message, last)
+        self.assertEqual((conversation.unread_for(self.owner), conversation.unread_for(self.other)), (1, 0))
+        conversation = self.conversation(self.owner, self.third)
+        self.assertEqual(conversation.last_message, from_third)
+        self.assertEqual((conversation.unread_for(self.owner), conversation.unread_for(self.third)), (1, 0))
+
+
+class ReputationTests(BarterTestCase):
+
+    def profile(self, user=None):
+        return UserProfile.objects.get(user=user or self.owner)
+
+    def review(self, reviewer, rating):
+        return Review.objects.create(reviewer=reviewer, reviewed_user=self.owner, offer=self.offer, rating=rating)
+
+    def test_create_update_and_delete_keep_aggregates(self):
+        first = self.review(self.other, 5)
+        self.review(self.third, 3)
+        profile = self.profile()
+        self.assertEqual((profile.rating_sum, profile.rating_count, profile.average_rating), (8, 2, 4.0))
+
+        first.rating = 1
+        first.save()
+        # Ponovno čuvanje bez promene ne sme da duplira ocenu
+        first.save()
+        profile = self.profile()
+        self.assertEqual((profile.rating_sum, profile.rating_count), (4, 2))
+        self.assertEqual(dict(profile.rating_histogram), {5: 0, 4: 0, 3: 1, 2: 0, 1: 1})
+        self.assertEqual(profile.rating, 2.0)
+
+        Review.objects.get(pk=first.pk).delete()
+        profile = self.profile()
+        self.assertEqual((profile.rating_sum, profile.rating_count, profile.rating_1), (3, 1, 0))
+        self.assertEqual(profile.average_rating, 3.0)
+
+    def test_moving_review_to_another_user(self):
+        review = self.review(self.other, 4)
+        review.reviewed_user = self.third
+        review.save()
+
+        self.assertEqual(self.profile().rating_count, 0)
+        self.assertEqual((self.profile(self.third).rating_sum, self.profile(self.third).rating_4), (4, 1))
+
+    def test_rebuild_matches_incremental_aggregates(self):
+        self.review(self.other, 5)
+        self.review(self.third, 2)
+        expected = self.profile()
+        UserProfile.objects.update(rating_sum=0, rating_count=0, rating_5=0, rating_2=0, rating=0)
+
+        call_command('rebuild_reputation', stdout=StringIO())
+
+        profile = self.profile()
+        self.assertEqual(
+            (profile.rating_sum, profile.rating_count, profile.rating_histogram, profile.rating),
+            (expected.rating_sum, expected.rating_count, expected.rating_histogram, expected.rating),
+        )
+
+
+class UserStatsTests(BarterTestCase):
+
+    def stats(self, **headers):
+        return self.client.get(reverse('core:get_user_stats', args=[self.owner.username]), headers=headers)
+
+    def test_stats_are_cached_per_version(self):
+        Trade.objects.create(user1=self.other, user2=self.owner, offer2=self.offer, status='completed')
+        response = self.stats()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            (data['total_offers'], data['active_offers'], data['completed_trades'], data['reviews_count']),
+            (1, 1, 1, 0),
+        )
+
+        # Topli keš: samo upit za korisnika i profil
+        with self.assertNumQueries(1):
+            self.assertEqual(self.stats().json(), data)
+
+        Offer.objects.filter(pk=self.offer.pk).update(is_active=False)
+        self.assertEqual(self.stats().json()['active_offers'], 1)
+        offer = Offer.objects.get(pk=self.offer.pk)
+        offer.save()
+        self.assertEqual(self.stats().json()['active_offers'], 0)
+
+    def test_matching_etag_returns_304(self):
+        etag = self.stats()['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.stats(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Review.objects.create(reviewer=self.other, reviewed_user=self.owner, offer=self.offer, rating=4)
+        response = self.stats(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['average_rating'], 4.0)
+
+    def test_detail_etag_changes_with_visible_fields(self):
+        url = reverse('core:get_user_detail_api', args=[self.owner.username])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'if_none_match': etag}).status_code, 304)
+
+        UserProfile.objects.filter(user=self.owner).update(bio='Volim razmene')
+        response = self.client.get(url, headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class MetricsTests(BarterTestCase):
+
+    def snapshot_of(self, pid, registry):
+        snapshot = registry.snapshot()
+        snapshot['pid'] = pid
+        return snapshot
+
+    def test_render_merges_worker_snapshots(self):
+        from barter.metrics import Registry
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            worker = Registry()
+            worker.counter('zahtevi', 'Zahtevi', ('route',))
+            worker.histogram('trajanje', 'Trajanje', buckets=(0.1, 1.0))
+            worker.gauge('red', 'Red', lambda: 3)
+            worker.inc('zahtevi', route='home')
+            worker.observe('trajanje', 0.05)
+            # Drugi živ worker (roditeljski proces) i jedan koji se ugasio
+            for pid in (os.getppid(), 2 ** 22 + 1):
+                with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+                    json.dump(self.snapshot_of(pid, worker), f)
+            worker.inc('zahtevi', 2, route='home')
+            worker.observe('trajanje', 0.5)
+
+            lines = worker.render().splitlines()
+
+        self.assertIn('zahtevi{route="home"} 5', lines)
+        self.assertIn('trajanje_bucket{le="0.1"} 3', lines)
+        self.assertIn('trajanje_bucket{le="1.0"} 4', lines)
+        self.assertIn('trajanje_count 4', lines)
+        # Gauge se sabira samo za žive procese
+        self.assertIn('red 6.0', lines)
+
+    def test_shared_gauge_is_read_once(self):
+        from barter.metrics import Registry
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            worker = Registry()
+            worker.gauge('poslovi', 'Poslovi', lambda: 7, shared=True)
+            with open(os.path.join(directory, f'{os.getppid()}.json'), 'w') as f:
+                json.dump(self.snapshot_of(os.getppid(), worker), f)
+
+            self.assertIn('poslovi 7.0', worker.render().splitlines())
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False, JOBS_EAGER=False)
+    def test_metrics_require_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        with override_settings(METRICS_TOKEN='tajna'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            jobs.enqueue(FAILING_TASK, {})
+            response = self.client.get('/metrics', headers={'authorization': 'Bearer tajna'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('barter_jobs_pending 1.0', response.content.decode().splitlines())
+
+
+@override_settings(CACHES=TEST_CACHES, SECURE_SSL_REDIRECT=False)
+class SeederTests(TransactionTestCase):
+    """Pravi commit-ovi: izvedeni podaci se preračunavaju i šemom pretrage (DDL)"""
+
+    SIZES = {'users': 8, 'offers': 20, 'messages': 30, 'trades': 10, 'reviews': 5, 'notifications': 10}
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def seed(self, seed):
+        counts = MarketplaceSeeder(seed=seed, batch_size=7).run(**self.SIZES, rebuild=False)
+        fingerprint = (
+            counts,
+            list(Offer.objects.order_by('pk').values_list('owner__username', 'title', 'city', 'category__name', 'is_active')),
+            list(Message.objects.order_by('pk').values_list('sender__username', 'recipient__username', 'body')),
+            list(Trade.objects.order_by('pk').values_list('user1__username', 'user2__username', 'status')),
+            list(Review.objects.order_by('pk').values_list('reviewer__username', 'rating')),
+        )
+        User.objects.all().delete()
+        return fingerprint
+
+    def test_same_seed_generates_same_data(self):
+        first = self.seed(7)
+        self.assertEqual(self.seed(7), first)
+        self.assertNotEqual(self.seed(8), first)
+
+    def test_derived_data_is_rebuilt(self):
+        MarketplaceSeeder(seed=7, batch_size=7).run(**self.SIZES)
+
+        for profile in UserProfile.objects.all():
+            self.assertEqual(counters.get_unread_counts(profile.user_id), counters.count_unread(profile.user_id))
+            self.assertEqual(profile.rating_count, Review.objects.filter(reviewed_user_id=profile.user_id).count())
+        pairs = {tuple(sorted(pair)) for pair in Message.objects.values_list('sender_id', 'recipient_id')}
+        self.assertEqual(Conversation.objects.count(), len(pairs))
+        offer = Offer.objects.filter(is_active=True).first()
+        self.assertEqual(catalog.offer_count(offer.category_id), offer.category.offers.filter(is_active=True).count())
+        self.assertIn(offer, search.search_offers(Offer.objects.all(), offer.title))
+
+
+class TradesDashboardTests(TradeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Trade.objects.filter(pk=self.competing.pk).update(status='rejected')
+        Trade.objects.bulk_create([
+            Trade(offer2=self.offered, user1=self.owner, user2=self.other, status='completed')
+            for _ in range(3)
+        ])
+        self.client.force_login(self.owner)
+
+    def test_status_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = trade_status_counts(self.owner)
+
+        self.assertEqual(counts['all'], 5)
+        self.assertEqual((counts['pending'], counts['rejected'], counts['completed']), (1, 1, 3))
+        self.assertEqual(trade_status_counts(self.third)['all'], 1)
+
+    def test_dashboard_pages_each_direction(self):
+        with mock.patch('core.views.TRADES_DASHBOARD_PAGE_SIZE', 2):
+            response = self.client.get(reverse('core:my_trades'))
+            self.assertEqual(response.status_code, 200)
+            sent = response.context['sent_trades']
+            self.assertEqual(len(sent), 2)
+            self.assertTrue(sent.has_next)
+            self.assertEqual(len(response.context['received_trades']), 2)
+            self.assertFalse(response.context['received_trades'].has_next)
+
+            response = self.client.get(reverse('core:my_trades'), {'sent_cursor': sent.next_cursor})
+            self.assertEqual(len(response.context['sent_trades']), 1)
+
+        tabs = {value: count for value, _, count in response.context['status_tabs']}
+        self.assertEqual((tabs[''], tabs['completed']), (5, 3))
+
+    def test_status_filter_keeps_query_count(self):
+        response = self.client.get(reverse('core:my_trades'), {'status': 'completed'})
+        self.assertEqual(len(response.context['sent_trades']), 3)
+        self.assertEqual(len(response.context['received_trades']), 0)
+
+        Trade.objects.bulk_create([
+            Trade(offer2=self.offered, user1=self.owner, user2=self.other, status='completed')
+            for _ in range(10)
+        ])
+        response = assert_query_budget(self.client, reverse('core:my_trades'), data={'status': 'nepostojeci'})
+        self.assertEqual(response.context['status'], '')
+        self.assertEqual(len(response.context['sent_trades']), 12)
+
+
+class NotificationDigestTests(BarterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        UserProfile.objects.filter(user=self.owner).update(notification_digest=True)
+
+    def notify(self, recipient, notification_type='review', **fields):
+        return Notification.objects.create(
+            recipient=recipient, actor=self.third, notification_type=notification_type,
+            title='Naslov', message='Poruka', **fields,
+        )
+
+    def test_digest_summarizes_unread_since_last_send(self):
+        self.notify(self.owner)
+        self.notify(self.owner)
+        self.notify(self.owner, 'offer_viewed', count=4)
+        self.notify(self.owner, is_read=True)
+        self.notify(self.other)
+
+        self.assertEqual(notifications.send_digests(), 1)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.owner.email])
+        self.assertIn('⭐ Nova recenzija: 2', mail.outbox[0].body)
+        self.assertIn('👁️ Neko pogledao vašu ponudu: 4', mail.outbox[0].body)
+        self.assertIsNotNone(UserProfile.objects.get(user=self.owner).digest_sent_at)
+
+        # Već prijavljeno se ne šalje ponovo, nova notifikacija ulazi u sledeći pregled
+        later = timezone.now() + timedelta(minutes=1)
+        self.assertEqual(notifications.send_digests(now=later), 0)
+        with mock.patch('django.utils.timezone.now', return_value=later + timedelta(minutes=1)):
+            self.notify(self.owner)
+        self.assertEqual(notifications.send_digests(now=later + timedelta(minutes=2)), 1)
+        self.assertIn('⭐ Nova recenzija: 1', mail.outbox[1].body)
+
+    def test_dry_run_sends_nothing(self):
+        self.notify(self.owner)
+
+        self.assertEqual(notifications.send_digests(dry_run=True), 1)
+        self.assertEqual(mail.outbox, [])
+        self.assertIsNone(UserProfile.objects.get(user=self.owner).digest_sent_at)
+
+    def test_toggle_digest(self):
+        self.client.force_login(self.other)
+        self.client.post(reverse('core:toggle_notification_digest'))
+
+        self.assertTrue(UserProfile.objects.get(user=self.other).notification_digest)
+
+
+class RetentionTests(BarterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.old = timezone.now() - timedelta(days=settings.RETENTION_NOTIFICATIONS_UNREAD_DAYS + 1)
+
+    def notify(self, count, is_read, old=True):
+        rows = [
+            Notification.objects.create(
+                recipient=self.owner, notification_type='review', title='Naslov', message='Poruka', is_read=is_read,
+            )
+            for _ in range(count)
+        ]
+        if old:
+            Notification.objects.filter(pk__in=[row.pk for row in rows]).update(created_at=self.old)
+        return rows
+
+    def test_purge_in_batches_and_archive(self):
+        expired = self.notify(5, is_read=True)
+        kept = self.notify(1, is_read=True, old=False)
+        policy = retention.get_policy('notifications_read')
+
+        self.assertEqual(retention.purge(policy, batch_size=2, sleep=0, max_batches=1), 2)
+        self.assertEqual(retention.count_expired(policy), 3)
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(retention.purge(policy, batch_size=2, sleep=0, archive_dir=directory), 3)
+            [path] = glob.glob(os.path.join(directory, 'notifications_read-*.jsonl.gz'))
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                archived = [json.loads(line)['id'] for line in f]
+
+        self.assertEqual(archived, [row.pk for row in expired[2:]])
+        self.assertEqual(list(Notification.objects.values_list('pk', flat=True)), [kept[0].pk])
+
+    def test_unread_purge_adjusts_counters(self):
+        self.notify(2, is_read=False)
+        self.notify(1, is_read=False, old=False)
+        self.assertEqual(counters.get_unread_counts(self.owner.pk)['notifications'], 3)
+
+        retention.purge(retention.get_policy('notifications_unread'), sleep=0)
+
+        self.assertEqual(counters.get_unread_counts(self.owner.pk)['notifications'], 1)
+
+    def test_last_message_of_conversation_is_kept(self):
+        first = Message.objects.create(sender=self.other, recipient=self.owner, body='Zdravo', is_read=True)
+        last = Message.objects.create(sender=self.owner, recipient=self.other, body='Zdravo i tebi', is_read=True)
+        Message.objects.update(timestamp=timezone.now() - timedelta(days=settings.RETENTION_MESSAGES_READ_DAYS + 1))
+
+        self.assertEqual(retention.purge(retention.get_policy('messages_read'), sleep=0), 1)
+        self.assertFalse(Message.objects.filter(pk=first.pk).exists())
+        self.assertEqual(Conversation.objects.get().last_message, last)
+
+    @override_settings(RETENTION_NOTIFICATIONS_READ_DAYS=0)
+    def test_disabled_policy_keeps_rows(self):
+        self.notify(1, is_read=True)
+
+        self.assertEqual(retention.purge(retention.get_policy('notifications_read'), sleep=0), 0)
+        self.assertEqual(Notification.objects.count(), 1)
+
+
+class PageCacheTests(BarterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.second = Offer.objects.create(
+            title='Laptop', description='Polovan', offered='Laptop', wanted='Bicikl',
+            category=self.category, owner=self.other,
+        )
+
+    def get(self, offer, **query):
+        return self.client.get(reverse('core:offer_detail', args=[offer.pk]), query)
+
+    def save(self, offer, **fields):
+        for name, value in fields.items():
+            setattr(offer, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            offer.save()
+
+    def test_purge_by_tag_invalidates_only_dependent_pages(self):
+        self.assertEqual(self.get(self.offer)['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.get(self.second)['X-Page-Cache'], 'MISS')
+        response = self.get(self.offer, utm_source='mejl')
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertIn('public', response['Cache-Control'])
+
+        self.save(self.second, title='Laptop Lenovo')
+        self.assertEqual(self.get(self.offer)['X-Page-Cache'], 'HIT')
+        response = self.get(self.second)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Laptop Lenovo')
+
+        # Promena profila vlasnika poništava i njegove ponude
+        with self.captureOnCommitCallbacks(execute=True):
+            page_cache.purge(f'user:{self.owner.pk}')
+        self.assertEqual(self.get(self.offer)['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.get(self.second)['X-Page-Cache'], 'HIT')
+
+    def test_purge_waits_for_commit(self):
+        self.get(self.offer)
+        with self.captureOnCommitCallbacks(execute=False):
+            page_cache.purge(f'offer:{self.offer.pk}')
+
+        self.assertEqual(self.get(self.offer)['X-Page-Cache'], 'HIT')
+
+    def test_cached_hit_still_counts_view(self):
+        self.get(self.offer)
+        with mock.patch('core.views.record_view') as record_view:
+            self.assertEqual(self.get(self.offer)['X-Page-Cache'], 'HIT')
+        record_view.assert_called_once()
+
+    @override_settings(PAGE_SHELL=False)
+    def test_logged_in_users_bypass_cache_without_shell(self):
+        self.client.force_login(self.other)
+        response = self.get(self.offer)
+
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertIn('private', response['Cache-Control'])
+
+
+class FragmentTests(BarterTestCase):
+
+    def fragments(self, *names):
+        response = self.client.get(reverse('core:page_fragments'), {'f': names})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        return response.json()
+
+    def test_shell_is_shared_and_user_parts_are_fragments(self):
+        anonymous = self.client.get(reverse('core:offer_detail', args=[self.offer.pk]))
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('core:offer_detail', args=[self.offer.pk]))
+
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertEqual(response.content, anonymous.content)
+        self.assertContains(response, f'data-fragment="offer_actions:{self.offer.pk}"')
+        self.assertNotContains(response, 'Uredi ponudu')
+
+    def test_fragments_render_for_current_user(self):
+        names = ('navbar', f'offer_actions:{self.offer.pk}', f'offer_contact:{self.offer.pk}')
+        self.assertEqual(self.fragments(*names), {'authenticated': False, 'fragments': {}})
+
+        self.client.force_login(self.owner)
+        owner = self.fragments(*names)['fragments']
+        self.assertIn('Uredi ponudu', owner[f'offer_actions:{self.offer.pk}'])
+        self.assertNotIn('Pošalji poruku', owner[f'offer_contact:{self.offer.pk}'])
+        self.assertIn('Sve notifikacije', owner['navbar'])
+
+        self.client.force_login(self.other)
+        other = self.fragments(*names)['fragments']
+        self.assertIn('Inicijuj razmenu', other[f'offer_actions:{self.offer.pk}'])
+        self.assertIn('Pošalji poruku', other[f'offer_contact:{self.offer.pk}'])
+
+    def test_unknown_and_missing_fragments_are_skipped(self):
+        self.client.force_login(self.other)
+
+        fragments = self.fragments('nepoznat', 'offer_actions:abc', 'offer_actions:999999', 'navbar', 'navbar')
+
+        self.assertEqual(list(fragments['fragments']), ['navbar'])
+
+
+class ConditionalGetTests(BarterTestCase):
+
+    def assertRevalidates(self, url, change, queries):
+        """Isti ETag daje 304 (sa datim brojem upita), posle promene 200 i novi ETag"""
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(url, headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_offer_detail_api(self):
+        url = reverse('core:get_offer_detail_api', args=[self.offer.pk])
+        self.assertRevalidates(url, lambda: Offer.objects.filter(pk=self.offer.pk).update(views_count=5), 1)
+        self.assertRevalidates(
+            url, lambda: Review.objects.create(reviewer=self.other, reviewed_user=self.owner, offer=self.offer, rating=5), 1,
+        )
+
+    def test_offer_stats_api(self):
+        url = reverse('core:get_offer_stats', args=[self.offer.pk])
+        self.assertRevalidates(
+            url, lambda: Trade.objects.create(user1=self.other, user2=self.owner, offer2=self.offer), 1,
+        )
+
+    def test_categories_api(self):
+        self.assertRevalidates(reverse('core:get_categories'), lambda: Category.objects.create(name='Knjige'), 0)
+
+    def test_unread_count_api(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('core:get_unread_count'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertRevalidates(
+            reverse('core:get_unread_count'),
+            lambda: Message.objects.create(sender=self.other, recipient=self.owner, body='Zdravo'),
+            2,
+        )
+
+    def test_missing_offer_is_404(self):
+        response = self.client.get(reverse('core:get_offer_detail_api', args=[999999]), headers={'if_none_match': '*'})
+        self.assertEqual(response.status_code, 404)
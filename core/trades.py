@@ -0,0 +1,294 @@
+"""
+Prelazi stanja razmene.
+
+Dozvoljeni prelazi su u TRANSITIONS. Svaki prelaz se izvršava u jednoj
+transakciji: red razmene se zaključava (select_for_update), pa se status
+menja set-based UPDATE-om uslovljenim starim statusom - to je ujedno i
+optimistička provera za baze bez zaključavanja redova (SQLite). Završena
+razmena deaktivira obe ponude jednim UPDATE-om.
+
+Prihvatanje rezerviše ponude razmene (OfferReservation, jedinstvena po
+ponudi): druga razmena iste ponude ne može biti prihvaćena, a konkurentni
+zahtevi na čekanju se odbijaju jednim UPDATE-om. Rezervacija važi
+TRADE_RESERVATION_HOURS; razmena koja do tada nije završena se otkazuje
+(expire_reservations, ili odmah kada neko drugi prihvati istu ponudu).
+expire_reservations pokreće run_workers na svakih
+TRADE_RESERVATION_CHECK_INTERVAL sekundi; bez worker-a komandu
+expire_reservations treba pokretati cron-om.
+
+Pošto update() ne okida signale, sporedni efekti su eksplicitni: verzija
+statistika se povećava u transakciji, a notifikacije idu u red
+(core.notifications) u istoj transakciji - isporučuju se tačno jednom, i
+samo ako je prelaz commit-ovan.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from barter import page_cache
+
+from . import catalog
+from . import jobs
+from .notifications import notify_many
+from .stats import bump_stats_version
+
+# akcija -> (dozvoljena početna stanja, novo stanje, ko sme: user1/user2)
+TRANSITIONS = {
+    'accept': ({'pending'}, 'accepted', {'user2'}),
+    'reject': ({'pending'}, 'rejected', {'user2'}),
+    'cancel': ({'pending'}, 'cancelled', {'user1'}),
+    'complete': ({'accepted'}, 'completed', {'user1', 'user2'}),
+    # samo sistem, kada rezervacija istekne
+    'expire': ({'accepted'}, 'cancelled', set()),
+}
+
+
+class TradeError(Exception):
+    """Prelaz nije moguć; poruka je namenjena korisniku"""
+
+
+class TradePermissionError(TradeError):
+    def __init__(self, message='Nemaš dozvolu za ovu akciju!'):
+        super().__init__(message)
+
+
+class InvalidTransition(TradeError):
+    pass
+
+
+def allowed_actions(trade, user):
+    """Akcije koje korisnik trenutno sme da izvrši nad razmenom"""
+    roles = _roles(trade, user)
+    return [
+        action for action, (sources, _, actors) in TRANSITIONS.items()
+        if trade.status in sources and roles & actors
+    ]
+
+
+def _roles(trade, user):
+    roles = set()
+    if trade.user1_id == user.pk:
+        roles.add('user1')
+    if trade.user2_id == user.pk:
+        roles.add('user2')
+    return roles
+
+
+def transition(trade_id, user, action, offer=None, buy=False):
+    """
+    Izvrši prelaz i vrati osveženu razmenu.
+
+    accept prima odabranu ponudu user1 (offer) ili buy=True za otkup.
+    Baca TradePermissionError ili InvalidTransition.
+    """
+    from .models import Offer, OfferReservation, Trade
+
+    sources, target, actors = TRANSITIONS[action]
+
+    with transaction.atomic():
+        trade = (
+            Trade.objects.select_for_update(of=('self',))
+            .select_related('user1', 'user2', 'offer1', 'offer2')
+            .get(pk=trade_id)
+        )
+        if not _roles(trade, user) & actors:
+            raise TradePermissionError()
+        if trade.status not in sources:
+            raise InvalidTransition(
+                f'Razmena je već u stanju "{trade.get_status_display()}".'
+            )
+
+        now = timezone.now()
+        changes = {'status': target, 'updated_at': now}
+        if action == 'accept':
+            if buy:
+                if not trade.wants_to_buy:
+                    raise InvalidTransition('Opcija za otkup nije dostupna!')
+                changes['offer1'] = None
+            elif offer is not None:
+                if offer.owner_id != trade.user1_id or not offer.is_active:
+                    raise InvalidTransition('Nedozvoljen izbor!')
+                changes['offer1'] = offer
+
+        updated = Trade.objects.filter(pk=trade.pk, status=trade.status).update(**changes)
+        if not updated:
+            raise InvalidTransition('Razmenu je u međuvremenu promenio drugi korisnik.')
+
+        for field, value in changes.items():
+            setattr(trade, field, value)
+        offer_ids = [pk for pk in (trade.offer1_id, trade.offer2_id) if pk]
+        notifications = [_notification(trade, user, action, buy)]
+
+        if action == 'accept':
+            _reserve(trade, offer_ids, now)
+            notifications += _reject_competing(trade, offer_ids, now)
+        elif action == 'complete':
+            OfferReservation.objects.filter(trade=trade).delete()
+            completed = Offer.objects.filter(pk__in=offer_ids, is_active=True)
+            for category_id in completed.select_for_update().values_list('category_id', flat=True):
+                catalog.adjust_count(category_id, -1)
+            completed.update(is_active=False, updated_at=now)
+            page_cache.purge('offers', *[f'offer:{pk}' for pk in offer_ids])
+            notifications += _reject_competing(trade, offer_ids, now)
+
+        bump_stats_version(trade.user1_id, trade.user2_id)
+        notify_many(notifications)
+
+    return trade
+
+
+def _notification(trade, user, action, buy):
+    """Podaci notifikacije za drugu stranu u razmeni"""
+    recipient_id = trade.user2_id if user.pk == trade.user1_id else trade.user1_id
+    data = {'recipient_id': recipient_id, 'actor_id': user.pk, 'trade_id': trade.pk}
+
+    if action == 'accept' and buy:
+        data.update(
+            notification_type='trade_accepted',
+            title='Otkup prihvaćen!',
+            message=f'{user.username} je prihvatio vašu ponudu za otkup od {trade.purchase_price} дин.!',
+        )
+    elif action == 'accept' and trade.offer1 is not None:
+        data.update(
+            notification_type='trade_accepted',
+            title='Razmena prihvaćena!',
+            message=f'{user.username} je prihvatio vašu razmenu sa artiklom "{trade.offer1.title}"!',
+        )
+    elif action == 'accept':
+        data.update(
+            notification_type='trade_accepted',
+            title='Razmena prihvaćena!',
+            message=f'{user.username} je prihvatio vašu razmenu!',
+        )
+    elif action == 'reject':
+        data.update(
+            notification_type='trade_rejected',
+            title='Razmena odbijena',
+            message=f'{user.username} je odbio vašu razmenu.',
+        )
+    elif action == 'cancel':
+        data.update(
+            notification_type='trade',
+            title='Zahtev za razmenu povučen',
+            message=f'{user.username} je povukao zahtev za razmenu: {trade.offer2.title}',
+        )
+    else:
+        data.update(
+            notification_type='trade',
+            title='Razmena završena!',
+            message=f'{user.username} je završio razmenu.',
+        )
+    return data
+
+
+def _reserve(trade, offer_ids, now):
+    """Zauzmi ponude za razmenu; istekle rezervacije drugih razmena se prvo oslobađaju"""
+    from .models import OfferReservation
+
+    expire_reservations(offer_ids=offer_ids, now=now)
+    expires_at = now + timedelta(hours=settings.TRADE_RESERVATION_HOURS)
+    try:
+        with transaction.atomic():
+            OfferReservation.objects.bulk_create([
+                OfferReservation(offer_id=offer_id, trade=trade, expires_at=expires_at)
+                for offer_id in offer_ids
+            ])
+    except IntegrityError:
+        raise InvalidTransition('Ponuda je već rezervisana u drugoj razmeni.')
+
+
+def _reject_competing(trade, offer_ids, now):
+    """Odbij ostale zahteve na čekanju za iste ponude jednim UPDATE-om"""
+    from .models import Trade
+
+    competing = list(
+        Trade.objects
+        .filter(Q(offer1_id__in=offer_ids) | Q(offer2_id__in=offer_ids), status='pending')
+        .exclude(pk=trade.pk)
+        .values_list('pk', 'user1_id', 'user2_id', 'offer2__title')
+    )
+    if not competing:
+        return []
+
+    Trade.objects.filter(pk__in=[row[0] for row in competing], status='pending').update(
+        status='rejected', updated_at=now,
+    )
+    bump_stats_version(*{user_id for row in competing for user_id in row[1:3]})
+    return [
+        {
+            'recipient_id': user1_id,
+            'actor_id': user2_id,
+            'trade_id': trade_id,
+            'notification_type': 'trade_rejected',
+            'title': 'Razmena odbijena',
+            'message': f'Ponuda "{title}" je rezervisana u drugoj razmeni.',
+        }
+        for trade_id, user1_id, user2_id, title in competing
+    ]
+
+
+def expire_reservations(offer_ids=None, now=None):
+    """
+    Otkaži prihvaćene razmene čije su rezervacije istekle i oslobodi ponude.
+
+    Vraća broj otkazanih razmena.
+    """
+    from .models import OfferReservation, Trade
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = OfferReservation.objects.filter(expires_at__lte=now)
+        if offer_ids is not None:
+            expired = expired.filter(offer_id__in=offer_ids)
+        trade_ids = set(expired.values_list('trade_id', flat=True))
+        if not trade_ids:
+            return 0
+
+        stalled = list(
+            Trade.objects.select_for_update()
+            .filter(pk__in=trade_ids, status__in=TRANSITIONS['expire'][0])
+            .values_list('pk', 'user1_id', 'user2_id')
+        )
+        Trade.objects.filter(pk__in=[row[0] for row in stalled]).update(
+            status=TRANSITIONS['expire'][1], updated_at=now,
+        )
+        OfferReservation.objects.filter(trade_id__in=trade_ids).delete()
+        bump_stats_version(*{user_id for row in stalled for user_id in row[1:]})
+
+        notifications = [
+            {
+                'recipient_id': recipient_id,
+                'trade_id': trade_id,
+                'notification_type': 'trade',
+                'title': 'Razmena otkazana',
+                'message': 'Razmena nije završena na vreme, pa su ponude ponovo slobodne.',
+            }
+            for trade_id, user1_id, user2_id in stalled
+            for recipient_id in (user1_id, user2_id)
+        ]
+        notify_many(notifications)
+    return len(stalled)
+
+
+@jobs.periodic('trades.expire_reservations', every=settings.TRADE_RESERVATION_CHECK_INTERVAL)
+def expire_reservations_task(payloads):
+    expire_reservations()
+
+
+def accept(trade_id, user, offer=None, buy=False):
+    return transition(trade_id, user, 'accept', offer=offer, buy=buy)
+
+
+def reject(trade_id, user):
+    return transition(trade_id, user, 'reject')
+
+
+def cancel(trade_id, user):
+    return transition(trade_id, user, 'cancel')
+
+
+def complete(trade_id, user):
+    return transition(trade_id, user, 'complete')
@@ -41,6 +41,7 @@ urlpatterns = [
     path('notifications/', views.notifications_view, name='notifications'),
     path('notifications/<int:pk>/read/', views.mark_notification_read, name='mark_notification_read'),
     path('notifications/<int:pk>/delete/', views.delete_notification, name='delete_notification'),
+    path('notifications/digest/', views.toggle_notification_digest, name='toggle_notification_digest'),
 
     # Auth
     path('login/', views.login_view, name='login'),
@@ -50,8 +51,12 @@ urlpatterns = [
     # Google OAuth
     path('oauth/google/', views.google_oauth_redirect, name='google_oauth_redirect'),
 
+    # Fragmenti keširanih stranica (PAGE_SHELL)
+    path('fragments/', views.page_fragments, name='page_fragments'),
+
     # API Endpoints
     path('api/unread-count/', views.get_unread_count, name='get_unread_count'),
+    path('api/unread-stream/', views.unread_stream, name='unread_stream'),
     path('api/offer/<int:pk>/stats/', views.get_offer_stats, name='get_offer_stats'),
     path('api/user/<str:username>/stats/', views.get_user_stats, name='get_user_stats'),
     path('api/categories/', views.get_categories, name='get_categories'),
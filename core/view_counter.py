@@ -0,0 +1,122 @@
+"""
+Baferovani brojač pregleda ponuda.
+
+Pregledi se skupljaju u memoriji procesa i upisuju u bazu grupno, jednim
+UPDATE ... SET views_count = views_count + n po grupi ponuda sa istim n.
+Upis se radi kada bafer pređe prag, periodično iz pozadinske niti i pri gašenju
+procesa (atexit + worker_exit hook u gunicorn.conf.py). Ne dira se updated_at i
+nema zaključavanja istog reda na svaki pregled.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+
+from barter.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+def client_identity(request):
+    """Sesija ako postoji, inače IP adresa klijenta"""
+    session_key = getattr(request, 'session', None) and request.session.session_key
+    if session_key:
+        return f's:{session_key}'
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    ip = forwarded.split(',')[0].strip() if forwarded else request.META.get('REMOTE_ADDR', '')
+    return f'ip:{ip}'
+
+
+class ViewCounter:
+    """Bafer pregleda za jedan proces (gunicorn worker)"""
+
+    def __init__(self, flush_interval=10, flush_threshold=100):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def record(self, offer_id, count=1):
+        """Dodaj pregled u bafer; upiši odmah ako je prag dostignut"""
+        with self._lock:
+            self._pending[offer_id] += count
+            full = sum(self._pending.values()) >= self.flush_threshold
+            self._ensure_timer()
+        if full:
+            self.flush()
+
+    def pending(self, offer_id):
+        """Broj pregleda ponude koji još nisu upisani u bazu"""
+        with self._lock:
+            return self._pending.get(offer_id, 0)
+
+    def size(self):
+        """Ukupan broj neupisanih pregleda"""
+        with self._lock:
+            return sum(self._pending.values())
+
+    def flush(self):
+        """Upiši bafer u bazu; vraća broj upisanih pregleda"""
+        from .models import Offer
+
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, Counter()
+            if not batch:
+                return 0
+
+            by_count = defaultdict(list)
+            for offer_id, count in batch.items():
+                by_count[count].append(offer_id)
+
+            try:
+                for count, offer_ids in by_count.items():
+                    Offer.objects.filter(pk__in=offer_ids).update(views_count=F('views_count') + count)
+            except Exception:
+                logger.exception('Upis pregleda nije uspeo, vraćam u bafer')
+                with self._lock:
+                    self._pending.update(batch)
+                return 0
+            return sum(batch.values())
+
+    def _ensure_timer(self):
+        if self._timer is None or not self._timer.is_alive():
+            self._timer = threading.Thread(target=self._run_timer, name='view-counter-flush', daemon=True)
+            self._timer.start()
+
+    def _run_timer(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            finally:
+                # Pozadinska nit ima sopstvenu konekciju
+                connection.close()
+
+
+view_counter = ViewCounter(
+    flush_interval=getattr(settings, 'OFFER_VIEWS_FLUSH_INTERVAL', 10),
+    flush_threshold=getattr(settings, 'OFFER_VIEWS_FLUSH_THRESHOLD', 100),
+)
+atexit.register(view_counter.flush)
+registry.gauge('barter_view_counter_pending', 'Neupisani pregledi ponuda u baferu', view_counter.size)
+
+
+def record_view(request, offer_id):
+    """
+    Zabeleži pregled ponude. Ako je OFFER_VIEWS_DEDUP_WINDOW > 0, isti posetilac
+    (sesija ili IP) se broji najviše jednom u tom prozoru.
+    """
+    window = getattr(settings, 'OFFER_VIEWS_DEDUP_WINDOW', 0)
+    if window and not cache.add(f'offer_view:{offer_id}:{client_identity(request)}', 1, window):
+        return False
+    view_counter.record(offer_id)
+    return True
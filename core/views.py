@@ -3,14 +3,35 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.views.decorators.http import require_http_methods
-from django.http import JsonResponse
-from django.db.models import Q, Avg
-from django.core.paginator import Paginator
+from django.views.decorators.http import require_http_methods, condition
+from django.views.decorators.vary import vary_on_cookie
+from django.views.decorators.cache import cache_control
+from django.utils.cache import patch_cache_control
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.db.models import Count, Q
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+import asyncio
+import hashlib
 import json
 import logging
-
-from .models import Category, Offer, Message, Trade, UserProfile, Review, Notification
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from barter.instrumentation import query_budget
+from barter import page_cache
+
+from .models import Offer, Message, Conversation, Trade, UserProfile, Review, Notification
+from . import search
+from .pagination import CursorPaginator
+from .view_counter import record_view, view_counter
+from .events import get_broker
+from . import counters
+from . import trades
+from . import catalog
+from . import fragments
+from .stats import get_user_stats as cached_user_stats
 from .forms import RegistrationForm
 
 logger = logging.getLogger('allauth')
@@ -40,23 +61,16 @@ setup_allauth_logging()
 
 # ==================== HOME ====================
 
+@page_cache.cache_page('home')
 def home(request):
     """Početna stranica"""
-    active_offers = Offer.objects.filter(is_active=True).order_by('-created_at')[:6]
-    categories = Category.objects.all()
-
-    unread_count = 0
-
-    if request.user.is_authenticated:
-        unread_count = Message.objects.filter(
-            recipient=request.user,
-            is_read=False
-        ).count()
+    page_cache.tag(request, 'offers', 'catalog')
+    active_offers = catalog.attach(Offer.objects.filter(is_active=True).order_by('-created_at')[:6])
+    categories = catalog.categories()
 
     context = {
         'active_offers': active_offers,
         'categories': categories,
-        'unread_count': unread_count,
         'show_messages': True,
     }
     return render(request, 'core/home.html', context)
@@ -64,17 +78,16 @@ def home(request):
 
 # ==================== OFFERS ====================
 
+@page_cache.cache_page('offer_list')
 def offer_list(request):
     """Lista svih ponuda sa pretragom i filteriranjem"""
+    page_cache.tag(request, 'offers', 'catalog')
     offers = Offer.objects.filter(is_active=True).order_by('-created_at')
-    categories = Category.objects.all()
+    categories = catalog.categories()
 
     query = request.GET.get('q', '')
     if query:
-        offers = offers.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query)
-        )
+        offers = search.search_offers(offers, query)
 
     category_id = request.GET.get('category', '')
     if category_id:
@@ -85,9 +98,10 @@ def offer_list(request):
     if user:
         offers = offers.filter(owner__username=user)
 
-    paginator = Paginator(offers, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    ordering = ('-search_rank', '-id') if query else ('-created_at', '-id')
+    paginator = CursorPaginator(offers, 12, ordering=ordering)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    page_obj.object_list = catalog.attach(page_obj.object_list)
 
     context = {
         'page_obj': page_obj,
@@ -100,13 +114,20 @@ def offer_list(request):
     return render(request, 'core/offer_list.html', context)
 
 
+def count_offer_view(request, pk):
+    """Zabeleži pregled ponude, osim kada je gleda vlasnik"""
+    if request.user.is_authenticated and Offer.objects.filter(pk=pk, owner=request.user).exists():
+        return
+    record_view(request, pk)
+
+
+@page_cache.cache_page('offer_detail', on_request=count_offer_view)
 def offer_detail(request, pk):
     """Detalj ponude"""
-    offer = get_object_or_404(Offer, pk=pk)
+    offer = get_object_or_404(Offer.objects.select_related('owner__userprofile', 'category'), pk=pk)
+    page_cache.tag(request, f'offer:{offer.pk}', f'user:{offer.owner_id}', 'catalog')
 
-    if request.user != offer.owner:
-        offer.views_count += 1
-        offer.save()
+    offer.views_count += view_counter.pending(offer.pk)
 
     reviews = offer.reviews.all().order_by('-created_at')
 
@@ -121,7 +142,7 @@ def offer_detail(request, pk):
 @login_required(login_url='core:login')
 def offer_create(request):
     """Kreiraj novu ponudu"""
-    categories = Category.objects.all()
+    categories = catalog.categories()
 
     if request.method == 'POST':
         title = request.POST.get('title', '').strip()
@@ -136,8 +157,12 @@ def offer_create(request):
             messages.error(request, 'Molim popuni sve obavezne polje!')
             return redirect('core:offer_create')
 
+        category = catalog.get(category_id)
+        if category is None:
+            messages.error(request, 'Izabrana kategorija ne postoji!')
+            return redirect('core:offer_create')
+
         try:
-            category = Category.objects.get(id=category_id)
             offer = Offer.objects.create(
                 title=title,
                 description=description,
@@ -173,7 +198,7 @@ def offer_edit(request, pk):
         messages.error(request, 'Nemaš pristup ovoj ponudi!')
         return redirect('core:home')
 
-    categories = Category.objects.all()
+    categories = catalog.categories()
 
     if request.method == 'POST':
         title = request.POST.get('title', '').strip()
@@ -187,9 +212,14 @@ def offer_edit(request, pk):
             messages.error(request, 'Molim popuni sve obavezne polje!')
             return redirect('core:offer_edit', pk=pk)
 
+        category = catalog.get(category_id)
+        if category is None:
+            messages.error(request, 'Izabrana kategorija ne postoji!')
+            return redirect('core:offer_edit', pk=pk)
+
         offer.title = title
         offer.description = description
-        offer.category_id = category_id
+        offer.category = category
         offer.price_range = price_range
         offer.location = location
         offer.city = city
@@ -237,11 +267,10 @@ def offer_delete(request, pk):
 @login_required(login_url='core:login')
 def my_offers(request):
     """Moje ponude"""
-    offers = Offer.objects.filter(owner=request.user).order_by('-created_at')
+    offers = Offer.objects.filter(owner=request.user)
 
-    paginator = Paginator(offers, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(offers, 12)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     context = {
         'page_obj': page_obj,
@@ -262,17 +291,17 @@ def profile_view(request):
     reviews = Review.objects.filter(reviewed_user=request.user).order_by('-created_at')
 
     # Izračunaj statistike
+    profile = request.user.userprofile
     active_offers = user_offers.filter(is_active=True).count()
     total_views = sum(offer.views_count for offer in user_offers)
-    avg_rating = reviews.aggregate(avg=Avg('rating'))['avg'] if reviews else 0
 
     context = {
         'user_offers': user_offers,
         'active_offers': active_offers,
         'total_views': total_views,
         'reviews': reviews,
-        'avg_rating': round(avg_rating, 1) if avg_rating else 0,
-        'review_count': reviews.count(),
+        'avg_rating': profile.average_rating,
+        'review_count': profile.total_reviews,
         'show_messages': True,
     }
     return render(request, 'core/profile.html', context)
@@ -280,19 +309,17 @@ def profile_view(request):
 
 def user_profile_view(request, username):
     """Pregled profila drugog korisnika"""
-    profile_user = get_object_or_404(User, username=username)
+    profile_user = get_object_or_404(User.objects.select_related('userprofile'), username=username)
     user_offers = profile_user.offers.filter(is_active=True).order_by('-created_at')[:6]
-    reviews = Review.objects.filter(reviewed_user=profile_user).order_by('-created_at')
-
-    avg_rating = reviews.aggregate(avg=Avg('rating'))['avg'] if reviews else 0
-    review_count = reviews.count()
+    reviews = Review.objects.filter(reviewed_user=profile_user).select_related('reviewer').order_by('-created_at')
+    profile = profile_user.userprofile
 
     context = {
         'profile_user': profile_user,
         'user_offers': user_offers,
         'reviews': reviews,
-        'avg_rating': round(avg_rating, 1) if avg_rating else 0,
-        'review_count': review_count,
+        'avg_rating': profile.average_rating,
+        'review_count': profile.total_reviews,
         'show_messages': True,
     }
     return render(request, 'core/user_profile.html', context)
@@ -300,47 +327,29 @@ def user_profile_view(request, username):
 
 # ==================== MESSAGES ====================
 
+@query_budget(6)
 @login_required(login_url='core:login')
 def my_messages(request):
     """Lista razgovora"""
-    conversations = []
-
-    sent_to = Message.objects.filter(sender=request.user).values_list('recipient', flat=True).distinct()
-    received_from = Message.objects.filter(recipient=request.user).values_list('sender', flat=True).distinct()
-
-    user_ids = set(sent_to) | set(received_from)
-
-    unread_count = 0
-
-    for user_id in user_ids:
-        user = User.objects.get(id=user_id)
-        last_message = Message.objects.filter(
-            Q(sender=request.user, recipient=user) |
-            Q(sender=user, recipient=request.user)
-        ).order_by('-timestamp').first()
-
-        user_unread = Message.objects.filter(
-            sender=user,
-            recipient=request.user,
-            is_read=False
-        ).count()
-
-        unread_count += user_unread
+    threads = Conversation.for_user(request.user).select_related(
+        'user_low', 'user_high', 'last_message__sender'
+    )
 
-        conversations.append({
-            'user': user,
-            'last_message': last_message,
-            'unread_count': user_unread,
-        })
+    paginator = CursorPaginator(threads, 20, ordering=('-last_activity', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
-    conversations.sort(
-        key=lambda x: x['last_message'].timestamp if x['last_message'] else None,
-        reverse=True
-    )
+    conversations = [
+        {
+            'user': conversation.other_user(request.user),
+            'last_message': conversation.last_message,
+            'unread_count': conversation.unread_for(request.user),
+        }
+        for conversation in page_obj
+    ]
 
     context = {
+        'page_obj': page_obj,
         'conversations': conversations,
-        'unread_count': unread_count,
         'show_messages': True,
     }
     return render(request, 'core/my_messages.html', context)
@@ -405,11 +414,13 @@ def view_conversation(request, username):
     ).order_by('timestamp')
 
     # Označi sve primljene poruke kao pročitane
-    Message.objects.filter(
+    read_count = Message.objects.filter(
         sender=other_user,
         recipient=request.user,
         is_read=False
     ).update(is_read=True)
+    Conversation.mark_read(request.user, other_user)
+    counters.adjust(request.user.pk, messages=-read_count)
 
     context = {
         'other_user': other_user,
@@ -421,15 +432,53 @@ def view_conversation(request, username):
 
 # ==================== TRADES ====================
 
+TRADES_DASHBOARD_PAGE_SIZE = 12
+
+
+def trade_status_counts(user):
+    """Broj razmena korisnika po statusu (i ukupno) jednim agregatnim upitom"""
+    aggregates = {
+        status: Count('pk', filter=Q(status=status))
+        for status, _ in Trade.STATUS_CHOICES
+    }
+    aggregates['all'] = Count('pk')
+    return Trade.objects.filter(Q(user1=user) | Q(user2=user)).aggregate(**aggregates)
+
+
+@query_budget(6)
 @login_required(login_url='core:login')
 def my_trades(request):
-    """Moje razmene"""
-    sent_trades = Trade.objects.filter(user1=request.user).order_by('-created_at')
-    received_trades = Trade.objects.filter(user2=request.user).order_by('-created_at')
+    """Moje razmene - poslate i primljene, po statusu i sa kursor paginacijom"""
+    status = request.GET.get('status', '')
+    if status not in dict(Trade.STATUS_CHOICES):
+        status = ''
+
+    trades_qs = Trade.objects.select_related('offer1', 'offer2', 'user1', 'user2')
+    if status:
+        trades_qs = trades_qs.filter(status=status)
+
+    sent_cursor = request.GET.get('sent_cursor', '')
+    received_cursor = request.GET.get('received_cursor', '')
+    sent_trades = CursorPaginator(
+        trades_qs.filter(user1=request.user), TRADES_DASHBOARD_PAGE_SIZE
+    ).get_page(sent_cursor)
+    received_trades = CursorPaginator(
+        trades_qs.filter(user2=request.user), TRADES_DASHBOARD_PAGE_SIZE
+    ).get_page(received_cursor)
+
+    counts = trade_status_counts(request.user)
+    status_tabs = [('', 'Sve', counts['all'])] + [
+        (value, label, counts[value]) for value, label in Trade.STATUS_CHOICES
+    ]
 
     context = {
         'sent_trades': sent_trades,
         'received_trades': received_trades,
+        'sent_cursor': sent_cursor,
+        'received_cursor': received_cursor,
+        'status': status,
+        'status_tabs': status_tabs,
+        'total_trades': counts['all'],
         'show_messages': True,
     }
     return render(request, 'core/trades.html', context)
@@ -458,8 +507,8 @@ def create_trade(request, offer_id):
         else:
             full_message = base_message
 
-        # ✅ KREIRAJ TRADE BEZ IZBORA PONUDE
-        trade = Trade.objects.create(
+        # ✅ KREIRAJ TRADE BEZ IZBORA PONUDE (notifikaciju vlasniku šalje signal preko reda)
+        Trade.objects.create(
             offer1=None,
             offer2=offer2,
             user1=request.user,
@@ -467,16 +516,6 @@ def create_trade(request, offer_id):
             message=full_message,
         )
 
-        # ✅ NOVA NOTIFIKACIJA
-        notification_message = f'{request.user.username} je zainteresovan/a za vasu ponudu. Pogledajte oglase za potencijalnu razmenu, ili otkup.'
-
-        Notification.objects.create(
-            recipient=offer2.owner,
-            title=f'Nova ponuda od {request.user.username}',
-            message=notification_message,
-            notification_type='trade',
-        )
-
         messages.success(request, 'Zahtev za razmenu je poslat!')
         return redirect('core:my_trades')
 
@@ -523,20 +562,11 @@ def accept_trade_with_offer(request, pk, offer_id):
         return redirect('core:trade_detail', pk=pk)
 
     if request.method == 'POST':
-        # ✅ POSTAVI odabranu ponudu kao offer1
-        trade.offer1 = selected_offer
-        trade.status = 'accepted'
-        trade.save()
-
-        # Kreiraj notifikaciju
-        Notification.objects.create(
-            recipient=trade.user1,
-            actor=trade.user2,
-            title='Razmena prihvaćena!',
-            message=f'{trade.user2.username} je prihvatio vašu razmenu sa artiklom "{selected_offer.title}"!',
-            notification_type='trade_accepted',
-            trade=trade,
-        )
+        try:
+            trades.accept(trade.pk, request.user, offer=selected_offer)
+        except trades.TradeError as e:
+            messages.error(request, str(e))
+            return redirect('core:trade_detail', pk=pk)
 
         messages.success(request, 'Razmena je prihvaćena!')
         return redirect('core:my_trades')
@@ -563,20 +593,11 @@ def accept_trade_buy(request, pk):
         return redirect('core:trade_detail', pk=pk)
 
     if request.method == 'POST':
-        # ✅ POSTAVI offer1 na None (otkup bez zamjene)
-        trade.offer1 = None
-        trade.status = 'accepted'
-        trade.save()
-
-        # Kreiraj notifikaciju
-        Notification.objects.create(
-            recipient=trade.user1,
-            actor=trade.user2,
-            title='Otkup prihvaćen!',
-            message=f'{trade.user2.username} je prihvatio vašu ponudu za otkup od {trade.purchase_price} дин.!',
-            notification_type='trade_accepted',
-            trade=trade,
-        )
+        try:
+            trades.accept(trade.pk, request.user, buy=True)
+        except trades.TradeError as e:
+            messages.error(request, str(e))
+            return redirect('core:trade_detail', pk=pk)
 
         messages.success(request, 'Otkup je prihvaćen!')
         return redirect('core:my_trades')
@@ -599,16 +620,11 @@ def accept_trade(request, pk):
         return redirect('core:my_trades')
 
     if request.method == 'POST':
-        trade.status = 'accepted'
-        trade.save()
-
-        # ✅ KREIRAJ NOTIFIKACIJU ZA RAZMENU
-        Notification.objects.create(
-            recipient=trade.user1,
-            title='Razmena prihvaćena!',
-            message=f'{trade.user2.username} je prihvatio vašu razmenu!',
-            notification_type='trade',
-        )
+        try:
+            trades.accept(trade.pk, request.user)
+        except trades.TradeError as e:
+            messages.error(request, str(e))
+            return redirect('core:my_trades')
 
         messages.success(request, 'Razmena je prihvaćena!')
         return redirect('core:my_trades')
@@ -622,26 +638,30 @@ def accept_trade(request, pk):
 
 @login_required(login_url='core:login')
 def reject_trade(request, pk):
-    """Odbij razmenu"""
+    """
+    Odbij razmenu (primalac).
+
+    Pošiljalac ovde povlači sopstveni zahtev na čekanju (status cancelled, ne
+    rejected) - dugme "Obriši" u trades.html za poslate zahteve vodi ovde.
+    """
     trade = get_object_or_404(Trade, pk=pk)
 
-    if trade.user2 != request.user:
+    if request.user not in [trade.user1, trade.user2]:
         messages.error(request, 'Nemaš dozvolu za ovu akciju!')
         return redirect('core:my_trades')
 
     if request.method == 'POST':
-        trade.status = 'rejected'
-        trade.save()
-
-        # ✅ KREIRAJ NOTIFIKACIJU ZA RAZMENU
-        Notification.objects.create(
-            recipient=trade.user1,
-            title='Razmena odbijena',
-            message=f'{trade.user2.username} je odbio vašu razmenu.',
-            notification_type='trade',
-        )
-
-        messages.success(request, 'Razmena je odbijena!')
+        is_sender = trade.user1 == request.user
+        try:
+            if is_sender:
+                trades.cancel(trade.pk, request.user)
+            else:
+                trades.reject(trade.pk, request.user)
+        except trades.TradeError as e:
+            messages.error(request, str(e))
+            return redirect('core:my_trades')
+
+        messages.success(request, 'Zahtev je povučen!' if is_sender else 'Razmena je odbijena!')
         return redirect('core:my_trades')
 
     context = {
@@ -661,25 +681,11 @@ def complete_trade(request, pk):
         return redirect('core:my_trades')
 
     if request.method == 'POST':
-        trade.status = 'completed'
-        trade.save()
-
-        if trade.offer1:
-            trade.offer1.is_active = False
-            trade.offer1.save()
-
-        trade.offer2.is_active = False
-        trade.offer2.save()
-
-        other_user = trade.user1 if request.user == trade.user2 else trade.user2
-
-        # ✅ KREIRAJ NOTIFIKACIJU ZA RAZMENU
-        Notification.objects.create(
-            recipient=other_user,
-            title='Razmena završena!',
-            message=f'{request.user.username} je završio razmenu.',
-            notification_type='trade',
-        )
+        try:
+            trades.complete(trade.pk, request.user)
+        except trades.TradeError as e:
+            messages.error(request, str(e))
+            return redirect('core:my_trades')
 
         messages.success(request, 'Razmena je završena! Sada možeš da napišeš recenziju.')
         return redirect('core:my_trades')
@@ -757,28 +763,46 @@ def notifications_view(request):
     notifications = Notification.objects.filter(recipient=request.user).order_by('-created_at')
 
     if request.GET.get('mark_all_read'):
-        notifications.filter(is_read=False).update(is_read=True)
+        read_count = notifications.filter(is_read=False).update(is_read=True)
+        counters.adjust(request.user.pk, notifications=-read_count)
         messages.success(request, 'Sve notifikacije su označene kao pročitane!')
         return redirect('core:notifications')
 
-    paginator = Paginator(notifications, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(notifications, 20)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     context = {
         'page_obj': page_obj,
         'notifications': page_obj.object_list,
+        'digest_enabled': request.user.userprofile.notification_digest,
         'show_messages': True,
     }
     return render(request, 'core/notifications.html', context)
 
 
+@login_required(login_url='core:login')
+@require_http_methods(["POST"])
+def toggle_notification_digest(request):
+    """Uključi ili isključi e-mail pregled nepročitanih notifikacija"""
+    profile = request.user.userprofile
+    profile.notification_digest = not profile.notification_digest
+    profile.save(update_fields=['notification_digest'])
+
+    if profile.notification_digest:
+        messages.success(request, 'E-mail pregled nepročitanih notifikacija je uključen!')
+    else:
+        messages.success(request, 'E-mail pregled nepročitanih notifikacija je isključen!')
+    return redirect('core:notifications')
+
+
 @login_required(login_url='core:login')
 def mark_notification_read(request, pk):
     """Označi notifikaciju kao pročitanu"""
     notification = get_object_or_404(Notification, pk=pk, recipient=request.user)
-    notification.is_read = True
-    notification.save()
+    if not notification.is_read:
+        notification.is_read = True
+        notification.save(update_fields=['is_read', 'updated_at'])
+        counters.adjust(request.user.pk, notifications=-1)
 
     messages.success(request, 'Notifikacija je pročitana!')
     return redirect('core:notifications')
@@ -846,30 +870,138 @@ def register(request):
     return render(request, 'core/register.html', {'form': form})
 
 
+# ==================== FRAGMENTS ====================
+
+@query_budget(4)
+@require_http_methods(["GET"])
+def page_fragments(request):
+    """Delovi keširane stranice za prijavljenog korisnika (navbar, dugmad ponude)"""
+    response = JsonResponse({
+        'authenticated': request.user.is_authenticated,
+        'fragments': fragments.render(request, request.GET.getlist('f')) if request.user.is_authenticated else {},
+    })
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 # ==================== API ENDPOINTS ====================
 
+def unread_count_etag(request):
+    return f'unread-{request.user.pk}-{counters.version(request.user.pk)}'
+
+
+@query_budget(3)
 @login_required(login_url='core:login')
 @require_http_methods(["GET"])
+@cache_control(private=True, no_cache=True)
+@vary_on_cookie
+@condition(etag_func=unread_count_etag)
 def get_unread_count(request):
     """API endpoint - broj nepročitanih poruka i notifikacija"""
-    unread_messages = Message.objects.filter(
-        recipient=request.user,
-        is_read=False
-    ).count()
-
-    unread_notifications = Notification.objects.filter(
-        recipient=request.user,
-        is_read=False
-    ).count()
+    unread = counters.get_unread_counts(request.user.pk)
 
     return JsonResponse({
-        'unread_count': unread_notifications,
-        'unread_messages': unread_messages,
+        'unread_count': unread['notifications'],
+        'unread_messages': unread['messages'],
         'success': True,
     })
 
 
+SSE_KEEPALIVE_SECONDS = 25
+
+
+@require_http_methods(["GET"])
+async def unread_stream(request):
+    """
+    SSE stream - snapshot pa delte broja nepročitanih (zamena za polling).
+
+    Delte stižu samo iz istog procesa (core.events); promene iz drugih
+    procesa (run_workers, drugi web worker) stream vidi po promeni
+    counters.version i tada šalje novi snapshot.
+
+    Pod WSGI-jem (runserver) Django beskonačan async stream skuplja u listu i
+    odgovor se nikad ne vrati, pa view vraća 204 - EventSource se tada ne
+    povezuje ponovo, a base.html prelazi na polling.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+
+    seen = await sync_to_async(counters.version)(user.pk)
+    snapshot = await sync_to_async(counters.get_unread_counts)(user.pk)
+
+    async def events():
+        nonlocal seen
+        loop = asyncio.get_running_loop()
+        broker = get_broker()
+        subscription = broker.subscribe(user.pk)
+        checked = sent = loop.time()
+        try:
+            yield 'retry: 5000\n'
+            yield f'event: snapshot\ndata: {json.dumps(snapshot)}\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=settings.EVENTS_SYNC_INTERVAL)
+                except asyncio.TimeoutError:
+                    event = None
+                if event is not None:
+                    yield f'data: {json.dumps(event)}\n\n'
+                    sent = loop.time()
+
+                if loop.time() - checked >= settings.EVENTS_SYNC_INTERVAL:
+                    checked = loop.time()
+                    current = await sync_to_async(counters.version)(user.pk)
+                    if current != seen:
+                        # Snapshot sadrži i delte koje još čekaju u redu
+                        seen = current
+                        subscription.clear()
+                        counts = await sync_to_async(counters.get_unread_counts)(user.pk)
+                        yield f'event: snapshot\ndata: {json.dumps(counts)}\n\n'
+                        sent = loop.time()
+
+                if loop.time() - sent >= SSE_KEEPALIVE_SECONDS:
+                    yield ': keepalive\n\n'
+                    sent = loop.time()
+        finally:
+            broker.unsubscribe(user.pk, subscription)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _offer_stamp(request, pk):
+    """Polja od kojih zavise API odgovori ponude (jedan upit), zapamćena na request-u za ETag"""
+    if not hasattr(request, '_offer_stamp'):
+        request._offer_stamp = (
+            Offer.objects
+            .filter(pk=pk)
+            .values('updated_at', 'views_count', 'image', 'image_variants', 'category_id',
+                    'owner__userprofile__stats_version')
+            .first()
+        )
+    if request._offer_stamp is None:
+        raise Http404('Ponuda ne postoji')
+    return hashlib.md5(repr(sorted(request._offer_stamp.items())).encode()).hexdigest()[:12]
+
+
+def offer_stats_etag(request, pk):
+    # Razmene ponude menjaju stats_version vlasnika (invalidate_trade_user_stats)
+    return f'offer-stats-{pk}-{_offer_stamp(request, pk)}'
+
+
+def offer_detail_etag(request, pk):
+    return f'offer-detail-{pk}-{catalog.version()}-{_offer_stamp(request, pk)}'
+
+
+@query_budget(4)
 @require_http_methods(["GET"])
+@cache_control(no_cache=True)
+@condition(etag_func=offer_stats_etag)
 def get_offer_stats(request, pk):
     """API endpoint - statistika ponude"""
     offer = get_object_or_404(Offer, pk=pk)
@@ -887,37 +1019,68 @@ def get_offer_stats(request, pk):
     return JsonResponse(stats)
 
 
+def _profile_user(request, username):
+    """Korisnik sa profilom (jedan upit), zapamćen na request-u za ETag i view"""
+    if not hasattr(request, '_profile_user'):
+        request._profile_user = (
+            User.objects
+            .select_related('userprofile')
+            .filter(username=username, userprofile__isnull=False)
+            .first()
+        )
+    if request._profile_user is None:
+        raise Http404('Korisnik ne postoji')
+    return request._profile_user
+
+
+def user_stats_etag(request, username):
+    user = _profile_user(request, username)
+    return f'user-stats-{user.pk}-{user.userprofile.stats_version}'
+
+
+def user_detail_etag(request, username):
+    user = _profile_user(request, username)
+    profile = user.userprofile
+    is_self = request.user == user
+    visible = (
+        user.first_name, user.last_name, profile.bio, profile.location,
+        profile.avatar.name, profile.avatar_variants.get('source'),
+        user.email if is_self else None, profile.phone if is_self else None,
+    )
+    digest = hashlib.md5(repr(visible).encode()).hexdigest()[:12]
+    return f'user-detail-{user.pk}-{profile.stats_version}-{digest}'
+
+
+@query_budget(4)
 @require_http_methods(["GET"])
+@condition(etag_func=user_stats_etag)
 def get_user_stats(request, username):
     """API endpoint - statistika korisnika"""
-    user = get_object_or_404(User, username=username)
-
-    reviews = Review.objects.filter(reviewed_user=user)
-    avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+    user = _profile_user(request, username)
+    stats = cached_user_stats(user.pk, user.userprofile.stats_version)
 
-    stats = {
+    return JsonResponse({
         'username': user.username,
-        'total_offers': Offer.objects.filter(owner=user).count(),
-        'active_offers': Offer.objects.filter(owner=user, is_active=True).count(),
-        'completed_trades': Trade.objects.filter(
-            Q(user1=user) | Q(user2=user),
-            status='completed'
-        ).count(),
-        'reviews_count': reviews.count(),
-        'average_rating': round(avg_rating, 1),
+        **stats,
         'joined_date': user.date_joined.strftime('%Y-%m-%d'),
         'success': True,
-    }
+    })
 
-    return JsonResponse(stats)
 
+def categories_etag(request):
+    return f'categories-{catalog.version()}'
 
+
+@query_budget(3)
 @require_http_methods(["GET"])
+@cache_control(no_cache=True)
+@condition(etag_func=categories_etag)
 def get_categories(request):
     """API endpoint - sve kategorije"""
-    categories = Category.objects.all().values('id', 'name', 'description')
-
-    categories_list = list(categories)
+    categories_list = [
+        {'id': category.pk, 'name': category.name, 'description': category.description}
+        for category in catalog.categories()
+    ]
 
     return JsonResponse({
         'categories': categories_list,
@@ -926,23 +1089,16 @@ def get_categories(request):
     })
 
 
+@query_budget(4)
 @require_http_methods(["GET"])
 def search_offers(request):
     """API endpoint - pretraga ponuda"""
     query = request.GET.get('q', '').strip()
     category_id = request.GET.get('category', '')
     city = request.GET.get('city', '').strip()
-    page = request.GET.get('page', 1)
-
-    offers = Offer.objects.filter(is_active=True)
+    cursor = request.GET.get('cursor')
 
-    if query:
-        offers = offers.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query) |
-            Q(offered__icontains=query) |
-            Q(wanted__icontains=query)
-        )
+    offers = Offer.objects.filter(is_active=True).select_related('owner')
 
     if category_id:
         offers = offers.filter(category_id=category_id)
@@ -950,8 +1106,12 @@ def search_offers(request):
     if city:
         offers = offers.filter(city__icontains=city)
 
-    paginator = Paginator(offers.order_by('-created_at'), 12)
-    page_obj = paginator.get_page(page)
+    if query:
+        offers = search.search_offers(offers, query)
+
+    ordering = ('-search_rank', '-id') if query else ('-created_at', '-id')
+    paginator = CursorPaginator(offers, 12, ordering=ordering)
+    page_obj = paginator.get_page(cursor)
 
     offers_data = [
         {
@@ -968,19 +1128,21 @@ def search_offers(request):
 
     return JsonResponse({
         'offers': offers_data,
-        'total_count': offers.count(),
-        'page': page_obj.number,
-        'total_pages': paginator.num_pages,
+        'next_cursor': page_obj.next_cursor,
+        'previous_cursor': page_obj.previous_cursor,
+        'has_next': page_obj.has_next,
+        'has_previous': page_obj.has_previous,
         'success': True,
     })
 
 
+@query_budget(7)
 @login_required(login_url='core:login')
 @require_http_methods(["GET"])
 def get_messages_list(request):
     """API endpoint - lista poruka kao JSON"""
     username = request.GET.get('username')
-    page = request.GET.get('page', 1)
+    cursor = request.GET.get('cursor')
 
     if not username:
         return JsonResponse({
@@ -993,16 +1155,18 @@ def get_messages_list(request):
     messages_list = Message.objects.filter(
         Q(sender=request.user, recipient=other_user) |
         Q(sender=other_user, recipient=request.user)
-    ).order_by('-timestamp')
+    ).select_related('sender')
 
-    Message.objects.filter(
+    read_count = Message.objects.filter(
         sender=other_user,
         recipient=request.user,
         is_read=False
     ).update(is_read=True)
+    Conversation.mark_read(request.user, other_user)
+    counters.adjust(request.user.pk, messages=-read_count)
 
-    paginator = Paginator(messages_list, 20)
-    page_obj = paginator.get_page(page)
+    paginator = CursorPaginator(messages_list, 20, ordering=('-timestamp', '-id'))
+    page_obj = paginator.get_page(cursor)
 
     messages_data = [
         {
@@ -1022,67 +1186,116 @@ def get_messages_list(request):
             'username': other_user.username,
             'id': other_user.id,
         },
-        'page': page_obj.number,
-        'total_pages': paginator.num_pages,
+        'next_cursor': page_obj.next_cursor,
+        'previous_cursor': page_obj.previous_cursor,
+        'has_next': page_obj.has_next,
+        'has_previous': page_obj.has_previous,
         'success': True,
     })
 
 
+TRADES_PAGE_SIZE = 50
+TRADES_STREAM_CHUNK = 500
+
+# Samo kolone koje API vraća; offer1 je LEFT JOIN jer je opcioni
+TRADE_LIST_FIELDS = (
+    'id', 'status', 'created_at', 'message',
+    'offer1_id', 'offer1__title', 'offer1__owner__username',
+    'offer2_id', 'offer2__title', 'offer2__owner__username',
+)
+
+
+def _trade_json(row):
+    return {
+        'id': row['id'],
+        'offer1': {
+            'id': row['offer1_id'],
+            'title': row['offer1__title'],
+            'owner': row['offer1__owner__username'],
+        } if row['offer1_id'] else None,
+        'offer2': {
+            'id': row['offer2_id'],
+            'title': row['offer2__title'],
+            'owner': row['offer2__owner__username'],
+        },
+        'status': row['status'],
+        'created_at': row['created_at'].strftime('%Y-%m-%d %H:%M:%S'),
+        'message': row['message'],
+    }
+
+
+def _trades_ndjson(rows):
+    """Jedna razmena po liniji; redovi se čitaju iterator-om u blokovima od TRADES_STREAM_CHUNK"""
+    iterator = rows.iterator(chunk_size=TRADES_STREAM_CHUNK)
+    while chunk := list(islice(iterator, TRADES_STREAM_CHUNK)):
+        yield ''.join(json.dumps(_trade_json(row), ensure_ascii=False) + '\n' for row in chunk)
+
+
+async def _trades_ndjson_async(rows):
+    """
+    Isti stream za ASGI. Django ne strimuje sinhroni iterator pod ASGI-jem (ni
+    asinhroni pod WSGI-jem) nego ceo odgovor prvo skupi u listu, pa view bira
+    varijantu prema serveru; blokovi se čitaju u thread-u baze (sync_to_async).
+    """
+    chunks = _trades_ndjson(rows)
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+@query_budget(3)
 @login_required(login_url='core:login')
 @require_http_methods(["GET"])
 def get_trades_list(request):
-    """API endpoint - lista razmena kao JSON"""
+    """API endpoint - lista razmena kao JSON (kursor) ili NDJSON stream (?format=ndjson)"""
     status_filter = request.GET.get('status')
     direction = request.GET.get('direction')
 
     if direction == 'sent':
-        trades = Trade.objects.filter(user1=request.user)
+        trades_qs = Trade.objects.filter(user1=request.user)
     elif direction == 'received':
-        trades = Trade.objects.filter(user2=request.user)
+        trades_qs = Trade.objects.filter(user2=request.user)
     else:
-        trades = Trade.objects.filter(
+        trades_qs = Trade.objects.filter(
             Q(user1=request.user) | Q(user2=request.user)
         )
 
     if status_filter:
-        trades = trades.filter(status=status_filter)
+        trades_qs = trades_qs.filter(status=status_filter)
 
-    trades = trades.order_by('-created_at')
+    rows = trades_qs.values(*TRADE_LIST_FIELDS)
 
-    trades_data = [
-        {
-            'id': trade.id,
-            'offer1': {
-                'id': trade.offer1.id,
-                'title': trade.offer1.title,
-                'owner': trade.offer1.owner.username,
-            } if trade.offer1 else None,
-            'offer2': {
-                'id': trade.offer2.id,
-                'title': trade.offer2.title,
-                'owner': trade.offer2.owner.username,
-            },
-            'status': trade.status,
-            'created_at': trade.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'message': trade.message,
-        }
-        for trade in trades
-    ]
+    if request.GET.get('format') == 'ndjson':
+        response = StreamingHttpResponse(
+            (_trades_ndjson_async if isinstance(request, ASGIRequest) else _trades_ndjson)(
+                rows.order_by('-created_at', '-id')
+            ),
+            content_type='application/x-ndjson; charset=utf-8',
+        )
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    paginator = CursorPaginator(rows, TRADES_PAGE_SIZE)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     return JsonResponse({
-        'trades': trades_data,
-        'total_count': trades.count(),
+        'trades': [_trade_json(row) for row in page_obj.object_list],
+        'next_cursor': page_obj.next_cursor,
+        'previous_cursor': page_obj.previous_cursor,
+        'has_next': page_obj.has_next,
+        'has_previous': page_obj.has_previous,
         'success': True,
     })
 
 
+@query_budget(3)
 @require_http_methods(["GET"])
+@cache_control(no_cache=True)
+@condition(etag_func=offer_detail_etag)
 def get_offer_detail_api(request, pk):
     """API endpoint - detalj ponude kao JSON"""
-    offer = get_object_or_404(Offer, pk=pk)
-
-    owner_reviews = Review.objects.filter(reviewed_user=offer.owner)
-    avg_rating = owner_reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+    offer = get_object_or_404(Offer.objects.select_related('owner__userprofile', 'category'), pk=pk)
+    owner_profile = offer.owner.userprofile
 
     offer_data = {
         'id': offer.id,
@@ -1097,10 +1310,11 @@ def get_offer_detail_api(request, pk):
         'owner': {
             'username': offer.owner.username,
             'id': offer.owner.id,
-            'rating': round(avg_rating, 1),
-            'reviews_count': owner_reviews.count(),
+            'rating': owner_profile.average_rating,
+            'reviews_count': owner_profile.total_reviews,
         },
         'image_url': offer.image.url if offer.image else None,
+        'image_variants': offer.image_urls,
         'price_range': offer.price_range,
         'location': offer.location,
         'city': offer.city,
@@ -1116,14 +1330,15 @@ def get_offer_detail_api(request, pk):
     })
 
 
+@query_budget(5)
 @require_http_methods(["GET"])
+@vary_on_cookie
+@condition(etag_func=user_detail_etag)
 def get_user_detail_api(request, username):
     """API endpoint - detalj korisnika kao JSON"""
-    user = get_object_or_404(User, username=username)
-    profile = get_object_or_404(UserProfile, user=user)
-
-    reviews = Review.objects.filter(reviewed_user=user)
-    avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+    user = _profile_user(request, username)
+    profile = user.userprofile
+    stats = cached_user_stats(user.pk, profile.stats_version)
 
     user_data = {
         'id': user.id,
@@ -1136,16 +1351,12 @@ def get_user_detail_api(request, username):
             'bio': profile.bio,
             'location': profile.location,
             'phone': profile.phone if request.user == user else None,
+            'avatar_url': profile.avatar.url if profile.avatar else None,
+            'avatar_variants': profile.avatar_urls,
         },
         'stats': {
-            'total_offers': Offer.objects.filter(owner=user).count(),
-            'active_offers': Offer.objects.filter(owner=user, is_active=True).count(),
-            'completed_trades': Trade.objects.filter(
-                Q(user1=user) | Q(user2=user),
-                status='completed'
-            ).count(),
-            'reviews_count': reviews.count(),
-            'average_rating': round(avg_rating, 1),
+            **stats,
+            'rating_histogram': dict(profile.rating_histogram),
         }
     }
 
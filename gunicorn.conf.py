@@ -0,0 +1,71 @@
+"""Gunicorn hook-ovi (gunicorn automatski čita ovaj fajl iz radnog direktorijuma)"""
+import os
+import subprocess
+import sys
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def on_starting(server):
+    """Počni metrike od nule pri svakom pokretanju (barter/metrics.py)"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'barter.settings')
+    from barter.metrics import clear_directory
+    clear_directory()
+
+
+def worker_exit(server, worker):
+    """Upiši baferovane preglede ponuda i metrike pre gašenja worker-a"""
+    from core.view_counter import view_counter
+    from barter.metrics import registry
+    view_counter.flush()
+    registry.dump()
+
+
+class EmbeddedWorker:
+    """manage.py run_workers kao podproces master-a; ponovo se pokreće ako padne"""
+
+    RESTART_DELAY = 5
+
+    def __init__(self, log):
+        self.log = log
+        self.process = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.supervise, name='jobs-worker', daemon=True).start()
+
+    def supervise(self):
+        while not self.stopping.is_set():
+            self.process = subprocess.Popen([sys.executable, 'manage.py', 'run_workers'], cwd=BASE_DIR)
+            self.log.info('Pokrenut run_workers (pid %s)', self.process.pid)
+            code = self.process.wait()
+            if not self.stopping.is_set():
+                self.log.error('run_workers je izašao sa kodom %s, ponovo za %ss', code, self.RESTART_DELAY)
+                self.stopping.wait(self.RESTART_DELAY)
+
+    def stop(self):
+        self.stopping.set()
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+embedded_worker = None
+
+
+def when_ready(server):
+    """Red poslova (core.jobs) se isporučuje uz web proces, bez posebnog servisa"""
+    global embedded_worker
+    from django.conf import settings
+    if settings.JOBS_EMBEDDED_WORKER and not settings.JOBS_EAGER:
+        embedded_worker = EmbeddedWorker(server.log)
+        embedded_worker.start()
+
+
+def on_exit(server):
+    if embedded_worker is not None:
+        embedded_worker.stop()